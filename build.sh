@@ -4,6 +4,7 @@ set -o errexit
 pip install -r requirements.txt
 python manage.py collectstatic --noinput
 python manage.py migrate
+python manage.py createcachetable
 
 # Seed data (non-fatal — don't block deploy if seeding fails)
 python manage.py seed_music_theory || echo "Warning: seed_music_theory failed, continuing..."
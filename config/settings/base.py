@@ -16,6 +16,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     # Third-party
     'allauth',
     'allauth.account',
@@ -90,6 +91,31 @@ STORAGES = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache (shared across workers; REDIS_URL needs the optional `redis` package)
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    # Once the table passes MAX_ENTRIES, each write deletes 1/CULL_FREQUENCY of
+    # all keys. Everything kept here must survive being culled (it is a cache,
+    # rebuilt on miss), so size it well above the live key count: Spotify
+    # searches, image/upload lookups, achievement versions, singleflight claims.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '100000')),
+                'CULL_FREQUENCY': 10,
+            },
+        }
+    }
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Auth
@@ -109,10 +135,52 @@ LOGOUT_REDIRECT_URL = '/'
 
 # Gemini API
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+# LLM backend for chat and practice advice; dashboard.llm.FakeBackend needs no
+# network and answers after LLM_FAKE_LATENCY seconds (offline load tests).
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'dashboard.llm.GeminiBackend')
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '30'))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+LLM_FAKE_LATENCY = float(os.environ.get('LLM_FAKE_LATENCY', '0'))
 
 # Spotify API
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', '')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', '')
+# Seconds a search result is shared between workers (0 disables the cache).
+SPOTIFY_CACHE_TTL = int(os.environ.get('SPOTIFY_CACHE_TTL', '3600'))
+
+# Upstream endpoints (overridable to point at `manage.py stub_upstream`)
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
+SPOTIFY_TOKEN_URL = os.environ.get('SPOTIFY_TOKEN_URL', 'https://accounts.spotify.com/api/token')
+SPOTIFY_API_BASE = os.environ.get('SPOTIFY_API_BASE', 'https://api.spotify.com/v1')
+
+# Image proxy: remote artwork hosts mirrored as resized WebP under MEDIA_ROOT
+IMAGE_PROXY_HOSTS = os.environ.get(
+    'IMAGE_PROXY_HOSTS', 'i.scdn.co,mosaic.scdn.co,image-cdn-ak.spotifycdn.com,image-cdn-fa.spotifycdn.com',
+).split(',')
+
+# ASGI mode: config.asgi turns on the async LLM/Spotify views
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '') == '1'
+# Max in-flight outbound requests per upstream, per worker process
+UPSTREAM_CONCURRENCY = {
+    'llm': int(os.environ.get('LLM_CONCURRENCY', '64')),
+    'spotify': int(os.environ.get('SPOTIFY_CONCURRENCY', '32')),
+}
+UPSTREAM_TIMEOUT = 60
+
+# Chat history sent to Gemini, in characters (~tokens for Japanese text)
+CHAT_HISTORY_CHAR_BUDGET = int(os.environ.get('CHAT_HISTORY_CHAR_BUDGET', '4000'))
+
+# Rate limits: scope -> {'user' | 'global': (max requests, window seconds)}
+RATE_LIMITS = {
+    'chat': {
+        'user': (10, 60),
+        'global': (int(os.environ.get('CHAT_DAILY_LIMIT', '1400')), 60 * 60 * 24),
+    },
+    'advice': {
+        'user': (5, 60 * 60),
+        'global': (int(os.environ.get('ADVICE_DAILY_LIMIT', '500')), 60 * 60 * 24),
+    },
+}
 
 # VAPID (Web Push)
 VAPID_PUBLIC_KEY = os.environ.get('VAPID_PUBLIC_KEY', '')
@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Models feeding the rollup, and the field that decides which day a row counts for.
+ROLLUP_SOURCES = {
+    'guitarlog.PracticeSession': 'started_at',
+    'livelog.LiveEvent': 'date',
+    'songdiary.Project': 'updated_at',
+}
+
+REBUILD_CHUNK_SIZE = 500
+
+
+def activity_day(value):
+    """Return the local date a datetime/date field value belongs to."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            return timezone.localdate(value)
+        return value.date()
+    return value
+
+
+def _empty_counts():
+    return {
+        'practice_minutes': 0,
+        'session_count': 0,
+        'live_count': 0,
+        'compose_updates': 0,
+    }
+
+
+def _day_counts(user_id, day):
+    """Aggregate one user's raw activity for a single local day."""
+    from guitarlog.models import PracticeSession
+    from livelog.models import LiveEvent
+    from songdiary.models import Project
+
+    practice = PracticeSession.objects.filter(
+        user_id=user_id, started_at__date=day,
+    ).aggregate(minutes=Sum('duration_minutes'), count=Count('id'))
+
+    return {
+        'practice_minutes': practice['minutes'] or 0,
+        'session_count': practice['count'] or 0,
+        'live_count': LiveEvent.objects.filter(user_id=user_id, date=day).count(),
+        'compose_updates': Project.objects.filter(user_id=user_id, updated_at__date=day).count(),
+    }
+
+
+def refresh_daily_activity(user_id, day):
+    """Recompute a single (user, day) rollup row from the raw tables.
+
+    Only the rows for that day are read, so the cost does not grow with
+    the user's history. Days with no activity left are removed.
+    """
+    from .models import UserDailyActivity
+
+    with transaction.atomic():
+        rows = UserDailyActivity.objects.select_for_update().filter(user_id=user_id, date=day)
+        existing = rows.first()
+        counts = _day_counts(user_id, day)
+
+        if not any(counts.values()):
+            if existing:
+                existing.delete()
+            return None
+
+        if existing:
+            for field, value in counts.items():
+                setattr(existing, field, value)
+            existing.save(update_fields=list(counts))
+            return existing
+
+        row, _ = UserDailyActivity.objects.update_or_create(
+            user_id=user_id, date=day, defaults=counts,
+        )
+        return row
+
+
+def schedule_refresh(user_id, *days):
+    """Refresh the given days once the current transaction commits."""
+    for day in {d for d in days if d is not None}:
+        transaction.on_commit(
+            lambda d=day: refresh_daily_activity(user_id, d)
+        )
+
+
+def get_daily_activity(user, start, end=None):
+    """Return {date: UserDailyActivity} for start..end (inclusive)."""
+    from .models import UserDailyActivity
+
+    rows = UserDailyActivity.objects.filter(user=user, date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+    return {row.date: row for row in rows}
+
+
+def summarize_daily_activity(user, start=None, end=None):
+    """Sum rollup counters for start..end (inclusive, open-ended if None) in one query."""
+    from .models import UserDailyActivity
+
+    rows = UserDailyActivity.objects.filter(user=user)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+    totals = rows.aggregate(
+        practice_minutes=Sum('practice_minutes'),
+        session_count=Sum('session_count'),
+        live_count=Sum('live_count'),
+        compose_updates=Sum('compose_updates'),
+    )
+    return {k: v or 0 for k, v in totals.items()}
+
+
+def _collect_counts(user_ids):
+    """Run one GROUP BY per source table for a chunk of users."""
+    from guitarlog.models import PracticeSession
+    from livelog.models import LiveEvent
+    from songdiary.models import Project
+
+    counts = defaultdict(_empty_counts)
+
+    practice = (
+        PracticeSession.objects.filter(user_id__in=user_ids)
+        .annotate(d=TruncDate('started_at'))
+        .values('user_id', 'd')
+        .annotate(minutes=Sum('duration_minutes'), cnt=Count('id'))
+        .order_by()
+    )
+    for row in practice:
+        key = (row['user_id'], row['d'])
+        counts[key]['practice_minutes'] = row['minutes'] or 0
+        counts[key]['session_count'] = row['cnt']
+
+    live = (
+        LiveEvent.objects.filter(user_id__in=user_ids)
+        .values('user_id', 'date')
+        .annotate(cnt=Count('id'))
+        .order_by()
+    )
+    for row in live:
+        counts[(row['user_id'], row['date'])]['live_count'] = row['cnt']
+
+    compose = (
+        Project.objects.filter(user_id__in=user_ids)
+        .annotate(d=TruncDate('updated_at'))
+        .values('user_id', 'd')
+        .annotate(cnt=Count('id'))
+        .order_by()
+    )
+    for row in compose:
+        counts[(row['user_id'], row['d'])]['compose_updates'] = row['cnt']
+
+    return counts
+
+
+def rebuild_daily_activity(user_ids=None, chunk_size=REBUILD_CHUNK_SIZE):
+    """Rebuild rollup rows from scratch. Returns the number of rows written."""
+    from django.contrib.auth import get_user_model
+    from .models import UserDailyActivity
+
+    User = get_user_model()
+    if user_ids is None:
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+    written = 0
+    chunk = []
+
+    def flush(ids):
+        counts = _collect_counts(ids)
+        with transaction.atomic():
+            UserDailyActivity.objects.filter(user_id__in=ids).delete()
+            UserDailyActivity.objects.bulk_create(
+                [
+                    UserDailyActivity(user_id=user_id, date=day, **values)
+                    for (user_id, day), values in counts.items()
+                ],
+                batch_size=1000,
+            )
+        return len(counts)
+
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) >= chunk_size:
+            written += flush(chunk)
+            chunk = []
+    if chunk:
+        written += flush(chunk)
+
+    return written
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     AchievementDefinition, UserAchievement,
-    PracticeAdviceCache, PushSubscription, NotificationPreference,
+    PracticeAdviceCache, PushSubscription, PushOutbox, NotificationPreference, ReminderSchedule,
+    UserDailyActivity, ActivityEvent, SearchDocument, BackgroundJob,
 )
 
 
@@ -21,7 +22,7 @@ class UserAchievementAdmin(admin.ModelAdmin):
 
 @admin.register(PracticeAdviceCache)
 class PracticeAdviceCacheAdmin(admin.ModelAdmin):
-    list_display = ['user', 'generated_at', 'period_start', 'period_end']
+    list_display = ['user', 'generated_at', 'checked_at', 'period_start', 'period_end']
     raw_id_fields = ['user']
 
 
@@ -31,7 +32,49 @@ class PushSubscriptionAdmin(admin.ModelAdmin):
     raw_id_fields = ['user']
 
 
+@admin.register(PushOutbox)
+class PushOutboxAdmin(admin.ModelAdmin):
+    list_display = ['title', 'subscription', 'status', 'attempts', 'run_after', 'sent_at']
+    list_filter = ['status']
+    raw_id_fields = ['subscription']
+
+
 @admin.register(NotificationPreference)
 class NotificationPreferenceAdmin(admin.ModelAdmin):
     list_display = ['user', 'practice_reminder', 'live_reminder', 'achievement_notify']
     raw_id_fields = ['user']
+
+
+@admin.register(ReminderSchedule)
+class ReminderScheduleAdmin(admin.ModelAdmin):
+    list_display = ['user', 'kind', 'object_id', 'fire_at']
+    list_filter = ['kind']
+    raw_id_fields = ['user']
+
+
+@admin.register(UserDailyActivity)
+class UserDailyActivityAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'practice_minutes', 'session_count', 'live_count', 'compose_updates']
+    raw_id_fields = ['user']
+
+
+@admin.register(ActivityEvent)
+class ActivityEventAdmin(admin.ModelAdmin):
+    list_display = ['user', 'kind', 'verb', 'text', 'occurred_at']
+    list_filter = ['kind', 'verb']
+    raw_id_fields = ['user']
+
+
+@admin.register(SearchDocument)
+class SearchDocumentAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'title', 'user', 'updated_at']
+    list_filter = ['kind']
+    search_fields = ['title']
+    raw_id_fields = ['user']
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'key', 'status', 'attempts', 'run_after', 'finished_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['key']
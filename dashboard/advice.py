@@ -1,11 +1,13 @@
+import hashlib
+import json
 import logging
 from datetime import timedelta
 
-from django.conf import settings
-from django.db.models import Sum, Count
-from django.db.models.functions import TruncDate
+from django.core.cache import cache
 from django.utils import timezone
 
+from . import counters
+
 logger = logging.getLogger(__name__)
 
 ADVICE_SYSTEM_PROMPT = """あなたは「残音」アプリの練習コーチです。ユーザーの直近の練習データを分析し、パーソナライズされたアドバイスを提供してください。
@@ -26,26 +28,20 @@ ADVICE_SYSTEM_PROMPT = """あなたは「残音」アプリの練習コーチで
 def gather_practice_context(user, days=7):
     """Gather practice data for the last N days."""
     from guitarlog.models import PracticeSession, PracticeSong
-    from livelog.models import LiveEvent
-    from songdiary.models import Project
+    from .activity import get_daily_activity
 
-    today = timezone.now().date()
+    today = timezone.localdate()
     start = today - timedelta(days=days - 1)
 
-    sessions = PracticeSession.objects.filter(
-        user=user, started_at__date__gte=start
-    )
-
-    total_minutes = sessions.aggregate(t=Sum('duration_minutes'))['t'] or 0
-    session_count = sessions.count()
-
-    # Daily breakdown
-    daily = list(
-        sessions.annotate(d=TruncDate('started_at'))
-        .values('d')
-        .annotate(total=Sum('duration_minutes'))
-        .order_by('d')
-    )
+    # Totals and daily breakdown come from the per-day rollup
+    daily_map = get_daily_activity(user, start, today)
+    total_minutes = sum(row.practice_minutes for row in daily_map.values())
+    session_count = sum(row.session_count for row in daily_map.values())
+    daily = [
+        {'d': d, 'total': daily_map[d].practice_minutes}
+        for d in sorted(daily_map)
+        if daily_map[d].session_count
+    ]
 
     # Streak
     streak = PracticeSession.get_streak(user)
@@ -56,15 +52,9 @@ def gather_practice_context(user, days=7):
         .values('title', 'artist', 'target_bpm')[:5]
     )
 
-    # Recent live events
-    live_count = LiveEvent.objects.filter(
-        user=user, date__gte=start
-    ).count()
-
-    # Composition activity
-    compose_count = Project.objects.filter(
-        user=user, updated_at__date__gte=start
-    ).count()
+    # Recent live events / composition activity
+    live_count = sum(row.live_count for row in daily_map.values())
+    compose_count = sum(row.compose_updates for row in daily_map.values())
 
     return {
         'total_minutes': total_minutes,
@@ -106,52 +96,159 @@ def format_advice_prompt(ctx):
     return '\n'.join(parts)
 
 
-def generate_practice_advice(user):
-    """Generate or return cached practice advice."""
-    from .models import PracticeAdviceCache
+FALLBACK_TEXT = '練習を続けて、データが貯まるとアドバイスが表示されます。'
+PENDING_TEXT = 'アドバイスを作成中です。少々お待ちください…'
+ADVICE_MODEL = 'gemini-2.5-flash-lite'
+# A failed generation is not retried for this long (seconds).
+RETRY_AFTER_FAILURE = 60 * 10
+# Refresh outcomes, counted in the shared cache (see `manage.py advice_stats`).
+STATS_KEY = 'advice:stats:{}'
+STATS_OUTCOMES = ('generated', 'unchanged', 'failed')
 
-    # Check cache
-    latest = PracticeAdviceCache.objects.filter(user=user).first()
-    if latest and not latest.is_stale():
-        return latest.advice_text
 
-    # Gather context
-    ctx = gather_practice_context(user, days=7)
+def _job_key(user_id):
+    return f'advice:{user_id}'
 
-    # Call Gemini
-    try:
-        import google.generativeai as genai
-    except ImportError:
-        return 'アドバイス機能は現在利用できません。'
 
-    api_key = settings.GEMINI_API_KEY
-    if not api_key:
-        return 'アドバイス機能は設定中です。'
+def _backoff_key(user_id):
+    return f'advice:retry-after:{user_id}'
+
+
+def context_fingerprint(ctx):
+    """Stable hash of gather_practice_context() output."""
+    payload = json.dumps(ctx, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _generate(user, ctx, fingerprint):
+    """Call the LLM backend and store the advice.
+
+    Returns (text, stored); when nothing was stored, text is a notice or None.
+    """
+    from .llm import LLMError, LLMNotConfigured, LLMUnavailable, get_backend
 
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(
-            model_name='gemini-2.5-flash-lite',
-            system_instruction=ADVICE_SYSTEM_PROMPT,
+        advice_text = get_backend().generate(
+            ADVICE_SYSTEM_PROMPT, format_advice_prompt(ctx), model=ADVICE_MODEL,
         )
-        response = model.generate_content(format_advice_prompt(ctx))
-        advice_text = response.text
-
-        # Cache
-        today = timezone.now().date()
-        PracticeAdviceCache.objects.create(
-            user=user,
-            advice_text=advice_text,
-            period_start=today - timedelta(days=6),
-            period_end=today,
-        )
-        # Clean old cache entries
-        PracticeAdviceCache.objects.filter(user=user).order_by('-generated_at')[5:].delete()
+    except LLMNotConfigured:
+        return 'アドバイス機能は設定中です。', False
+    except LLMUnavailable as e:
+        logger.warning(f'Practice advice unavailable: {e}')
+        return 'アドバイス機能は現在利用できません。', False
+    except LLMError as e:
+        logger.error(f'Practice advice generation error: {e}')
+        return None, False
 
-        return advice_text
+    _store_advice(user, advice_text, fingerprint)
+    return advice_text, True
 
-    except Exception as e:
-        logger.error(f'Practice advice generation error: {e}')
-        if latest:
-            return latest.advice_text
-        return '練習を続けて、データが貯まるとアドバイスが表示されます。'
+
+def _store_advice(user, advice_text, fingerprint=''):
+    from .models import PracticeAdviceCache
+
+    today = timezone.now().date()
+    PracticeAdviceCache.objects.create(
+        user=user,
+        advice_text=advice_text,
+        period_start=today - timedelta(days=6),
+        period_end=today,
+        context_hash=fingerprint,
+    )
+    # Clean old cache entries
+    stale = PracticeAdviceCache.objects.filter(user=user).order_by('-generated_at')[5:]
+    PracticeAdviceCache.objects.filter(pk__in=list(stale.values_list('pk', flat=True))).delete()
+
+
+def _count(outcome):
+    try:
+        counters.incr(STATS_KEY.format(outcome))
+    except Exception:
+        logger.warning('Could not record advice stats', exc_info=True)
+
+
+def advice_stats():
+    return {outcome: cache.get(STATS_KEY.format(outcome), 0) for outcome in STATS_OUTCOMES}
+
+
+def reset_advice_stats():
+    cache.delete_many([STATS_KEY.format(outcome) for outcome in STATS_OUTCOMES])
+
+
+def refresh_practice_advice(user, force=False):
+    """Bring ``user``'s advice up to date, calling Gemini only if needed.
+
+    When the practice data hashes the same as for the latest advice (and
+    that advice is younger than PracticeAdviceCache.MAX_AGE), the advice is
+    just marked as checked. Returns 'generated', 'unchanged' or 'failed';
+    raises RetryLater when the global advice quota is spent.
+    """
+    from .models import PracticeAdviceCache
+    from . import ratelimit
+    from .jobs import RetryLater
+
+    ctx = gather_practice_context(user, days=7)
+    fingerprint = context_fingerprint(ctx)
+    latest = PracticeAdviceCache.objects.filter(user=user).first()
+    if (
+        not force and latest and latest.context_hash == fingerprint
+        and not latest.is_expired()
+    ):
+        PracticeAdviceCache.objects.filter(pk=latest.pk).update(checked_at=timezone.now())
+        _count('unchanged')
+        return 'unchanged'
+
+    quota = ratelimit.hit('advice', user.pk, rules=('global',))
+    if not quota:
+        raise RetryLater(quota.reset, 'advice quota spent')
+
+    text, stored = _generate(user, ctx, fingerprint)
+    if not stored:
+        # Remember the notice so views stop re-queueing for a while.
+        cache.set(_backoff_key(user.pk), text or FALLBACK_TEXT, RETRY_AFTER_FAILURE)
+        _count('failed')
+        return 'failed'
+    _count('generated')
+    return 'generated'
+
+
+def run_refresh_job(user_id, force=False):
+    """Job handler for 'advice.refresh'."""
+    from django.contrib.auth import get_user_model
+
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is not None:
+        refresh_practice_advice(user, force=force)
+
+
+def request_refresh(user, delay=0, force=False):
+    """Queue a regeneration for ``user`` (at most one queued at a time)."""
+    from . import jobs
+
+    payload = {'user_id': user.pk}
+    if force:
+        payload['force'] = True
+    return jobs.enqueue('advice.refresh', payload, key=_job_key(user.pk), delay=delay)
+
+
+def get_practice_advice(user, force=False):
+    """Return (advice text, refreshing) without waiting for Gemini.
+
+    The latest cached advice is returned right away. When it is missing,
+    stale or ``force`` is set, a regeneration job is queued and the widget
+    polls until it lands.
+    """
+    from .models import PracticeAdviceCache
+    from . import jobs
+
+    latest = PracticeAdviceCache.objects.filter(user=user).first()
+    refreshing = jobs.is_queued(_job_key(user.pk))
+    if not refreshing:
+        backoff = cache.get(_backoff_key(user.pk))
+        if force or (backoff is None and (latest is None or latest.is_stale())):
+            request_refresh(user, force=force)
+            refreshing = True
+        elif latest is None:
+            return backoff, False
+
+    return (latest.advice_text if latest else PENDING_TEXT), refreshing
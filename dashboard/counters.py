@@ -0,0 +1,34 @@
+"""Best-effort counters in the shared cache (stats, version numbers).
+
+An evicted key simply starts again from the increment, so these are only
+used where that is harmless; quotas use RateLimitCounter rows instead.
+The key disappearing between ``add`` and ``incr`` never raises.
+"""
+from django.core.cache import cache
+
+
+def incr(key, amount=1, timeout=None, start=None):
+    """Add ``amount`` to ``key`` and return the new value.
+
+    A missing key is created with ``start`` (default ``amount``).
+    """
+    start = amount if start is None else start
+    if cache.add(key, start, timeout):
+        return start
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        # Evicted or expired between add() and incr().
+        cache.set(key, start, timeout)
+        return start
+
+
+async def aincr(key, amount=1, timeout=None, start=None):
+    start = amount if start is None else start
+    if await cache.aadd(key, start, timeout):
+        return start
+    try:
+        return await cache.aincr(key, amount)
+    except ValueError:
+        await cache.aset(key, start, timeout)
+        return start
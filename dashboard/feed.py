@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from django.urls import reverse
+
+FEED_PAGE_SIZE = 8
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+# ──────────────────────────────────────
+# Writers
+# ──────────────────────────────────────
+
+def _describe_session(session, created):
+    if created:
+        text = f'{session.duration_minutes}分練習しました'
+    else:
+        text = f'練習記録を更新しました（{session.duration_minutes}分）'
+    return session.user_id, 'practice', text, reverse('guitarlog:home')
+
+
+def _describe_event(event, created):
+    verb = '追加' if created else '更新'
+    return (
+        event.user_id, 'live', f'{event.artist} のライブを{verb}',
+        reverse('livelog:event_detail', args=[event.pk]),
+    )
+
+
+def _describe_setlist_entry(entry, created):
+    event = entry.event
+    verb = '追加' if created else '更新'
+    return (
+        event.user_id, 'setlist', f'{event.artist} のセトリに「{entry.song_title}」を{verb}',
+        reverse('livelog:event_detail', args=[event.pk]),
+    )
+
+
+def _describe_expense(expense, created):
+    verb = '記録' if created else '更新'
+    return (
+        expense.user_id, 'expense',
+        f'{expense.get_category_display()} ¥{expense.amount:,} を{verb}',
+        reverse('livelog:expense_list'),
+    )
+
+
+def _describe_project(project, created):
+    verb = '作成' if created else '更新'
+    return (
+        project.user_id, 'project', f'「{project.title}」を{verb}',
+        reverse('songdiary:project_detail', args=[project.pk]),
+    )
+
+
+def _describe_memo(memo, created):
+    project = memo.project
+    if created:
+        text = f'「{project.title}」に{memo.get_memo_type_display()}メモを追加'
+    else:
+        text = f'「{project.title}」のメモを更新'
+    return (
+        project.user_id, 'memo', text,
+        reverse('songdiary:project_detail', args=[project.pk]),
+    )
+
+
+def _describe_bookmark(bookmark, created):
+    if not created:
+        return None
+    topic = bookmark.topic
+    return (
+        bookmark.user_id, 'bookmark', f'「{topic.title}」をブックマーク',
+        reverse('music_theory:topic_detail', args=[topic.slug]),
+    )
+
+
+FEED_SOURCES = {
+    'guitarlog.PracticeSession': _describe_session,
+    'livelog.LiveEvent': _describe_event,
+    'livelog.SetlistEntry': _describe_setlist_entry,
+    'livelog.Expense': _describe_expense,
+    'songdiary.Project': _describe_project,
+    'songdiary.Memo': _describe_memo,
+    'music_theory.Bookmark': _describe_bookmark,
+}
+
+# Saves that only touch these fields are bookkeeping, not user activity.
+IGNORED_UPDATE_FIELDS = {
+    'livelog.SetlistEntry': {'order'},
+}
+
+
+def record_activity(instance, created, update_fields=None):
+    """Append an ActivityEvent describing a saved row (if it is feed-worthy)."""
+    from .models import ActivityEvent
+
+    label = instance._meta.label
+    if not created and update_fields:
+        ignored = IGNORED_UPDATE_FIELDS.get(label, set())
+        if set(update_fields) <= ignored:
+            return None
+
+    description = FEED_SOURCES[label](instance, created)
+    if description is None:
+        return None
+    user_id, kind, text, url = description
+    return ActivityEvent.objects.create(
+        user_id=user_id,
+        kind=kind,
+        verb='created' if created else 'updated',
+        object_id=instance.pk,
+        text=text[:300],
+        url=url,
+    )
+
+
+# ──────────────────────────────────────
+# Keyset pagination
+# ──────────────────────────────────────
+
+def encode_cursor(event):
+    """Opaque cursor for the position just after ``event``."""
+    micros = (event.occurred_at - _EPOCH) // _MICROSECOND
+    return f'{micros}-{event.pk}'
+
+
+def decode_cursor(cursor):
+    """Return (occurred_at, id) or None for a malformed cursor."""
+    try:
+        micros, pk = cursor.split('-', 1)
+        return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def activity_page(user, cursor=None, limit=FEED_PAGE_SIZE):
+    """Return (events, next_cursor) using one indexed range scan.
+
+    Rows are ordered by (occurred_at, id) descending; the cursor resumes
+    strictly after the last row of the previous page.
+    """
+    from .models import ActivityEvent
+
+    events = ActivityEvent.objects.filter(user=user)
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        occurred_at, pk = position
+        events = events.filter(
+            Q(occurred_at__lt=occurred_at) | Q(occurred_at=occurred_at, id__lt=pk)
+        )
+    page = list(events.order_by('-occurred_at', '-id')[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
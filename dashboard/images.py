@@ -0,0 +1,162 @@
+"""Local mirror of remote artwork (Spotify album art and artist images).
+
+Each remote image is fetched once, resized to the ``VARIANTS`` sizes and
+stored as WebP under ``MEDIA_ROOT/imagecache/``; ``views.image_proxy``
+serves those files with immutable cache headers. Templates point at the
+proxy through the ``proxy_image`` filter, whose ``src`` is signed so the
+public proxy only serves URLs this site rendered. Newly saved songs and
+events are warmed by an ``images.warm`` job; the proxy never fetches
+inline but queues the same job on a miss and redirects to the original
+meanwhile. ``manage.py warm_images`` backfills existing rows.
+"""
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signing import BadSignature, Signer
+from django.urls import reverse
+
+from . import singleflight
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels; thumb covers 64px avatars at 2x.
+VARIANTS = {'thumb': 128, 'card': 320}
+WEBP_QUALITY = 80
+CACHE_DIR = 'imagecache'
+FETCH_TIMEOUT = 10
+MAX_BYTES = 5 * 1024 * 1024
+# A URL that could not be mirrored is not retried from views for this long.
+FAILURE_TTL = 10 * 60
+SIGNING_SALT = 'dashboard.images.proxy'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def is_allowed(url):
+    """Only images on the configured CDN hosts are proxied."""
+    parts = urlsplit(url or '')
+    return parts.scheme in ('http', 'https') and parts.hostname in settings.IMAGE_PROXY_HOSTS
+
+
+def image_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def variant_name(url, variant):
+    key = image_key(url)
+    return f'{CACHE_DIR}/{key[:2]}/{key}_{variant}.webp'
+
+
+def is_mirrored(url):
+    return all(default_storage.exists(variant_name(url, variant)) for variant in VARIANTS)
+
+
+def proxy_url(url, variant):
+    """URL of the local variant; other hosts are returned unchanged."""
+    if not is_allowed(url):
+        return url or ''
+    src = Signer(salt=SIGNING_SALT).sign(url)
+    return f"{reverse('dashboard:image_proxy', args=[variant])}?{urlencode({'src': src})}"
+
+
+def unsign(src):
+    """The image URL from a proxy ``src`` parameter, or None if tampered with."""
+    try:
+        return Signer(salt=SIGNING_SALT).unsign(src)
+    except BadSignature:
+        return None
+
+
+def _http_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+
+                _session = requests.Session()
+    return _session
+
+
+def _download(url):
+    with _http_session().get(url, timeout=FETCH_TIMEOUT, stream=True) as resp:
+        resp.raise_for_status()
+        if not resp.headers.get('Content-Type', '').startswith('image/'):
+            raise ValueError(f"not an image: {resp.headers.get('Content-Type')}")
+        data = resp.raw.read(MAX_BYTES + 1, decode_content=True)
+    if len(data) > MAX_BYTES:
+        raise ValueError('image too large')
+    return data
+
+
+def _store_variants(url):
+    from PIL import Image
+
+    image = Image.open(BytesIO(_download(url)))
+    image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    for variant, size in VARIANTS.items():
+        name = variant_name(url, variant)
+        if default_storage.exists(name):
+            continue
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        out = BytesIO()
+        resized.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+        default_storage.save(name, ContentFile(out.getvalue()))
+    return True
+
+
+def _mirror(url):
+    try:
+        return _store_variants(url)
+    except Exception as e:
+        logger.warning('Image mirror failed for %s: %s', url, e)
+        cache.set(f'image:failed:{image_key(url)}', 1, FAILURE_TTL)
+        return False
+
+
+def mirror(url, retry_failed=False):
+    """Fetch ``url`` and store its variants unless already done. Returns success.
+
+    Concurrent calls for the same URL (in any worker) share one fetch. A
+    recent failure is returned as is unless ``retry_failed``.
+    """
+    if is_mirrored(url):
+        return True
+    if not retry_failed and cache.get(f'image:failed:{image_key(url)}'):
+        return False
+    return bool(singleflight.run(f'image:{image_key(url)}', lambda: _mirror(url), FETCH_TIMEOUT * 2))
+
+
+# ──────────────────────────────────────
+# Warmer
+# ──────────────────────────────────────
+
+def warm_later(url):
+    """Queue an 'images.warm' job for ``url`` if it is not mirrored yet."""
+    from . import jobs
+
+    if is_allowed(url) and not is_mirrored(url):
+        jobs.enqueue('images.warm', {'url': url}, key=f'image:{image_key(url)}')
+
+
+def warm_on_miss(url):
+    """From the proxy: queue a warm job at most once per FAILURE_TTL per URL."""
+    if cache.add(f'image:queued:{image_key(url)}', 1, FAILURE_TTL):
+        warm_later(url)
+
+
+def run_warm_job(url):
+    """Job handler for 'images.warm'."""
+    if not mirror(url, retry_failed=True):
+        raise RuntimeError(f'could not mirror {url}')
@@ -0,0 +1,126 @@
+"""A small DB-backed job queue, drained by `manage.py run_jobs`.
+
+Handlers are registered by kind in ``HANDLERS`` as dotted paths and called
+with the job's payload. A handler can raise ``RetryLater`` to put the job
+back in the queue (e.g. when a quota is spent); any other exception is
+retried with exponential backoff up to ``MAX_ATTEMPTS``.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {
+    'advice.refresh': 'dashboard.advice.run_refresh_job',
+    'images.warm': 'dashboard.images.run_warm_job',
+    'uploads.process': 'dashboard.uploads.run_process_job',
+}
+
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 30
+# A running job whose worker vanished is requeued after this long.
+RUNNING_TIMEOUT = timedelta(minutes=10)
+KEEP_FINISHED = timedelta(days=7)
+
+
+class RetryLater(Exception):
+    """Raised by a handler to run the job again after ``delay`` seconds."""
+
+    def __init__(self, delay, reason=''):
+        super().__init__(reason or f'retry in {delay}s')
+        self.delay = delay
+
+
+def enqueue(kind, payload=None, key='', delay=0):
+    """Queue a job; returns it, or None when ``key`` is already queued/running."""
+    from .models import BackgroundJob
+
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    try:
+        with transaction.atomic():
+            return BackgroundJob.objects.create(
+                kind=kind, key=key, payload=payload or {},
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        return None
+
+
+def is_queued(key):
+    from .models import BackgroundJob
+
+    return BackgroundJob.objects.filter(key=key, status__in=['pending', 'running']).exists()
+
+
+def claim_next(kinds=None):
+    """Mark the next due job as running and return it (None if idle).
+
+    On PostgreSQL, rows locked by another worker are skipped, so several
+    workers can drain the queue side by side.
+    """
+    from .models import BackgroundJob
+
+    with transaction.atomic():
+        jobs = BackgroundJob.objects.filter(status='pending', run_after__lte=timezone.now())
+        if kinds:
+            jobs = jobs.filter(kind__in=kinds)
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        job = jobs.order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at'])
+    return job
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome. Returns the final status."""
+    try:
+        import_string(HANDLERS[job.kind])(**job.payload)
+    except RetryLater as e:
+        # Not a failure: the attempt is given back.
+        job.status = 'pending'
+        job.attempts -= 1
+        job.run_after = timezone.now() + timedelta(seconds=e.delay)
+        job.last_error = str(e)
+    except Exception as e:
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        job.last_error = f'{type(e).__name__}: {e}'
+        if job.attempts < MAX_ATTEMPTS:
+            job.status = 'pending'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+    else:
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.last_error = ''
+    job.save(update_fields=['status', 'attempts', 'run_after', 'finished_at', 'last_error'])
+    return job.status
+
+
+def requeue_abandoned():
+    """Put jobs whose worker died mid-run back in the queue."""
+    from .models import BackgroundJob
+
+    return BackgroundJob.objects.filter(
+        status='running', started_at__lt=timezone.now() - RUNNING_TIMEOUT,
+    ).update(status='pending', run_after=timezone.now())
+
+
+def purge_finished():
+    from .models import BackgroundJob
+
+    deleted, _ = BackgroundJob.objects.filter(
+        status__in=['done', 'failed'], finished_at__lt=timezone.now() - KEEP_FINISHED,
+    ).delete()
+    return deleted
@@ -0,0 +1,303 @@
+"""LLM backends shared by the chatbot and the practice advice.
+
+``get_backend()`` returns the process-wide instance named by
+``settings.LLM_BACKEND``. Backends take a system prompt, the user prompt
+and an optional history (objects with ``role`` / ``content``) and either
+stream the answer or return it whole, sync or async.
+
+GeminiBackend keeps one configured client and one model object per
+(model, system prompt), applies ``LLM_TIMEOUT``, retries transient
+failures with jittered exponential backoff (streams only before the first
+chunk) and stops calling a failing API for a while (circuit breaker).
+FakeBackend answers locally with ``LLM_FAKE_LATENCY`` for offline tests
+and load tests.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gemini-2.5-flash-lite'
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+# HTTP statuses worth retrying (rate limited / server side).
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+# Consecutive failures that open the circuit, and how long it stays open.
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+
+class LLMError(Exception):
+    """The answer could not be generated."""
+
+
+class LLMNotConfigured(LLMError):
+    """No API key."""
+
+
+class LLMUnavailable(LLMError):
+    """Client library missing, or the circuit breaker is open."""
+
+
+class LLMCircuitOpen(LLMUnavailable):
+    """The API failed repeatedly; calls fail fast until the cooldown ends."""
+
+
+def _status(exc):
+    code = getattr(exc, 'status', None) or getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def is_transient(exc):
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    try:
+        import aiohttp
+    except ImportError:
+        pass
+    else:
+        if isinstance(exc, aiohttp.ClientConnectionError):
+            return True
+    return _status(exc) in TRANSIENT_STATUSES
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY):
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Fail fast after repeated failures; let one call through after the cooldown."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise LLMCircuitOpen('circuit open')
+            # Half-open: this caller is the trial; others keep failing fast.
+            self.opened_at = time.monotonic()
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning('LLM circuit opened after %s failures', self.failures)
+                self.opened_at = time.monotonic()
+
+
+class BaseBackend:
+    def stream(self, system_prompt, prompt, history=(), model=None):
+        raise NotImplementedError
+
+    async def astream(self, system_prompt, prompt, history=(), model=None):
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    def generate(self, system_prompt, prompt, history=(), model=None):
+        return ''.join(self.stream(system_prompt, prompt, history, model))
+
+    async def agenerate(self, system_prompt, prompt, history=(), model=None):
+        return ''.join([chunk async for chunk in self.astream(system_prompt, prompt, history, model)])
+
+
+class GeminiBackend(BaseBackend):
+    retry_base_delay = RETRY_BASE_DELAY
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self._models = {}
+        self._configured_key = None
+        self._lock = threading.Lock()
+
+    def _model(self, model, system_prompt):
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            raise LLMUnavailable('google-generativeai is not installed')
+
+        api_key = settings.GEMINI_API_KEY
+        if not api_key:
+            raise LLMNotConfigured('GEMINI_API_KEY is not set')
+
+        with self._lock:
+            if self._configured_key != api_key:
+                genai.configure(api_key=api_key)
+                self._configured_key = api_key
+                self._models.clear()
+            key = (model, system_prompt)
+            if key not in self._models:
+                self._models[key] = genai.GenerativeModel(model_name=model, system_instruction=system_prompt)
+            return self._models[key]
+
+    @staticmethod
+    def _contents(prompt, history, rest=False):
+        def part(text):
+            return {'text': text} if rest else text
+
+        contents = [
+            {'role': 'user' if msg.role == 'user' else 'model', 'parts': [part(msg.content)]}
+            for msg in history
+        ]
+        contents.append({'role': 'user', 'parts': [part(prompt)]})
+        return contents
+
+    def _failed(self, exc, attempt, produced):
+        """Decide whether to retry ``exc``; re-raise as LLMError otherwise.
+
+        Only transient failures count towards the circuit breaker: a bad
+        request or a blocked answer says nothing about the API's health.
+        """
+        if isinstance(exc, LLMError):
+            raise exc
+        if not is_transient(exc):
+            raise LLMError(str(exc)) from exc
+        if not produced and attempt < settings.LLM_MAX_RETRIES:
+            logger.info('LLM call failed (%s), retrying', exc)
+            return backoff_delay(attempt, self.retry_base_delay)
+        self.breaker.failure()
+        raise LLMError(str(exc)) from exc
+
+    def stream(self, system_prompt, prompt, history=(), model=None):
+        self.breaker.check()
+        gemini = self._model(model or DEFAULT_MODEL, system_prompt)
+        contents = self._contents(prompt, history)
+        attempt = 0
+        produced = False
+        while True:
+            try:
+                response = gemini.generate_content(
+                    contents, stream=True, request_options={'timeout': settings.LLM_TIMEOUT},
+                )
+                for chunk in response:
+                    if chunk.text:
+                        produced = True
+                        yield chunk.text
+                self.breaker.success()
+                return
+            except Exception as e:
+                time.sleep(self._failed(e, attempt, produced))
+                attempt += 1
+
+    def generate(self, system_prompt, prompt, history=(), model=None):
+        self.breaker.check()
+        gemini = self._model(model or DEFAULT_MODEL, system_prompt)
+        contents = self._contents(prompt, history)
+        attempt = 0
+        while True:
+            try:
+                response = gemini.generate_content(
+                    contents, request_options={'timeout': settings.LLM_TIMEOUT},
+                )
+                text = response.text
+                self.breaker.success()
+                return text
+            except Exception as e:
+                time.sleep(self._failed(e, attempt, False))
+                attempt += 1
+
+    async def astream(self, system_prompt, prompt, history=(), model=None):
+        """Streams over the REST endpoint on the shared aiohttp session."""
+        from .upstream import gemini_stream
+
+        self.breaker.check()
+        if not settings.GEMINI_API_KEY:
+            raise LLMNotConfigured('GEMINI_API_KEY is not set')
+        contents = self._contents(prompt, history, rest=True)
+        attempt = 0
+        produced = False
+        while True:
+            chunks = gemini_stream(model or DEFAULT_MODEL, system_prompt, contents)
+            try:
+                # The timeout covers each wait for Gemini, not the time the
+                # caller spends between chunks.
+                while True:
+                    try:
+                        async with asyncio.timeout(settings.LLM_TIMEOUT):
+                            chunk = await anext(chunks)
+                    except StopAsyncIteration:
+                        break
+                    produced = True
+                    yield chunk
+                self.breaker.success()
+                return
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt, produced))
+                attempt += 1
+            finally:
+                await chunks.aclose()
+
+    async def agenerate(self, system_prompt, prompt, history=(), model=None):
+        from .upstream import gemini_generate
+
+        self.breaker.check()
+        if not settings.GEMINI_API_KEY:
+            raise LLMNotConfigured('GEMINI_API_KEY is not set')
+        contents = self._contents(prompt, history, rest=True)
+        attempt = 0
+        while True:
+            try:
+                async with asyncio.timeout(settings.LLM_TIMEOUT):
+                    text = await gemini_generate(model or DEFAULT_MODEL, system_prompt, contents)
+                self.breaker.success()
+                return text
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt, False))
+                attempt += 1
+
+
+class FakeBackend(BaseBackend):
+    """Deterministic local answers; ``LLM_FAKE_LATENCY`` seconds per answer."""
+    chunks = ('これは', 'テスト用の', '回答です。')
+
+    def _chunk_delay(self):
+        return settings.LLM_FAKE_LATENCY / len(self.chunks)
+
+    def stream(self, system_prompt, prompt, history=(), model=None):
+        delay = self._chunk_delay()
+        for chunk in self.chunks:
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    async def astream(self, system_prompt, prompt, history=(), model=None):
+        delay = self._chunk_delay()
+        for chunk in self.chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    """The shared backend instance for ``settings.LLM_BACKEND``."""
+    path = settings.LLM_BACKEND
+    backend = _backends.get(path)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(path)
+            if backend is None:
+                backend = _backends[path] = import_string(path)()
+    return backend
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.advice import advice_stats, reset_advice_stats
+
+
+class Command(BaseCommand):
+    help = '練習アドバイス再生成の内訳（データ指紋で省略できた Gemini 呼び出し数）を表示'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='表示後にカウンターをリセット')
+
+    def handle(self, *args, **options):
+        stats = advice_stats()
+        checks = stats['generated'] + stats['unchanged']
+        avoided = stats['unchanged'] / checks if checks else 0.0
+
+        self.stdout.write(f'生成（Gemini 呼び出し）: {stats["generated"]}回  失敗: {stats["failed"]}回')
+        self.stdout.write(f'データ変化なしで省略: {stats["unchanged"]}回（再確認のうち {avoided:.1%}）')
+
+        if options['reset']:
+            reset_advice_stats()
+            self.stdout.write(self.style.SUCCESS('カウンターをリセットしました'))
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+
+def _subscription_keys():
+    import os
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from py_vapid import b64urlencode
+
+    public = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint,
+    )
+    return b64urlencode(public), b64urlencode(os.urandom(16))
+
+
+def _vapid_private_key():
+    from py_vapid import Vapid, b64urlencode
+
+    key = Vapid()
+    key.generate_keys()
+    return b64urlencode(key.private_key.private_numbers().private_value.to_bytes(32, 'big'))
+
+
+class Command(BaseCommand):
+    help = 'プッシュ送信のベンチマーク（1件ずつ署名・接続する方式と、まとめ送信＋VAPIDキャッシュ＋接続プールを比較。stub_upstream に向けて実行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8765', help='stub_upstream のベースURL')
+        parser.add_argument('--users', type=int, default=100, help='購読（ユーザー）数')
+        parser.add_argument('--per-user', type=int, default=3, help='1ユーザーあたりの同時通知数（同一保存で解除された実績など）')
+        parser.add_argument('--threads', type=int, default=8, help='送信スレッド数')
+
+    def handle(self, *args, **options):
+        from dashboard.models import PushOutbox, PushSubscription
+
+        if options['users'] < 1 or options['per_user'] < 1 or options['threads'] < 1:
+            raise CommandError('--users / --per-user / --threads は1以上を指定してください')
+
+        items = []
+        for i in range(options['users']):
+            p256dh, auth = _subscription_keys()
+            subscription = PushSubscription(
+                pk=i + 1, endpoint=f'{options["url"].rstrip("/")}/push/{i}', p256dh=p256dh, auth=auth,
+            )
+            for n in range(options['per_user']):
+                items.append(PushOutbox(subscription=subscription, title=f'実績解除: {n}', body='bench', url='/achievements/'))
+
+        with override_settings(
+            VAPID_PRIVATE_KEY=settings.VAPID_PRIVATE_KEY or _vapid_private_key(),
+            VAPID_ADMIN_EMAIL=settings.VAPID_ADMIN_EMAIL or 'bench@example.com',
+        ), ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            self._report('1件ずつ', len(items), len(items), *self._timed(pool, self._send_uncached, items))
+
+            from dashboard import push
+            messages = [message for message, _ in push.coalesce(items)]
+            self._report('まとめ送信', len(items), len(messages), *self._timed(pool, push.deliver, messages))
+
+    def _timed(self, pool, send, messages):
+        started = time.monotonic()
+        outcomes = list(pool.map(send, messages))
+        return time.monotonic() - started, sum(1 for outcome, _ in outcomes if outcome != 'sent')
+
+    def _send_uncached(self, item):
+        """The previous delivery path: sign VAPID and open a connection per push."""
+        import json
+
+        from pywebpush import webpush
+
+        try:
+            webpush(
+                subscription_info=item.subscription.to_webpush_dict(),
+                data=json.dumps({'title': item.title, 'body': item.body, 'url': item.url}),
+                vapid_private_key=settings.VAPID_PRIVATE_KEY,
+                vapid_claims={'sub': f'mailto:{settings.VAPID_ADMIN_EMAIL}'},
+                timeout=10,
+            )
+        except Exception as e:
+            return 'failed', str(e)
+        return 'sent', ''
+
+    def _report(self, name, notifications, requests, elapsed, errors):
+        self.stdout.write(
+            f'{name}: 通知 {notifications}件 / リクエスト {requests}件 / {elapsed:.2f}秒 '
+            f'({notifications / elapsed:.0f} 通知/秒) / エラー {errors}件'
+        )
@@ -0,0 +1,86 @@
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+
+def _variants(query):
+    """Ways the same search arrives from the debounced search boxes."""
+    return [query, query.upper(), f' {query}  ', query.replace(' ', '　')]
+
+
+class Command(BaseCommand):
+    help = 'Spotify 検索キャッシュのベンチマーク（stub_upstream に向けてキャッシュ無効／有効を比較）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8765', help='stub_upstream のベースURL')
+        parser.add_argument('--requests', type=int, default=2000, help='検索リクエスト数')
+        parser.add_argument('--distinct', type=int, default=200, help='異なる検索語の数（人気に偏りあり）')
+        parser.add_argument('--threads', type=int, default=16, help='同時リクエスト数')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        from dashboard.spotify import search_cache_key
+
+        if min(options['requests'], options['distinct'], options['threads']) < 1:
+            raise CommandError('--requests / --distinct / --threads は1以上を指定してください')
+
+        rng = random.Random(options['seed'])
+        words = [f'artist {i}' for i in range(options['distinct'])]
+        weights = [1 / (rank + 1) for rank in range(len(words))]  # Zipf-like popularity
+        workload = [
+            (rng.choice(('track', 'artist')), rng.choice(_variants(word)))
+            for word in rng.choices(words, weights, k=options['requests'])
+        ]
+        keys = {search_cache_key(kind, word, 5) for kind in ('track', 'artist') for word in words}
+
+        base = options['url'].rstrip('/')
+        with override_settings(
+            SPOTIFY_CLIENT_ID='bench', SPOTIFY_CLIENT_SECRET='bench',
+            SPOTIFY_TOKEN_URL=f'{base}/api/token', SPOTIFY_API_BASE=f'{base}/v1',
+        ):
+            for name, ttl in (('キャッシュなし', 0), ('キャッシュあり', 3600)):
+                cache.delete_many(list(keys))
+                with override_settings(SPOTIFY_CACHE_TTL=ttl):
+                    self._run(name, workload, options['threads'], base)
+        cache.delete_many(list(keys))
+
+    def _run(self, name, workload, threads, base):
+        from dashboard.spotify import SpotifyClient, cache_stats, reset_cache
+
+        reset_cache()
+        client = SpotifyClient()
+        before = self._upstream_searches(base)
+
+        def search(item):
+            kind, query = item
+            started = time.monotonic()
+            if kind == 'artist':
+                client.search_artists(query, limit=5)
+            else:
+                client.search_tracks(query, limit=5)
+            return time.monotonic() - started
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = sorted(pool.map(search, workload))
+        elapsed = time.monotonic() - started
+
+        stats = cache_stats()
+        hits = stats['local_hits'] + stats['shared_hits']
+        self.stdout.write(
+            f'{name}: {len(workload)}件 / {elapsed:.2f}秒 / '
+            f'p50 {statistics.median(latencies) * 1000:.0f}ms / '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms / '
+            f'ヒット率 {hits / len(workload):.0%} / Spotify へのリクエスト {self._upstream_searches(base) - before}件'
+        )
+
+    def _upstream_searches(self, base):
+        with urlopen(f'{base}/_stats') as resp:
+            return json.load(resp).get('/v1/search', 0)
@@ -0,0 +1,197 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+# Lookups retried per song/artist after a 429 before giving up on it.
+MAX_RATE_LIMIT_RETRIES = 5
+# Songs/artists Spotify did not find are skipped on reruns for this long,
+# keyed by the normalized title/artist so an edited row is looked up again.
+MISS_KEY_PREFIX = 'spotify:enrich-miss'
+MISS_TTL = 30 * 24 * 60 * 60
+
+
+def miss_key(search_type, key):
+    if isinstance(key, tuple):
+        key = '\x1f'.join(key)
+    return f'{MISS_KEY_PREFIX}:{search_type}:{hashlib.sha1(key.encode()).hexdigest()}'
+
+
+class Throttle:
+    """Spaces requests across threads and pauses them all after a 429."""
+
+    def __init__(self, rps):
+        self.interval = 1 / rps if rps else 0
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_at)
+            self.next_at = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+class Command(BaseCommand):
+    help = 'Spotify のメタデータ（ID・アートワーク）が未設定の練習曲・ライブを一括補完（再実行で続きから）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['songs', 'events'], help='対象を練習曲またはライブに限定')
+        parser.add_argument('--threads', type=int, default=4, help='同時に照会する件数')
+        parser.add_argument('--rps', type=float, default=10.0, help='1秒あたりの最大リクエスト数（0 で無制限）')
+        parser.add_argument('--batch-size', type=int, default=500, help='まとめて保存する行数')
+        parser.add_argument('--dry-run', action='store_true', help='照会する件数だけ表示')
+        parser.add_argument('--retry-misses', action='store_true', help='前回見つからなかった曲・アーティストも再照会')
+
+    def handle(self, *args, **options):
+        from dashboard.spotify import SpotifyClient
+
+        if options['threads'] < 1 or options['batch_size'] < 1 or options['rps'] < 0:
+            raise CommandError('--threads / --batch-size は1以上、--rps は0以上を指定してください')
+        self.client = SpotifyClient()
+        if not options['dry_run'] and not self.client.is_available():
+            raise CommandError('SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET が設定されていません')
+        self.options = options
+        self.throttle = Throttle(options['rps'])
+
+        if options['only'] in (None, 'songs'):
+            self._enrich('練習曲', *self._song_groups())
+        if options['only'] in (None, 'events'):
+            self._enrich('ライブ', *self._event_groups())
+
+    # ──────────────────────────────────────
+    # Targets: rows missing metadata, grouped by normalized lookup key
+    # ──────────────────────────────────────
+
+    def _song_groups(self):
+        from dashboard.spotify import normalize_query
+        from guitarlog.models import PracticeSong
+
+        rows = (
+            PracticeSong.objects.filter(spotify_id='').exclude(title='')
+            .order_by('pk').values_list('pk', 'title', 'artist')
+        )
+        groups = {}
+        for pk, title, artist in rows.iterator(chunk_size=2000):
+            key = (normalize_query(title), normalize_query(artist))
+            if key not in groups:
+                query = f'track:{title} artist:{artist}' if artist else title
+                groups[key] = (query, [])
+            groups[key][1].append(pk)
+
+        def apply(result):
+            return {'spotify_id': result['spotify_id'], 'album_art_url': result['album_art_url']}
+
+        return PracticeSong, 'track', groups, apply
+
+    def _event_groups(self):
+        from dashboard.spotify import normalize_query
+        from livelog.models import LiveEvent
+
+        rows = (
+            LiveEvent.objects.filter(spotify_artist_id='').exclude(artist='')
+            .order_by('pk').values_list('pk', 'artist')
+        )
+        groups = {}
+        for pk, artist in rows.iterator(chunk_size=2000):
+            groups.setdefault(normalize_query(artist), (artist, []))[1].append(pk)
+
+        def apply(result):
+            return {'spotify_artist_id': result['spotify_artist_id'], 'artist_image_url': result['image_url']}
+
+        return LiveEvent, 'artist', groups, apply
+
+    # ──────────────────────────────────────
+    # Lookup and write-back
+    # ──────────────────────────────────────
+
+    def _lookup(self, search_type, query):
+        """Spotify's results (``[]`` when nothing matched), or None on failure."""
+        from dashboard.spotify import SpotifyRateLimited
+
+        for _ in range(MAX_RATE_LIMIT_RETRIES):
+            self.throttle.wait()
+            try:
+                return self.client.fetch(query, search_type, limit=1)
+            except SpotifyRateLimited as e:
+                self.throttle.pause(e.retry_after)
+        return None
+
+    def _skip_known_misses(self, search_type, groups):
+        """Drop groups Spotify recently did not find. Returns how many."""
+        keys = {miss_key(search_type, key): key for key in groups}
+        known = []
+        batch = list(keys)
+        for start in range(0, len(batch), 1000):
+            known.extend(cache.get_many(batch[start:start + 1000]))
+        for cache_key in known:
+            del groups[keys[cache_key]]
+        return len(known)
+
+    def _enrich(self, label, model, search_type, groups, apply):
+        skipped = 0
+        if not self.options['retry_misses']:
+            skipped = self._skip_known_misses(search_type, groups)
+        rows = sum(len(pks) for _, pks in groups.values())
+        note = f'（前回見つからなかった {skipped}件を除外）' if skipped else ''
+        self.stdout.write(f'{label}: 未設定 {rows}行 / 照会 {len(groups)}件{note}')
+        if self.options['dry_run'] or not groups:
+            return
+
+        pending = []
+        misses = {}
+        looked_up = matched = updated = 0
+        fields = None
+
+        def flush():
+            nonlocal pending, misses, updated
+            if pending:
+                model.objects.bulk_update(pending, fields)
+                updated += len(pending)
+                pending = []
+            if misses:
+                cache.set_many(misses, MISS_TTL)
+                misses = {}
+
+        with ThreadPoolExecutor(max_workers=self.options['threads']) as pool:
+            futures = {
+                pool.submit(self._lookup, search_type, query): key
+                for key, (query, _) in groups.items()
+            }
+            try:
+                for future in as_completed(futures):
+                    looked_up += 1
+                    key = futures[future]
+                    results = future.result()
+                    if results:
+                        matched += 1
+                        values = apply(results[0])
+                        fields = list(values)
+                        pending.extend(model(pk=pk, **values) for pk in groups[key][1])
+                    elif results is not None:
+                        # Not on Spotify; failed lookups are simply retried next run.
+                        misses[miss_key(search_type, key)] = 1
+                    if len(pending) + len(misses) >= self.options['batch_size']:
+                        flush()
+                    if looked_up % 100 == 0:
+                        self.stdout.write(f'  {looked_up}/{len(groups)}件 照会済み（一致 {matched}件）')
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                flush()
+                self.stdout.write(self.style.WARNING(f'中断しました。{updated}行を保存済みです（再実行で続きから）'))
+                raise
+            flush()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: 照会 {looked_up}件 / 一致 {matched}件 / 更新 {updated}行'
+        ))
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = '起動中のサーバーへ同時リクエストを送り、スループットとレイテンシを計測'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='対象サーバー')
+        parser.add_argument('--path', default='/api/spotify/search/?q=loadtest', help='リクエストするパス')
+        parser.add_argument('--method', choices=['GET', 'POST'], default='GET')
+        parser.add_argument('--data', action='append', default=[], help='POST フィールド（key=value、複数可）')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--username', default='loadtest')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency と --requests は1以上を指定してください')
+        data = dict(item.split('=', 1) for item in options['data'])
+        cookies = self._login_cookies(options['username'])
+        result = asyncio.run(self._run(options, cookies, data))
+
+        latencies = sorted(result['latencies'])
+        if not latencies:
+            raise CommandError('成功したリクエストがありません')
+        self.stdout.write(
+            f'{options["method"]} {options["path"]}  同時 {options["concurrency"]} / '
+            f'{options["requests"]} 件  エラー {result["errors"]} 件'
+        )
+        self.stdout.write(
+            f'{len(latencies) / result["elapsed"]:.1f} req/s  '
+            f'p50 {latencies[len(latencies) // 2] * 1000:.0f}ms  '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms  '
+            f'max {latencies[-1] * 1000:.0f}ms'
+        )
+
+    def _login_cookies(self, username):
+        """Session + CSRF cookies for a throwaway user, stored in the target's DB."""
+        user, created = get_user_model().objects.get_or_create(username=username)
+        if created:
+            user.set_unusable_password()
+            user.save()
+        client = Client()
+        client.force_login(user)
+        token = 'loadtest' * 4
+        return {
+            settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value,
+            settings.CSRF_COOKIE_NAME: token,
+        }
+
+    async def _run(self, options, cookies, data):
+        import aiohttp
+
+        url = options['url'].rstrip('/') + options['path']
+        headers = {'X-CSRFToken': cookies[settings.CSRF_COOKIE_NAME], 'Referer': options['url']}
+        remaining = iter(range(options['requests']))
+        latencies = []
+        errors = 0
+
+        async def worker(session):
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    async with session.request(options['method'], url, data=data or None, headers=headers) as resp:
+                        await resp.read()
+                        ok = resp.status < 400
+                except aiohttp.ClientError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=300)
+        async with aiohttp.ClientSession(cookies=cookies, connector=connector, timeout=timeout) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(session) for _ in range(options['concurrency'])))
+            elapsed = time.perf_counter() - started
+        return {'latencies': latencies, 'errors': errors, 'elapsed': elapsed}
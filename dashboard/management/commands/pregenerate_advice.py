@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = '直近に活動したユーザーの練習アドバイスを事前生成（夜間バッチ、Gemini の全体上限を遵守）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='この日数以内に活動したユーザーが対象')
+        parser.add_argument('--concurrency', type=int, default=4, help='同時に生成する件数')
+        parser.add_argument('--fresh-hours', type=int, default=12, help='この時間以内に生成済みならスキップ')
+        parser.add_argument('--dry-run', action='store_true', help='対象ユーザー数だけ表示')
+
+    def handle(self, *args, **options):
+        from dashboard.models import PracticeAdviceCache, UserDailyActivity
+
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency は1以上を指定してください')
+
+        today = timezone.localdate()
+        active_ids = set(
+            UserDailyActivity.objects.filter(date__gte=today - timedelta(days=options['days'] - 1))
+            .filter(Q(session_count__gt=0) | Q(live_count__gt=0) | Q(compose_updates__gt=0))
+            .values_list('user_id', flat=True)
+        )
+        fresh_since = timezone.now() - timedelta(hours=options['fresh_hours'])
+        fresh_ids = set(
+            PracticeAdviceCache.objects.filter(user_id__in=active_ids)
+            .filter(Q(generated_at__gte=fresh_since) | Q(checked_at__gte=fresh_since))
+            .values_list('user_id', flat=True)
+        )
+        users = list(User.objects.filter(pk__in=active_ids - fresh_ids).order_by('pk'))
+
+        self.stdout.write(
+            f'対象: {len(users)}人（活動ユーザー {len(active_ids)}人 / 生成済み {len(fresh_ids)}人）'
+        )
+        if options['dry_run'] or not users:
+            return
+
+        counts = self._run(users, options['concurrency'])
+        self.stdout.write(self.style.SUCCESS(
+            f'生成: {counts["generated"]}件 / データ変化なしで省略: {counts["unchanged"]}件 / '
+            f'失敗: {counts["failed"]}件 / 上限到達で後回し（ジョブ化）: {counts["deferred"]}件'
+        ))
+
+    def _run(self, users, concurrency):
+        from dashboard.advice import refresh_practice_advice, request_refresh
+        from dashboard.jobs import RetryLater
+
+        counts = {'generated': 0, 'unchanged': 0, 'failed': 0, 'deferred': 0}
+        lock = threading.Lock()
+        # Set once the global quota is spent: the rest are queued for later.
+        quota_reset = []
+
+        def generate(user):
+            outcome = 'deferred'
+            try:
+                if not quota_reset:
+                    try:
+                        outcome = refresh_practice_advice(user)
+                    except RetryLater as e:
+                        quota_reset.append(e.delay)
+                if outcome == 'deferred':
+                    request_refresh(user, delay=quota_reset[0])
+            finally:
+                if concurrency > 1:
+                    connection.close()  # this worker thread's own connection
+            with lock:
+                counts[outcome] += 1
+
+        if concurrency == 1:
+            for user in users:
+                generate(user)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(generate, users))
+        return counts
@@ -0,0 +1,60 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'ストレージ内のアップロード画像（サムネイル・アバター・写真メモ）を走査し、未処理のものから縮小版を作成'
+
+    def add_arguments(self, parser):
+        from dashboard.uploads import SPECS
+
+        parser.add_argument('--kind', action='append', dest='kinds', choices=list(SPECS), help='対象の種類（複数可）')
+        parser.add_argument('--threads', type=int, default=4, help='同時に処理する画像数')
+        parser.add_argument('--dry-run', action='store_true', help='未処理の件数だけ表示')
+
+    def handle(self, *args, **options):
+        from dashboard.uploads import SPECS
+
+        if options['threads'] < 1:
+            raise CommandError('--threads は1以上を指定してください')
+        for kind in options['kinds'] or SPECS:
+            self._backfill(kind, options)
+
+    def _backfill(self, kind, options):
+        from dashboard.uploads import is_processed, iter_uploads, process
+
+        def run(name):
+            try:
+                process(name, kind)
+                return True
+            except Exception as e:
+                self.stderr.write(f'  {name}: {type(e).__name__}: {e}')
+                return False
+
+        counts = {'seen': 0, True: 0, False: 0}
+
+        def tally(futures):
+            for future in futures:
+                counts[future.result()] += 1
+
+        # Files are streamed from storage with a bounded number in flight.
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            in_flight = set()
+            for name in iter_uploads(kind):
+                counts['seen'] += 1
+                if counts['seen'] % 100 == 0:
+                    self.stdout.write(f"  {kind}: {counts['seen']}件 確認済み（処理 {counts[True]}件）")
+                if is_processed(name, kind):
+                    continue
+                if options['dry_run']:
+                    counts[True] += 1
+                    continue
+                in_flight.add(pool.submit(run, name))
+                if len(in_flight) >= options['threads'] * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    tally(finished)
+            tally(wait(in_flight).done)
+
+        label = '未処理' if options['dry_run'] else '処理'
+        self.stdout.write(self.style.SUCCESS(f"{kind}: {counts['seen']}件中 {label} {counts[True]}件 / 失敗 {counts[False]}件"))
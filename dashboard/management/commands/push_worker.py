@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from dashboard import push
+
+
+class Command(BaseCommand):
+    help = 'プッシュ通知キュー（PushOutbox）を送信するワーカー（--once で空になるまで処理して終了）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='キューが空になったら終了')
+        parser.add_argument('--batch-size', type=int, default=100, help='1回に取り出す件数')
+        parser.add_argument('--threads', type=int, default=8, help='同時に送信する件数')
+        parser.add_argument('--sleep', type=float, default=2.0, help='キューが空のときの待機秒数')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['threads'] < 1:
+            raise CommandError('--batch-size と --threads は1以上を指定してください')
+
+        totals = dict.fromkeys((push.SENT, push.GONE, push.RETRY, push.FAILED), 0)
+        last_maintenance = 0.0
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            while True:
+                if time.monotonic() - last_maintenance > 60:
+                    requeued = push.requeue_abandoned()
+                    purged = push.purge_finished()
+                    if requeued or purged:
+                        self.stdout.write(f'再投入: {requeued}件 / 削除: {purged}件')
+                    last_maintenance = time.monotonic()
+
+                items = push.claim_batch(options['batch_size'])
+                if not items:
+                    if options['once']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['sleep'])
+                    continue
+
+                counts = push.process_batch(items, pool)
+                for outcome, count in counts.items():
+                    totals[outcome] += count
+                self.stdout.write(
+                    f'送信: {counts[push.SENT]}件 / 再試行: {counts[push.RETRY]}件 / '
+                    f'購読削除: {counts[push.GONE]}件 / 失敗: {counts[push.FAILED]}件'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'合計 送信: {totals[push.SENT]}件 / 再試行: {totals[push.RETRY]}件 / '
+            f'購読削除: {totals[push.GONE]}件 / 失敗: {totals[push.FAILED]}件'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.activity import rebuild_daily_activity
+
+
+class Command(BaseCommand):
+    help = '日別アクティビティ集計（UserDailyActivity）を生データから再構築'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='対象ユーザーID（複数指定可、省略時は全ユーザー）',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_daily_activity(user_ids=options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'日別アクティビティ再構築完了: {written}件'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.search import SEARCH_SOURCES, SOURCE_KINDS, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'グローバル検索の索引（SearchDocument）を再構築'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', action='append', dest='kinds',
+            choices=sorted(SOURCE_KINDS.values()),
+            help='対象の種類（複数指定可、省略時はすべて）',
+        )
+
+    def handle(self, *args, **options):
+        kinds = options['kinds']
+        labels = None
+        if kinds:
+            labels = [label for label in SEARCH_SOURCES if SOURCE_KINDS[label] in kinds]
+        written = rebuild_search_index(labels=labels)
+        self.stdout.write(self.style.SUCCESS(f'検索インデックス再構築完了: {written}件'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dashboard import jobs, ratelimit
+
+
+class Command(BaseCommand):
+    help = 'バックグラウンドジョブを処理するワーカー（--once で空になるまで処理して終了）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='キューが空になったら終了')
+        parser.add_argument('--kind', action='append', dest='kinds', help='処理するジョブの種類（複数可）')
+        parser.add_argument('--sleep', type=float, default=2.0, help='キューが空のときの待機秒数')
+        parser.add_argument('--max-jobs', type=int, default=0, help='この件数を処理したら終了（0 は無制限）')
+
+    def handle(self, *args, **options):
+        processed = 0
+        last_maintenance = 0.0
+        while True:
+            if time.monotonic() - last_maintenance > 60:
+                requeued = jobs.requeue_abandoned()
+                purged = jobs.purge_finished()
+                ratelimit.purge_expired()
+                if requeued or purged:
+                    self.stdout.write(f'再投入: {requeued}件 / 削除: {purged}件')
+                last_maintenance = time.monotonic()
+
+            job = jobs.claim_next(options['kinds'])
+            if job is None:
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['sleep'])
+                continue
+
+            status = jobs.run_job(job)
+            processed += 1
+            self.stdout.write(f'{job.kind} #{job.pk}: {status}')
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'{processed}件のジョブを処理しました'))
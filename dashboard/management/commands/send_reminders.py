@@ -1,78 +1,69 @@
-from datetime import timedelta
+import time
 
-from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
-from django.utils import timezone
-
-User = get_user_model()
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, reset_queries
 
 
 class Command(BaseCommand):
-    help = 'Send push notification reminders (streak protection, live reminders)'
-
-    def handle(self, *args, **options):
-        self._check_streak_reminders()
-        self._check_live_reminders()
+    help = 'Queue push reminders whose scheduled time has passed (ReminderSchedule); run from a frequent cron or with --loop'
 
-    def _check_streak_reminders(self):
-        """Notify users who practiced yesterday but not today."""
-        from guitarlog.models import PracticeSession
-        from dashboard.models import NotificationPreference
-        from dashboard.push import send_push_to_user
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and check for due reminders every --sleep seconds')
+        parser.add_argument('--sleep', type=float, default=30.0, help='Seconds between checks with --loop')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reminders claimed per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute every schedule row from sessions, events and preferences first')
+        parser.add_argument('--dry-run', action='store_true', help='Count due reminders without queueing anything')
+        parser.add_argument('--stats', action='store_true', help='Report query count and timing')
 
-        today = timezone.now().date()
-        yesterday = today - timedelta(days=1)
-
-        users_practiced_yesterday = (
-            PracticeSession.objects.filter(started_at__date=yesterday)
-            .values_list('user_id', flat=True).distinct()
-        )
-        users_practiced_today = set(
-            PracticeSession.objects.filter(started_at__date=today)
-            .values_list('user_id', flat=True).distinct()
-        )
-
-        for user_id in users_practiced_yesterday:
-            if user_id in users_practiced_today:
-                continue
+    def handle(self, *args, **options):
+        from dashboard.reminders import fire_due, rebuild_schedule
 
-            try:
-                prefs = NotificationPreference.objects.get(user_id=user_id)
-                if not prefs.practice_reminder:
-                    continue
-            except NotificationPreference.DoesNotExist:
-                pass
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
 
-            user = User.objects.get(pk=user_id)
-            send_push_to_user(
-                user,
-                'ストリークを守ろう！',
-                '昨日も練習してましたね。今日も少しだけ弾いてストリークを維持しましょう。',
-                '/practice/',
-            )
-            self.stdout.write(f'  Sent streak reminder to {user.username}')
+        # connection.queries is only recorded with DEBUG; force it for --stats.
+        force_debug = connection.force_debug_cursor
+        connection.force_debug_cursor = options['stats']
+        try:
+            if options['rebuild'] and not options['dry_run']:
+                started = self._start()
+                created = rebuild_schedule()
+                self.stdout.write(f'Rebuilt {created} scheduled reminder(s)')
+                self._report('rebuild', started, options)
 
-    def _check_live_reminders(self):
-        """Notify users who have a live event tomorrow."""
-        from livelog.models import LiveEvent
-        from dashboard.models import NotificationPreference
-        from dashboard.push import send_push_to_user
+            while True:
+                started = self._start()
+                if options['dry_run']:
+                    due, _, _ = fire_due(dry_run=True)
+                    self.stdout.write(f'{due} reminder(s) due')
+                    self._report('due', started, options)
+                    return
 
-        tomorrow = timezone.now().date() + timedelta(days=1)
-        events = LiveEvent.objects.filter(date=tomorrow).select_related('user')
+                fired = queued = dropped = 0
+                while True:
+                    batch_fired, batch_queued, batch_dropped = fire_due(batch_size=options['batch_size'])
+                    fired += batch_fired
+                    queued += batch_queued
+                    dropped += batch_dropped
+                    if batch_fired + batch_dropped < options['batch_size']:
+                        break
+                if fired or dropped or not options['loop']:
+                    self.stdout.write(
+                        f'Fired {fired} reminder(s), queued {queued} push(es), dropped {dropped} overdue'
+                    )
+                    self._report('tick', started, options)
+                if not options['loop']:
+                    return
+                close_old_connections()
+                time.sleep(options['sleep'])
+        finally:
+            connection.force_debug_cursor = force_debug
 
-        for event in events:
-            try:
-                prefs = NotificationPreference.objects.get(user=event.user)
-                if not prefs.live_reminder:
-                    continue
-            except NotificationPreference.DoesNotExist:
-                pass
+    def _start(self):
+        reset_queries()
+        return time.monotonic()
 
-            send_push_to_user(
-                event.user,
-                '明日はライブ！',
-                f'{event.artist} のライブが明日です。楽しんできてください！',
-                f'/live/{event.pk}/',
-            )
-            self.stdout.write(f'  Sent live reminder to {event.user.username} for {event.artist}')
+    def _report(self, name, started, options):
+        if options['stats']:
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {name}: {len(connection.queries)} queries, {elapsed:.2f}s')
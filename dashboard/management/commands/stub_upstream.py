@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Gemini / Spotify / Web Push のスタブサーバーを起動（負荷試験用、固定レイテンシ）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=1.0, help='1リクエストの応答遅延（秒）')
+        parser.add_argument('--chunks', type=int, default=5, help='ストリーミング時のチャンク数')
+
+    def handle(self, *args, **options):
+        from aiohttp import web
+
+        latency = options['latency']
+        chunks = max(1, options['chunks'])
+        counts = {}
+
+        @web.middleware
+        async def count_requests(request, handler):
+            resource = request.match_info.route.resource
+            route = resource.canonical if resource else request.path
+            counts[route] = counts.get(route, 0) + 1
+            return await handler(request)
+
+        async def stats(request):
+            """Requests received per route, for benchmarks."""
+            return web.json_response(counts)
+
+        def candidate(text):
+            return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}]}
+
+        async def token(request):
+            return web.json_response({'access_token': 'stub-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+        async def spotify_search(request):
+            await asyncio.sleep(latency)
+            q = request.query.get('q', '')
+            if request.query.get('type') == 'artist':
+                return web.json_response({'artists': {'items': [
+                    {'id': 'stub-artist', 'name': q, 'images': [], 'genres': ['j-rock']},
+                ]}})
+            return web.json_response({'tracks': {'items': [
+                {'id': 'stub-track', 'name': q, 'artists': [{'name': 'Stub'}], 'album': {'images': []}},
+            ]}})
+
+        async def gemini(request):
+            method = request.match_info['method']
+            if method == 'streamGenerateContent':
+                response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+                await response.prepare(request)
+                for i in range(chunks):
+                    await asyncio.sleep(latency / chunks)
+                    await response.write(f'data: {json.dumps(candidate(f"チャンク{i} "))}\r\n\r\n'.encode())
+                await response.write_eof()
+                return response
+            await asyncio.sleep(latency)
+            return web.json_response(candidate('スタブの回答です。'))
+
+        async def push_service(request):
+            await request.read()
+            await asyncio.sleep(latency)
+            if request.match_info['token'].startswith('gone'):
+                return web.Response(status=410)
+            return web.Response(status=201)
+
+        app = web.Application(middlewares=[count_requests])
+        app.router.add_post('/api/token', token)
+        app.router.add_get('/v1/search', spotify_search)
+        app.router.add_post('/v1beta/models/{model}:{method}', gemini)
+        app.router.add_post('/push/{token}', push_service)
+        app.router.add_get('/_stats', stats)
+
+        base = f'http://127.0.0.1:{options["port"]}'
+        self.stdout.write(
+            f'GEMINI_API_BASE={base} SPOTIFY_TOKEN_URL={base}/api/token SPOTIFY_API_BASE={base}/v1'
+        )
+        web.run_app(app, host='127.0.0.1', port=options['port'], print=None)
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = '練習曲・ライブの Spotify 画像をまとめて取得し、縮小した WebP をローカルに保存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='同時に取得する画像数')
+
+    def handle(self, *args, **options):
+        from dashboard import images
+        from guitarlog.models import PracticeSong
+        from livelog.models import LiveEvent
+
+        if options['threads'] < 1:
+            raise CommandError('--threads は1以上を指定してください')
+
+        urls = set(
+            PracticeSong.objects.exclude(album_art_url='').values_list('album_art_url', flat=True).distinct()
+        )
+        urls.update(
+            LiveEvent.objects.exclude(artist_image_url='').values_list('artist_image_url', flat=True).distinct()
+        )
+        todo = [url for url in urls if images.is_allowed(url) and not images.is_mirrored(url)]
+        self.stdout.write(f'画像 {len(urls)}件 / 未取得 {len(todo)}件')
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            stored = sum(pool.map(lambda url: images.mirror(url, retry_failed=True), todo))
+
+        self.stdout.write(self.style.SUCCESS(f'保存 {stored}件 / 失敗 {len(todo) - stored}件'))
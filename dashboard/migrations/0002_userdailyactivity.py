@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 19:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('practice_minutes', models.PositiveIntegerField(default=0, verbose_name='練習時間（分）')),
+                ('session_count', models.PositiveIntegerField(default=0, verbose_name='練習回数')),
+                ('live_count', models.PositiveIntegerField(default=0, verbose_name='ライブ数')),
+                ('compose_updates', models.PositiveIntegerField(default=0, verbose_name='作曲更新数')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_user_daily_activity')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 19:36
+
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_daily_activity(apps, schema_editor):
+    PracticeSession = apps.get_model('guitarlog', 'PracticeSession')
+    LiveEvent = apps.get_model('livelog', 'LiveEvent')
+    Project = apps.get_model('songdiary', 'Project')
+    UserDailyActivity = apps.get_model('dashboard', 'UserDailyActivity')
+
+    counts = defaultdict(dict)
+    for row in (
+        PracticeSession.objects.annotate(d=TruncDate('started_at'))
+        .values('user_id', 'd')
+        .annotate(minutes=Sum('duration_minutes'), cnt=Count('id'))
+        .order_by()
+    ):
+        counts[(row['user_id'], row['d'])].update(
+            practice_minutes=row['minutes'] or 0, session_count=row['cnt'],
+        )
+    for row in LiveEvent.objects.values('user_id', 'date').annotate(cnt=Count('id')).order_by():
+        counts[(row['user_id'], row['date'])]['live_count'] = row['cnt']
+    for row in (
+        Project.objects.annotate(d=TruncDate('updated_at'))
+        .values('user_id', 'd')
+        .annotate(cnt=Count('id'))
+        .order_by()
+    ):
+        counts[(row['user_id'], row['d'])]['compose_updates'] = row['cnt']
+
+    UserDailyActivity.objects.bulk_create(
+        [
+            UserDailyActivity(user_id=user_id, date=day, **values)
+            for (user_id, day), values in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_userdailyactivity'),
+        ('guitarlog', '0003_practicesong_album_art_url_practicesong_spotify_id'),
+        ('livelog', '0006_alter_liveevent_share_token'),
+        ('songdiary', '0004_alter_project_share_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_daily_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 19:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_populate_daily_activity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('practice', '練習'), ('live', 'ライブ'), ('setlist', 'セットリスト'), ('expense', '費用'), ('project', '作曲'), ('memo', 'メモ'), ('bookmark', 'ブックマーク')], max_length=20, verbose_name='種類')),
+                ('verb', models.CharField(choices=[('created', '作成'), ('updated', '更新')], default='created', max_length=10, verbose_name='操作')),
+                ('object_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='対象ID')),
+                ('text', models.CharField(max_length=300, verbose_name='内容')),
+                ('url', models.CharField(blank=True, max_length=300, verbose_name='リンク')),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-occurred_at', '-id'],
+                'indexes': [models.Index(fields=['user', '-occurred_at', '-id'], name='activity_user_occurred_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2 on 2026-10-18 19:41
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_activity_events(apps, schema_editor):
+    ActivityEvent = apps.get_model('dashboard', 'ActivityEvent')
+    PracticeSession = apps.get_model('guitarlog', 'PracticeSession')
+    LiveEvent = apps.get_model('livelog', 'LiveEvent')
+    Project = apps.get_model('songdiary', 'Project')
+    Memo = apps.get_model('songdiary', 'Memo')
+    Bookmark = apps.get_model('music_theory', 'Bookmark')
+
+    memo_labels = {'text': 'テキスト', 'audio': '音声', 'photo': '写真'}
+
+    def sources():
+        for s in PracticeSession.objects.iterator():
+            yield ActivityEvent(
+                user_id=s.user_id, kind='practice', object_id=s.pk,
+                text=f'{s.duration_minutes}分練習しました',
+                url='/practice/', occurred_at=s.started_at,
+            )
+        for e in LiveEvent.objects.iterator():
+            yield ActivityEvent(
+                user_id=e.user_id, kind='live', object_id=e.pk,
+                text=f'{e.artist} のライブを追加'[:300],
+                url=f'/live/{e.pk}/', occurred_at=e.created_at,
+            )
+        for p in Project.objects.iterator():
+            yield ActivityEvent(
+                user_id=p.user_id, kind='project', verb='updated', object_id=p.pk,
+                text=f'「{p.title}」を更新'[:300],
+                url=f'/compose/{p.pk}/', occurred_at=p.updated_at,
+            )
+        for m in Memo.objects.select_related('project').iterator():
+            yield ActivityEvent(
+                user_id=m.project.user_id, kind='memo', object_id=m.pk,
+                text=f'「{m.project.title}」に{memo_labels.get(m.memo_type, "")}メモを追加'[:300],
+                url=f'/compose/{m.project_id}/', occurred_at=m.created_at,
+            )
+        for b in Bookmark.objects.select_related('topic').iterator():
+            yield ActivityEvent(
+                user_id=b.user_id, kind='bookmark', object_id=b.pk,
+                text=f'「{b.topic.title}」をブックマーク'[:300],
+                url=f'/theory/{b.topic.slug}/', occurred_at=b.created_at,
+            )
+
+    batch = []
+    for event in sources():
+        batch.append(event)
+        if len(batch) >= BATCH_SIZE:
+            ActivityEvent.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ActivityEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_activityevent'),
+        ('guitarlog', '0004_practicestreak'),
+        ('livelog', '0006_alter_liveevent_share_token'),
+        ('songdiary', '0004_alter_project_share_token'),
+        ('music_theory', '0006_delete_topicprogress'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_activity_events, migrations.RunPython.noop),
+    ]
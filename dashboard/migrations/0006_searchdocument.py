@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 19:44
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_backfill_activity_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('topic', '音楽理論'), ('song', '練習曲'), ('event', 'ライブ記録'), ('project', '作曲プロジェクト')], max_length=20, verbose_name='種類')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='対象ID')),
+                ('title', models.CharField(max_length=300, verbose_name='タイトル')),
+                ('content', models.TextField(blank=True, verbose_name='本文')),
+                ('title_terms', models.TextField(blank=True, verbose_name='タイトル語')),
+                ('content_terms', models.TextField(blank=True, verbose_name='本文語')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '検索インデックス',
+                'verbose_name_plural': '検索インデックス',
+                'indexes': [models.Index(fields=['user', 'kind'], name='search_user_kind_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+    ]
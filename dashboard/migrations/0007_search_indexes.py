@@ -0,0 +1,128 @@
+# Generated by Django 5.2 on 2026-10-18 20:12
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# Frozen copy of dashboard.search.ngram_terms as of this migration, so later
+# tokenizer changes do not alter what the backfill writes.
+_CJK = (
+    '\u3005\u3006\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff'
+    '\uf900-\ufaff\uff66-\uff9f'
+)
+_TOKEN_RE = re.compile(rf'(?P<cjk>[{_CJK}]+)|(?P<word>[^\W{_CJK}]+)')
+
+
+def ngram_terms(text):
+    terms = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize('NFKC', text or '').lower()):
+        run = match.group('cjk')
+        if run is None:
+            terms.append(match.group('word'))
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+# GIN indexes only exist on PostgreSQL; other backends fall back to substring
+# matching in dashboard.search and skip this step.
+CREATE_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS search_vector_gin_idx '
+    'ON dashboard_searchdocument USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS search_title_trgm_idx '
+    'ON dashboard_searchdocument USING gin (title gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS search_content_trgm_idx '
+    'ON dashboard_searchdocument USING gin (content gin_trgm_ops)',
+]
+
+DROP_INDEXES = [
+    'DROP INDEX IF EXISTS search_content_trgm_idx',
+    'DROP INDEX IF EXISTS search_title_trgm_idx',
+    'DROP INDEX IF EXISTS search_vector_gin_idx',
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_INDEXES:
+        schema_editor.execute(sql)
+
+
+def _join(*parts):
+    return '\n'.join(p for p in parts if p)
+
+
+def backfill_search_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('dashboard', 'SearchDocument')
+    Topic = apps.get_model('music_theory', 'Topic')
+    PracticeSong = apps.get_model('guitarlog', 'PracticeSong')
+    LiveEvent = apps.get_model('livelog', 'LiveEvent')
+    Project = apps.get_model('songdiary', 'Project')
+
+    def document(user_id, kind, pk, title, content):
+        return SearchDocument(
+            user_id=user_id, kind=kind, object_id=pk,
+            title=title[:300], content=content,
+            title_terms=' '.join(ngram_terms(title)),
+            content_terms=' '.join(ngram_terms(content)),
+        )
+
+    def sources():
+        for t in Topic.objects.iterator():
+            yield document(None, 'topic', t.pk, t.title, _join(t.summary, t.body, t.tags))
+        for s in PracticeSong.objects.iterator():
+            yield document(s.user_id, 'song', s.pk, s.title, s.artist)
+        for e in LiveEvent.objects.iterator():
+            yield document(e.user_id, 'event', e.pk, e.artist, _join(e.title, e.venue))
+        for p in Project.objects.iterator():
+            yield document(p.user_id, 'project', p.pk, p.title, _join(p.description, p.tags))
+
+    batch = []
+    for doc in sources():
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            SearchDocument.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        SearchDocument.objects.bulk_create(batch)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE dashboard_searchdocument SET search_vector = "
+            "setweight(to_tsvector('simple', title_terms), 'A') || "
+            "setweight(to_tsvector('simple', content_terms), 'B')"
+        )
+
+
+def clear_search_documents(apps, schema_editor):
+    apps.get_model('dashboard', 'SearchDocument').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_searchdocument'),
+        ('guitarlog', '0004_practicestreak'),
+        ('livelog', '0006_alter_liveevent_share_token'),
+        ('songdiary', '0004_alter_project_share_token'),
+        ('music_theory', '0006_delete_topicprogress'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+        migrations.RunPython(backfill_search_documents, clear_search_documents),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_topic_documents(apps, schema_editor):
+    # Theory topics are served by music_theory.corpus from now on.
+    apps.get_model('dashboard', 'SearchDocument').objects.filter(user__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_topic_documents, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='searchdocument',
+            name='kind',
+            field=models.CharField(choices=[('song', '練習曲'), ('event', 'ライブ記録'), ('project', '作曲プロジェクト')], max_length=20, verbose_name='種類'),
+        ),
+        migrations.AlterField(
+            model_name='searchdocument',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='practiceadvicecache',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最終確認日時'),
+        ),
+        migrations.AddField(
+            model_name='practiceadvicecache',
+            name='context_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='データ指紋'),
+        ),
+    ]
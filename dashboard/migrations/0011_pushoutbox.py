@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 20:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_advice_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='タイトル')),
+                ('body', models.CharField(blank=True, max_length=500, verbose_name='本文')),
+                ('url', models.CharField(default='/', max_length=300, verbose_name='リンク')),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('sending', '送信中'), ('sent', '送信済み'), ('failed', '失敗')], default='pending', max_length=10, verbose_name='状態')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='試行回数')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='送信予定')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='送信開始')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='送信日時')),
+                ('last_error', models.TextField(blank=True, verbose_name='エラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='dashboard.pushsubscription')),
+            ],
+            options={
+                'verbose_name': 'プッシュ通知キュー',
+                'verbose_name_plural': 'プッシュ通知キュー',
+                'ordering': ['run_after', 'id'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='push_status_run_after_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 20:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_pushoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationpreference',
+            name='timezone',
+            field=models.CharField(default='Asia/Tokyo', max_length=64, verbose_name='タイムゾーン'),
+        ),
+        migrations.CreateModel(
+            name='ReminderSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('streak', 'ストリーク'), ('live', 'ライブ前日')], max_length=10, verbose_name='種類')),
+                ('object_id', models.PositiveBigIntegerField(default=0, verbose_name='対象ID')),
+                ('fire_at', models.DateTimeField(verbose_name='送信予定')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_schedules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'リマインダー予定',
+                'verbose_name_plural': 'リマインダー予定',
+                'ordering': ['fire_at'],
+                'indexes': [models.Index(fields=['fire_at'], name='reminder_fire_at_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='unique_reminder_schedule')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_reminder_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True, verbose_name='キー')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='回数')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='有効期限')),
+            ],
+            options={
+                'verbose_name': 'レート制限カウンタ',
+                'verbose_name_plural': 'レート制限カウンタ',
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2 on 2026-10-18 22:10
+
+from datetime import datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Max
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+# Frozen copy of dashboard.reminders as of this migration, so later edits
+# there do not change what the backfill produced.
+STREAK_HOUR = 20
+LIVE_HOUR = 18
+
+
+def _timezone(name):
+    try:
+        return ZoneInfo(name or settings.TIME_ZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(settings.TIME_ZONE)
+
+
+def populate_reminder_schedule(apps, schema_editor):
+    ReminderSchedule = apps.get_model('dashboard', 'ReminderSchedule')
+    NotificationPreference = apps.get_model('dashboard', 'NotificationPreference')
+    PracticeSession = apps.get_model('guitarlog', 'PracticeSession')
+    LiveEvent = apps.get_model('livelog', 'LiveEvent')
+
+    now = timezone.now()
+    prefs = {
+        user_id: (practice_on, live_on, _timezone(tz))
+        for user_id, practice_on, live_on, tz in NotificationPreference.objects.values_list(
+            'user_id', 'practice_reminder', 'live_reminder', 'timezone',
+        )
+    }
+    default = (True, True, _timezone(''))
+
+    def rows():
+        # Only a practice yesterday or today can still have a pending streak reminder.
+        last_practice = (
+            PracticeSession.objects.filter(started_at__gte=now - timedelta(days=2))
+            .values('user_id').annotate(last=Max('started_at')).order_by()
+            .values_list('user_id', 'last')
+        )
+        for user_id, last in last_practice.iterator():
+            practice_on, _, tz = prefs.get(user_id, default)
+            if practice_on:
+                day = last.astimezone(tz).date() + timedelta(days=1)
+                yield ReminderSchedule(
+                    user_id=user_id, kind='streak', object_id=0,
+                    fire_at=datetime.combine(day, dt_time(STREAK_HOUR), tzinfo=tz),
+                )
+        events = LiveEvent.objects.filter(date__gte=timezone.localdate() - timedelta(days=1))
+        for event_id, user_id, event_date in events.values_list('pk', 'user_id', 'date').iterator():
+            _, live_on, tz = prefs.get(user_id, default)
+            if live_on:
+                day = event_date - timedelta(days=1)
+                yield ReminderSchedule(
+                    user_id=user_id, kind='live', object_id=event_id,
+                    fire_at=datetime.combine(day, dt_time(LIVE_HOUR), tzinfo=tz),
+                )
+
+    # Rows saved since 0012 are recomputed along with everything else.
+    ReminderSchedule.objects.all().delete()
+    batch = []
+    for row in rows():
+        if row.fire_at > now:
+            batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            ReminderSchedule.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ReminderSchedule.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0013_ratelimitcounter'),
+        ('guitarlog', '0004_practicestreak'),
+        ('livelog', '0006_alter_liveevent_share_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_reminder_schedule, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
@@ -62,6 +63,13 @@ class PracticeAdviceCache(models.Model):
     generated_at = models.DateTimeField(auto_now_add=True)
     period_start = models.DateField('分析開始日')
     period_end = models.DateField('分析終了日')
+    # Hash of the practice data the advice was written from, and when it
+    # was last confirmed unchanged (advice.py skips Gemini on a match).
+    context_hash = models.CharField('データ指紋', max_length=64, blank=True)
+    checked_at = models.DateTimeField('最終確認日時', null=True, blank=True)
+
+    # Advice is re-checked daily but rewritten at least this often.
+    MAX_AGE = timedelta(days=7)
 
     class Meta:
         ordering = ['-generated_at']
@@ -70,7 +78,10 @@ class PracticeAdviceCache(models.Model):
         return f'{self.user} - {self.generated_at:%Y/%m/%d}'
 
     def is_stale(self):
-        return timezone.now() - self.generated_at > timedelta(hours=24)
+        return timezone.now() - (self.checked_at or self.generated_at) > timedelta(hours=24)
+
+    def is_expired(self):
+        return timezone.now() - self.generated_at > self.MAX_AGE
 
 
 # ──────────────────────────────────────
@@ -105,6 +116,254 @@ class NotificationPreference(models.Model):
     practice_reminder = models.BooleanField('練習リマインダー', default=True)
     live_reminder = models.BooleanField('ライブリマインダー', default=True)
     achievement_notify = models.BooleanField('実績通知', default=True)
+    timezone = models.CharField('タイムゾーン', max_length=64, default='Asia/Tokyo')
 
     def __str__(self):
         return f'{self.user} の通知設定'
+
+
+class ReminderSchedule(models.Model):
+    """ユーザーごとの次回リマインダー送信時刻（`manage.py send_reminders` が期限分だけ処理）"""
+    KIND_CHOICES = [
+        ('streak', 'ストリーク'),
+        ('live', 'ライブ前日'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='reminder_schedules',
+    )
+    kind = models.CharField('種類', max_length=10, choices=KIND_CHOICES)
+    # LiveEvent id for 'live'; 0 for the per-user streak reminder.
+    object_id = models.PositiveBigIntegerField('対象ID', default=0)
+    fire_at = models.DateTimeField('送信予定')
+
+    class Meta:
+        ordering = ['fire_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'object_id'], name='unique_reminder_schedule'),
+        ]
+        indexes = [
+            models.Index(fields=['fire_at'], name='reminder_fire_at_idx'),
+        ]
+        verbose_name = 'リマインダー予定'
+        verbose_name_plural = 'リマインダー予定'
+
+    def __str__(self):
+        return f'{self.user} - {self.get_kind_display()} ({self.fire_at})'
+
+
+class PushOutbox(models.Model):
+    """送信待ちのプッシュ通知（購読ごと、`manage.py push_worker` が送信）"""
+    STATUS_CHOICES = [
+        ('pending', '待機中'),
+        ('sending', '送信中'),
+        ('sent', '送信済み'),
+        ('failed', '失敗'),
+    ]
+
+    subscription = models.ForeignKey(
+        PushSubscription, on_delete=models.CASCADE, related_name='outbox',
+    )
+    title = models.CharField('タイトル', max_length=200)
+    body = models.CharField('本文', max_length=500, blank=True)
+    url = models.CharField('リンク', max_length=300, default='/')
+    status = models.CharField('状態', max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField('試行回数', default=0)
+    run_after = models.DateTimeField('送信予定', default=timezone.now)
+    started_at = models.DateTimeField('送信開始', null=True, blank=True)
+    sent_at = models.DateTimeField('送信日時', null=True, blank=True)
+    last_error = models.TextField('エラー', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='push_status_run_after_idx'),
+        ]
+        verbose_name = 'プッシュ通知キュー'
+        verbose_name_plural = 'プッシュ通知キュー'
+
+    def __str__(self):
+        return f'{self.title} ({self.get_status_display()})'
+
+
+# ──────────────────────────────────────
+# Daily Activity Rollup
+# ──────────────────────────────────────
+
+class UserDailyActivity(models.Model):
+    """ユーザー×日付ごとの活動集計（ローカル日付基準）"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='daily_activity',
+    )
+    date = models.DateField('日付')
+    practice_minutes = models.PositiveIntegerField('練習時間（分）', default=0)
+    session_count = models.PositiveIntegerField('練習回数', default=0)
+    live_count = models.PositiveIntegerField('ライブ数', default=0)
+    compose_updates = models.PositiveIntegerField('作曲更新数', default=0)
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_user_daily_activity'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.date}'
+
+    def is_empty(self):
+        return not (self.session_count or self.live_count or self.compose_updates)
+
+
+# ──────────────────────────────────────
+# Activity Feed
+# ──────────────────────────────────────
+
+class ActivityEvent(models.Model):
+    """追記専用のアクティビティログ（ダッシュボードの最近のアクティビティ）"""
+    KIND_CHOICES = [
+        ('practice', '練習'),
+        ('live', 'ライブ'),
+        ('setlist', 'セットリスト'),
+        ('expense', '費用'),
+        ('project', '作曲'),
+        ('memo', 'メモ'),
+        ('bookmark', 'ブックマーク'),
+    ]
+    VERB_CHOICES = [
+        ('created', '作成'),
+        ('updated', '更新'),
+    ]
+    ICON_GROUPS = {
+        'practice': 'practice',
+        'live': 'live',
+        'setlist': 'live',
+        'expense': 'live',
+        'project': 'project',
+        'memo': 'project',
+        'bookmark': 'bookmark',
+    }
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='activity_events',
+    )
+    kind = models.CharField('種類', max_length=20, choices=KIND_CHOICES)
+    verb = models.CharField('操作', max_length=10, choices=VERB_CHOICES, default='created')
+    object_id = models.PositiveBigIntegerField('対象ID', null=True, blank=True)
+    text = models.CharField('内容', max_length=300)
+    url = models.CharField('リンク', max_length=300, blank=True)
+    occurred_at = models.DateTimeField('日時', default=timezone.now)
+
+    class Meta:
+        ordering = ['-occurred_at', '-id']
+        indexes = [
+            models.Index(fields=['user', '-occurred_at', '-id'], name='activity_user_occurred_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.text}'
+
+    @property
+    def icon_group(self):
+        return self.ICON_GROUPS.get(self.kind, 'bookmark')
+
+
+class SearchDocument(models.Model):
+    """グローバル検索用の索引（練習曲・ライブ・作曲プロジェクト）"""
+    KIND_CHOICES = [
+        ('song', '練習曲'),
+        ('event', 'ライブ記録'),
+        ('project', '作曲プロジェクト'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='search_documents',
+    )
+    kind = models.CharField('種類', max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField('対象ID')
+    title = models.CharField('タイトル', max_length=300)
+    content = models.TextField('本文', blank=True)
+    # Bigram-expanded copies of title/content; the tsvector is built from these.
+    title_terms = models.TextField('タイトル語', blank=True)
+    content_terms = models.TextField('本文語', blank=True)
+    search_vector = SearchVectorField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'kind'], name='search_user_kind_idx'),
+        ]
+        verbose_name = '検索インデックス'
+        verbose_name_plural = '検索インデックス'
+
+    def __str__(self):
+        return f'{self.get_kind_display()}: {self.title}'
+
+
+# ──────────────────────────────────────
+# Background Jobs
+# ──────────────────────────────────────
+
+class BackgroundJob(models.Model):
+    """DB キューのジョブ（`manage.py run_jobs` が処理）"""
+    STATUS_CHOICES = [
+        ('pending', '待機中'),
+        ('running', '実行中'),
+        ('done', '完了'),
+        ('failed', '失敗'),
+    ]
+
+    kind = models.CharField('種類', max_length=50)
+    # Non-empty keys are unique among pending/running jobs (no duplicate work).
+    key = models.CharField('重複防止キー', max_length=200, blank=True)
+    payload = models.JSONField('パラメータ', default=dict, blank=True)
+    status = models.CharField('状態', max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField('試行回数', default=0)
+    run_after = models.DateTimeField('実行予定', default=timezone.now)
+    started_at = models.DateTimeField('開始日時', null=True, blank=True)
+    finished_at = models.DateTimeField('終了日時', null=True, blank=True)
+    last_error = models.TextField('エラー', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(status__in=['pending', 'running']) & ~models.Q(key=''),
+                name='unique_active_job_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+        verbose_name = 'バックグラウンドジョブ'
+        verbose_name_plural = 'バックグラウンドジョブ'
+
+    def __str__(self):
+        return f'{self.kind} ({self.get_status_display()})'
+
+
+# ──────────────────────────────────────
+# Rate Limits
+# ──────────────────────────────────────
+
+class RateLimitCounter(models.Model):
+    """レート制限のウィンドウごとのカウンタ（dashboard.ratelimit が原子的に加算）"""
+    key = models.CharField('キー', max_length=200, unique=True)
+    count = models.PositiveIntegerField('回数', default=0)
+    expires_at = models.DateTimeField('有効期限', db_index=True)
+
+    class Meta:
+        verbose_name = 'レート制限カウンタ'
+        verbose_name_plural = 'レート制限カウンタ'
+
+    def __str__(self):
+        return f'{self.key}: {self.count}'
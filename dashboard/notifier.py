@@ -0,0 +1,25 @@
+import time
+
+from django.core.cache import cache
+
+from . import counters
+
+# Per-user counter bumped whenever a new, unnotified achievement is stored.
+# Pollers compare it with the version they last saw, so an idle check is a
+# cache read and never touches the achievement tables. A lost key (cache
+# eviction) reads as 0, which makes the next poll look at the table once, and
+# is recreated from the clock rather than 1 so a new achievement can never
+# reproduce a version a client saw before the key was lost.
+VERSION_KEY = 'achievements:version:{user_id}'
+VERSION_TTL = 60 * 60 * 24 * 7
+
+
+def achievement_version(user_id):
+    return cache.get(VERSION_KEY.format(user_id=user_id), 0)
+
+
+def publish_achievement(user_id):
+    """Bump the user's version. Safe to call from on_commit hooks."""
+    return counters.incr(
+        VERSION_KEY.format(user_id=user_id), timeout=VERSION_TTL, start=int(time.time() * 1000),
+    )
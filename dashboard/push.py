@@ -1,62 +1,295 @@
+"""Web Push delivery through the PushOutbox table.
+
+Request and signal code only queues notifications (``queue_push_to_user``,
+written once the surrounding transaction commits); ``manage.py
+push_worker`` claims due rows in batches, sends them from a thread pool,
+retries transient failures with backoff and deletes subscriptions the push
+service reports as gone (404/410).
+
+Rows for the same subscription claimed together are sent as one combined
+notification. Signed VAPID headers are reused per push-service origin
+until shortly before they expire, and each push-service host gets one
+pooled HTTP session.
+"""
 import json
 import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from itertools import islice
+from urllib.parse import urlsplit
 
 from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 60 * 60
+# Seconds to wait for the push service before treating the send as transient.
+SEND_TIMEOUT = 10
+# A row left 'sending' by a worker that died is requeued after this long.
+SENDING_TIMEOUT = timedelta(minutes=10)
+KEEP_FINISHED = timedelta(days=7)
+QUEUE_CHUNK_SIZE = 2000
+# Achievement pushes wait this long so the ones unlocked by the same save
+# are claimed together and sent as one notification.
+COALESCE_WINDOW = 5
+# VAPID JWTs are signed for 12 hours and re-signed an hour before expiry.
+VAPID_TTL = 12 * 60 * 60
+VAPID_RENEW_MARGIN = 60 * 60
+# Pooled connections kept per push-service host (match push_worker --threads).
+HTTP_POOL_SIZE = 16
+
+# deliver() outcomes
+SENT = 'sent'
+GONE = 'gone'
+RETRY = 'retry'
+FAILED = 'failed'
+
+
+def queue_push_to_user(user, title, body, url='/'):
+    """Queue a notification for each of the user's subscriptions on commit."""
+    from .models import NotificationPreference
+
+    prefs = NotificationPreference.objects.filter(user=user).first()
+    if prefs is not None and not prefs.achievement_notify:
+        return
+
+    user_id = user.pk
+    transaction.on_commit(lambda: _write_outbox(user_id, title, body, url))
+
+
+def _write_outbox(user_id, title, body, url):
+    from .models import PushSubscription
+
+    subscription_ids = PushSubscription.objects.filter(user_id=user_id).values_list('pk', flat=True)
+    queue_many(((pk, title, body, url) for pk in subscription_ids), delay=COALESCE_WINDOW)
+
+
+def queue_many(rows, chunk_size=QUEUE_CHUNK_SIZE, delay=0):
+    """Bulk-insert (subscription_id, title, body, url) rows; returns the count.
+
+    ``rows`` may be a lazy iterator: it is consumed ``chunk_size`` at a time.
+    """
+    from .models import PushOutbox
+
+    run_after = timezone.now() + timedelta(seconds=delay)
+    queued = 0
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        PushOutbox.objects.bulk_create([
+            PushOutbox(subscription_id=pk, title=title, body=body[:500], url=url, run_after=run_after)
+            for pk, title, body, url in chunk
+        ])
+        queued += len(chunk)
+    return queued
+
+
+def coalesce(items):
+    """Group claimed rows by subscription: [(message, rows)].
+
+    ``message`` is the row itself when alone, otherwise an unsaved row
+    carrying one combined title/body for the whole group.
+    """
+    from .models import PushOutbox
+
+    groups = {}
+    for item in items:
+        groups.setdefault(item.subscription_id, []).append(item)
+
+    merged = []
+    for group in groups.values():
+        if len(group) == 1:
+            merged.append((group[0], group))
+            continue
+        urls = {item.url for item in group}
+        message = PushOutbox(
+            subscription=group[0].subscription,
+            title=f'{group[0].title} ほか{len(group) - 1}件',
+            body='\n'.join(item.title for item in group)[:500],
+            url=urls.pop() if len(urls) == 1 else '/',
+        )
+        merged.append((message, group))
+    return merged
+
+
+_lock = threading.Lock()
+_vapid_key = None
+_vapid_headers = {}
+_http_sessions = {}
+
+
+def _vapid(private_key):
+    """Parsed VAPID key, loaded once per process."""
+    global _vapid_key
+    from py_vapid import Vapid
+
+    with _lock:
+        if _vapid_key is None or _vapid_key[0] != private_key:
+            _vapid_key = (private_key, Vapid.from_string(private_key=private_key))
+        return _vapid_key[1]
+
 
-def send_push_notification(subscription, title, body, url='/'):
-    """Send a push notification to a single subscription."""
+def _origin(endpoint):
+    parts = urlsplit(endpoint)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+def vapid_headers(endpoint, private_key, email):
+    """Signed VAPID Authorization headers for the endpoint's push service, cached."""
+    origin = _origin(endpoint)
+    now = time.time()
+    cached = _vapid_headers.get(origin)
+    if cached is not None and cached[1] - VAPID_RENEW_MARGIN > now:
+        return cached[0]
+
+    expires = int(now) + VAPID_TTL
+    headers = _vapid(private_key).sign({'sub': f'mailto:{email}', 'aud': origin, 'exp': expires})
+    _vapid_headers[origin] = (headers, expires)
+    return headers
+
+
+def http_session(endpoint):
+    """A requests session per push-service host, reusing its connections."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    host = urlsplit(endpoint).netloc
+    session = _http_sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _http_sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_sessions[host] = session
+    return session
+
+
+def deliver(item):
+    """Send one outbox row. Returns (outcome, error text)."""
     try:
         from pywebpush import webpush, WebPushException
     except ImportError:
-        logger.warning('pywebpush not installed')
-        return False
+        return FAILED, 'pywebpush not installed'
 
     vapid_private = getattr(settings, 'VAPID_PRIVATE_KEY', '')
     vapid_email = getattr(settings, 'VAPID_ADMIN_EMAIL', '')
-
     if not vapid_private or not vapid_email:
-        return False
-
-    payload = json.dumps({
-        'title': title,
-        'body': body,
-        'url': url,
-    })
+        return FAILED, 'VAPID keys are not configured'
 
+    payload = json.dumps({'title': item.title, 'body': item.body, 'url': item.url})
+    endpoint = item.subscription.endpoint
     try:
         webpush(
-            subscription_info=subscription.to_webpush_dict(),
+            subscription_info=item.subscription.to_webpush_dict(),
             data=payload,
-            vapid_private_key=vapid_private,
-            vapid_claims={'sub': f'mailto:{vapid_email}'},
+            headers=vapid_headers(endpoint, vapid_private, vapid_email),
+            timeout=SEND_TIMEOUT,
+            requests_session=http_session(endpoint),
         )
-        return True
     except WebPushException as e:
-        if e.response and e.response.status_code in (404, 410):
-            subscription.delete()
-            logger.info(f'Removed stale push subscription: {subscription.endpoint[:50]}')
-        else:
-            logger.error(f'Push notification error: {e}')
-        return False
+        # A requests.Response is falsy for error statuses: compare with None.
+        status = e.response.status_code if e.response is not None else None
+        if status in (404, 410):
+            return GONE, f'HTTP {status}'
+        if status is None or status == 429 or status >= 500:
+            return RETRY, str(e)
+        return FAILED, str(e)
     except Exception as e:
-        logger.error(f'Push notification error: {e}')
-        return False
+        # Connection errors and timeouts.
+        return RETRY, f'{type(e).__name__}: {e}'
+    return SENT, ''
 
 
-def send_push_to_user(user, title, body, url='/'):
-    """Send push notification to all of a user's subscriptions."""
-    from .models import PushSubscription, NotificationPreference
+def retry_delay(attempts):
+    """Jittered exponential backoff after ``attempts`` failed sends."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
 
-    try:
-        prefs = NotificationPreference.objects.get(user=user)
-        if not prefs.achievement_notify:
-            return
-    except NotificationPreference.DoesNotExist:
-        pass
-
-    subscriptions = PushSubscription.objects.filter(user=user)
-    for sub in subscriptions:
-        send_push_notification(sub, title, body, url)
+
+def claim_batch(size):
+    """Mark up to ``size`` due rows as sending and return them.
+
+    On PostgreSQL, rows locked by another worker are skipped.
+    """
+    from .models import PushOutbox
+
+    now = timezone.now()
+    with transaction.atomic():
+        due = PushOutbox.objects.filter(status='pending', run_after__lte=now)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True, of=('self',))
+        items = list(due.select_related('subscription').order_by('run_after', 'id')[:size])
+        for item in items:
+            item.status = 'sending'
+            item.attempts += 1
+            item.started_at = now
+        PushOutbox.objects.bulk_update(items, ['status', 'attempts', 'started_at'])
+    return items
+
+
+def process_batch(items, pool, send=deliver):
+    """Send claimed rows concurrently and record the outcomes in bulk.
+
+    Rows for the same subscription are sent as one notification and share
+    its outcome. Returns a dict counting each outcome per row.
+    """
+    from .models import PushOutbox, PushSubscription
+
+    counts = {SENT: 0, GONE: 0, RETRY: 0, FAILED: 0}
+    if not items:
+        return counts
+
+    now = timezone.now()
+    gone = set()
+    messages = coalesce(items)
+    for (_, group), (outcome, error) in zip(messages, pool.map(send, [m for m, _ in messages])):
+        for item in group:
+            item_outcome = outcome
+            item.last_error = error
+            if outcome == SENT:
+                item.status = 'sent'
+                item.sent_at = now
+            elif outcome == GONE:
+                gone.add(item.subscription_id)
+            elif outcome == RETRY and item.attempts < MAX_ATTEMPTS:
+                item.status = 'pending'
+                item.run_after = now + timedelta(seconds=retry_delay(item.attempts))
+            else:
+                item_outcome = FAILED
+                item.status = 'failed'
+            counts[item_outcome] += 1
+
+    PushOutbox.objects.bulk_update(
+        [item for item in items if item.subscription_id not in gone],
+        ['status', 'run_after', 'sent_at', 'last_error'],
+    )
+    if gone:
+        # Cascades to the subscriptions' remaining outbox rows.
+        PushSubscription.objects.filter(pk__in=gone).delete()
+        logger.info('Removed %s stale push subscriptions', len(gone))
+    return counts
+
+
+def requeue_abandoned():
+    from .models import PushOutbox
+
+    return PushOutbox.objects.filter(
+        status='sending', started_at__lt=timezone.now() - SENDING_TIMEOUT,
+    ).update(status='pending', run_after=timezone.now())
+
+
+def purge_finished():
+    from .models import PushOutbox
+
+    deleted, _ = PushOutbox.objects.filter(
+        status__in=['sent', 'failed'], created_at__lt=timezone.now() - KEEP_FINISHED,
+    ).delete()
+    return deleted
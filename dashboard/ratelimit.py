@@ -0,0 +1,127 @@
+"""Sliding-window rate limits kept as counter rows (RateLimitCounter).
+
+Each rule is (limit, window seconds). A window's count lives in one row,
+bumped with ``UPDATE ... SET count = count + 1`` so concurrent requests
+never lose an increment, and the estimate weights the previous window by
+how much of it still overlaps the sliding window. Checking a quota is a
+few single-row queries per rule, independent of how many messages exist.
+Expired rows are deleted by ``purge_expired()`` (run from ``run_jobs``).
+
+Quotas are configured in ``settings.RATE_LIMITS``::
+
+    RATE_LIMITS = {'chat': {'user': (10, 60), 'global': (1400, 86400)}}
+"""
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+KEY_PREFIX = 'ratelimit'
+
+
+class Quota:
+    """Outcome of a rate-limit check, for the view and its response headers."""
+
+    def __init__(self, allowed, rule, limit, remaining, reset):
+        self.allowed = allowed
+        self.rule = rule          # 'user' / 'global'; the rule that denied or is closest to it
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset        # seconds until the current window ends
+
+    def __bool__(self):
+        return self.allowed
+
+    def __repr__(self):
+        return f'<Quota {self.rule} {self.remaining}/{self.limit} allowed={self.allowed}>'
+
+
+def _key(scope, rule, ident, window_index):
+    return f'{KEY_PREFIX}:{scope}:{rule}:{ident}:{window_index}'
+
+
+def _bump(key, ttl):
+    """Increment ``key``'s row and return its count (created at 1)."""
+    from .models import RateLimitCounter
+
+    rows = RateLimitCounter.objects.filter(key=key)
+    with transaction.atomic():
+        # The updated row stays locked until commit, so the read sees our count.
+        if not rows.update(count=F('count') + 1):
+            try:
+                with transaction.atomic():
+                    RateLimitCounter.objects.create(
+                        key=key, count=1, expires_at=timezone.now() + timedelta(seconds=ttl),
+                    )
+                return 1
+            except IntegrityError:
+                # Created by a concurrent request in the meantime.
+                rows.update(count=F('count') + 1)
+        return rows.values_list('count', flat=True).get()
+
+
+def _count(key):
+    from .models import RateLimitCounter
+
+    return RateLimitCounter.objects.filter(key=key).values_list('count', flat=True).first() or 0
+
+
+def _check_rule(scope, rule, ident, limit, window, now):
+    window_index = int(now // window)
+    elapsed = now - window_index * window
+    key = _key(scope, rule, ident, window_index)
+    current = _bump(key, window * 2)
+    previous = _count(_key(scope, rule, ident, window_index - 1))
+    estimate = previous * (window - elapsed) / window + current
+    reset = math.ceil(window - elapsed)
+    return key, estimate <= limit, max(0, math.floor(limit - estimate)), reset
+
+
+def hit(scope, user_id, now=None, rules=None):
+    """Count one request against ``scope``'s quotas and return a Quota.
+
+    ``rules`` restricts the check to some of the scope's rules (e.g.
+    ``('global',)``). A denied request is not counted, so retrying after
+    the wait succeeds.
+    """
+    from .models import RateLimitCounter
+
+    configured = settings.RATE_LIMITS.get(scope, {})
+    now = time.time() if now is None else now
+    counted = []
+    tightest = None
+    for rule, (limit, window) in configured.items():
+        if rules is not None and rule not in rules:
+            continue
+        ident = user_id if rule == 'user' else 'all'
+        key, allowed, remaining, reset = _check_rule(scope, rule, ident, limit, window, now)
+        counted.append(key)
+        if not allowed:
+            RateLimitCounter.objects.filter(key__in=counted).update(count=F('count') - 1)
+            return Quota(False, rule, limit, 0, reset)
+        if tightest is None or remaining < tightest.remaining:
+            tightest = Quota(True, rule, limit, remaining, reset)
+    return tightest or Quota(True, '', 0, 0, 0)
+
+
+def purge_expired():
+    from .models import RateLimitCounter
+
+    deleted, _ = RateLimitCounter.objects.filter(expires_at__lt=timezone.now()).delete()
+    return deleted
+
+
+def apply_headers(response, quota):
+    """Expose the remaining quota (and Retry-After when denied) on ``response``."""
+    if quota is None or not quota.limit:
+        return response
+    response['X-RateLimit-Limit'] = str(quota.limit)
+    response['X-RateLimit-Remaining'] = str(quota.remaining)
+    response['X-RateLimit-Reset'] = str(quota.reset)
+    if not quota.allowed:
+        response['Retry-After'] = str(quota.reset)
+    return response
@@ -0,0 +1,215 @@
+"""Per-user reminder schedule (ReminderSchedule rows, one per pending reminder).
+
+Fire times are computed in each user's own timezone and kept current by
+signals: a practice session moves the user's streak reminder to the
+evening after their latest practice day, a live event gets a reminder on
+the evening before it, and preference changes reschedule the user.
+``fire_due()`` (run by ``manage.py send_reminders``) then only reads rows
+whose fire time has passed.
+"""
+from datetime import datetime, time as dt_time, timedelta
+from functools import cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .push import queue_many
+
+# Local hour at which each reminder fires.
+STREAK_HOUR = 20
+LIVE_HOUR = 18
+# Reminders overdue by more than this (e.g. the worker was down) are dropped.
+MAX_LATENESS = timedelta(hours=3)
+
+STREAK_TITLE = 'ストリークを守ろう！'
+STREAK_BODY = '昨日も練習してましたね。今日も少しだけ弾いてストリークを維持しましょう。'
+LIVE_TITLE = '明日はライブ！'
+
+
+@cache
+def timezone_choices():
+    return sorted(available_timezones())
+
+
+def user_timezone(name):
+    try:
+        return ZoneInfo(name or settings.TIME_ZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(settings.TIME_ZONE)
+
+
+def _fire_at(day, hour, tz):
+    return datetime.combine(day, dt_time(hour), tzinfo=tz)
+
+
+def streak_fire_at(last_practice, tz):
+    """The evening after the local day of ``last_practice``."""
+    day = last_practice.astimezone(tz).date() + timedelta(days=1)
+    return _fire_at(day, STREAK_HOUR, tz)
+
+
+def live_fire_at(event_date, tz):
+    return _fire_at(event_date - timedelta(days=1), LIVE_HOUR, tz)
+
+
+def _preferences(user_id):
+    from .models import NotificationPreference
+
+    prefs = NotificationPreference.objects.filter(user_id=user_id).first()
+    if prefs is None:
+        return True, True, user_timezone('')
+    return prefs.practice_reminder, prefs.live_reminder, user_timezone(prefs.timezone)
+
+
+def _store(user_id, kind, object_id, fire_at):
+    from .models import ReminderSchedule
+
+    rows = ReminderSchedule.objects.filter(user_id=user_id, kind=kind, object_id=object_id)
+    if fire_at is None or fire_at <= timezone.now():
+        rows.delete()
+    elif not rows.update(fire_at=fire_at):
+        ReminderSchedule.objects.create(user_id=user_id, kind=kind, object_id=object_id, fire_at=fire_at)
+
+
+def schedule_streak(user_id, prefs=None):
+    from guitarlog.models import PracticeSession
+
+    practice_on, _, tz = prefs or _preferences(user_id)
+    fire_at = None
+    if practice_on:
+        last = (
+            PracticeSession.objects.filter(user_id=user_id)
+            .aggregate(last=Max('started_at'))['last']
+        )
+        if last is not None:
+            fire_at = streak_fire_at(last, tz)
+    _store(user_id, 'streak', 0, fire_at)
+
+
+def schedule_live(user_id, event_id, event_date, prefs=None):
+    _, live_on, tz = prefs or _preferences(user_id)
+    _store(user_id, 'live', event_id, live_fire_at(event_date, tz) if live_on else None)
+
+
+def unschedule_live(user_id, event_id):
+    _store(user_id, 'live', event_id, None)
+
+
+def schedule_user(user_id):
+    """Recompute every reminder of one user (after a preference change)."""
+    from livelog.models import LiveEvent
+
+    prefs = _preferences(user_id)
+    schedule_streak(user_id, prefs)
+    upcoming = LiveEvent.objects.filter(user_id=user_id, date__gte=timezone.localdate() - timedelta(days=1))
+    for event_id, event_date in upcoming.values_list('pk', 'date'):
+        schedule_live(user_id, event_id, event_date, prefs)
+
+
+def on_commit(func, *args):
+    """Run a scheduling function once the current transaction commits."""
+    transaction.on_commit(lambda: func(*args))
+
+
+def rebuild_schedule(chunk_size=2000):
+    """Recompute all rows from scratch in a few set-based queries (backfill)."""
+    from guitarlog.models import PracticeSession
+    from livelog.models import LiveEvent
+    from .models import NotificationPreference, ReminderSchedule
+
+    now = timezone.now()
+    prefs = {
+        user_id: (practice_on, live_on, user_timezone(tz))
+        for user_id, practice_on, live_on, tz in NotificationPreference.objects.values_list(
+            'user_id', 'practice_reminder', 'live_reminder', 'timezone',
+        )
+    }
+    default = (True, True, user_timezone(''))
+
+    def rows():
+        last_practice = (
+            PracticeSession.objects.filter(started_at__gte=now - timedelta(days=2))
+            .values('user_id').annotate(last=Max('started_at')).order_by()
+            .values_list('user_id', 'last')
+        )
+        for user_id, last in last_practice.iterator(chunk_size=chunk_size):
+            practice_on, _, tz = prefs.get(user_id, default)
+            if practice_on:
+                yield ReminderSchedule(user_id=user_id, kind='streak', fire_at=streak_fire_at(last, tz))
+        events = LiveEvent.objects.filter(date__gte=timezone.localdate() - timedelta(days=1)).values_list(
+            'pk', 'user_id', 'date',
+        )
+        for event_id, user_id, event_date in events.iterator(chunk_size=chunk_size):
+            _, live_on, tz = prefs.get(user_id, default)
+            if live_on:
+                yield ReminderSchedule(
+                    user_id=user_id, kind='live', object_id=event_id,
+                    fire_at=live_fire_at(event_date, tz),
+                )
+
+    created = 0
+    with transaction.atomic():
+        ReminderSchedule.objects.all().delete()
+        batch = []
+        for row in rows():
+            if row.fire_at > now:
+                batch.append(row)
+            if len(batch) >= chunk_size:
+                ReminderSchedule.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        ReminderSchedule.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def fire_due(now=None, batch_size=1000, dry_run=False):
+    """Queue pushes for one batch of due reminders and delete their rows.
+
+    Returns (reminders fired, pushes queued, overdue reminders dropped).
+    With ``dry_run`` nothing is written and only the due rows are counted.
+    """
+    from livelog.models import LiveEvent
+    from .models import PushSubscription, ReminderSchedule
+
+    now = now or timezone.now()
+    due = ReminderSchedule.objects.filter(fire_at__lte=now)
+    if dry_run:
+        return due.count(), 0, 0
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        claimed = list(due.order_by('fire_at')[:batch_size])
+        if not claimed:
+            return 0, 0, 0
+        ReminderSchedule.objects.filter(pk__in=[r.pk for r in claimed]).delete()
+
+        fresh = [r for r in claimed if now - r.fire_at <= MAX_LATENESS]
+        events = LiveEvent.objects.in_bulk([r.object_id for r in fresh if r.kind == 'live'])
+        subscriptions = {}
+        for pk, user_id in PushSubscription.objects.filter(
+            user_id__in={r.user_id for r in fresh},
+        ).values_list('pk', 'user_id'):
+            subscriptions.setdefault(user_id, []).append(pk)
+
+        def rows():
+            for reminder in fresh:
+                if reminder.kind == 'streak':
+                    message = (STREAK_TITLE, STREAK_BODY, '/practice/')
+                else:
+                    event = events.get(reminder.object_id)
+                    if event is None:
+                        continue
+                    message = (
+                        LIVE_TITLE, f'{event.artist} のライブが明日です。楽しんできてください！',
+                        f'/live/{event.pk}/',
+                    )
+                for subscription_id in subscriptions.get(reminder.user_id, ()):
+                    yield (subscription_id, *message)
+
+        queued = queue_many(rows())
+    return len(fresh), queued, len(claimed) - len(fresh)
@@ -0,0 +1,293 @@
+import re
+import unicodedata
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+)
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+SEARCH_LIMIT = 40
+SNIPPET_CHARS = 80
+REINDEX_BATCH_SIZE = 500
+
+# Kana, CJK ideographs and half-width katakana: scripts written without spaces.
+_CJK = (
+    '\u3005\u3006\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff'
+    '\uf900-\ufaff\uff66-\uff9f'
+)
+_TOKEN_RE = re.compile(rf'(?P<cjk>[{_CJK}]+)|(?P<word>[^\W{_CJK}]+)')
+
+# 'simple' config: no stemming or stop words, so bigrams survive untouched.
+SEARCH_CONFIG = 'simple'
+SEARCH_VECTOR = (
+    SearchVector('title_terms', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('content_terms', weight='B', config=SEARCH_CONFIG)
+)
+
+
+# ──────────────────────────────────────
+# Tokenising
+# ──────────────────────────────────────
+
+def normalize(text):
+    """NFKC + lowercase, so full-width ASCII and half-width kana compare equal."""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def ngram_terms(text):
+    """Split text into index terms.
+
+    Latin words are kept whole; runs of Japanese are expanded into
+    overlapping bigrams (a single character stays a unigram), which lets a
+    phrase query match any substring of two or more characters.
+    """
+    terms = []
+    for match in _TOKEN_RE.finditer(normalize(text)):
+        run = match.group('cjk')
+        if run is None:
+            terms.append(match.group('word'))
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def query_words(q):
+    """Whitespace-separated query words; every word must match."""
+    return [w for w in normalize(q).split() if _TOKEN_RE.search(w)]
+
+
+# ──────────────────────────────────────
+# Indexing
+# ──────────────────────────────────────
+
+def _join(*parts):
+    return '\n'.join(p for p in parts if p)
+
+
+def _describe_song(song):
+    return song.user_id, 'song', song.title, song.artist
+
+
+def _describe_event(event):
+    return event.user_id, 'event', event.artist, _join(event.title, event.venue)
+
+
+def _describe_project(project):
+    return project.user_id, 'project', project.title, _join(project.description, project.tags)
+
+
+SEARCH_SOURCES = {
+    'guitarlog.PracticeSong': _describe_song,
+    'livelog.LiveEvent': _describe_event,
+    'songdiary.Project': _describe_project,
+}
+
+# SearchDocument.kind -> source model label, for loading hits back.
+KIND_SOURCES = {
+    'song': 'guitarlog.PracticeSong',
+    'event': 'livelog.LiveEvent',
+    'project': 'songdiary.Project',
+}
+SOURCE_KINDS = {label: kind for kind, label in KIND_SOURCES.items()}
+
+
+def _uses_postgres(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def _build_document(instance):
+    from .models import SearchDocument
+
+    user_id, kind, title, content = SEARCH_SOURCES[instance._meta.label](instance)
+    return SearchDocument(
+        user_id=user_id,
+        kind=kind,
+        object_id=instance.pk,
+        title=title[:300],
+        content=content,
+        title_terms=' '.join(ngram_terms(title)),
+        content_terms=' '.join(ngram_terms(content)),
+    )
+
+
+def index_instance(instance):
+    """Create or refresh the SearchDocument for a saved source row."""
+    from .models import SearchDocument
+
+    doc = _build_document(instance)
+    with transaction.atomic():
+        doc, _ = SearchDocument.objects.update_or_create(
+            kind=doc.kind, object_id=doc.object_id,
+            defaults={
+                'user_id': doc.user_id,
+                'title': doc.title,
+                'content': doc.content,
+                'title_terms': doc.title_terms,
+                'content_terms': doc.content_terms,
+            },
+        )
+        if _uses_postgres():
+            SearchDocument.objects.filter(pk=doc.pk).update(search_vector=SEARCH_VECTOR)
+    return doc
+
+
+def remove_instance(instance):
+    from .models import SearchDocument
+
+    SearchDocument.objects.filter(
+        kind=SOURCE_KINDS[instance._meta.label], object_id=instance.pk,
+    ).delete()
+
+
+def rebuild_search_index(labels=None, batch_size=REINDEX_BATCH_SIZE):
+    """Rebuild documents for the given source labels (all by default).
+
+    Returns the number of documents written.
+    """
+    from django.apps import apps
+    from .models import SearchDocument
+
+    written = 0
+    for label in labels or SEARCH_SOURCES:
+        model = apps.get_model(label)
+        kind = SOURCE_KINDS[label]
+        with transaction.atomic():
+            SearchDocument.objects.filter(kind=kind).delete()
+            batch = []
+            for instance in model.objects.order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(_build_document(instance))
+                if len(batch) >= batch_size:
+                    SearchDocument.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                SearchDocument.objects.bulk_create(batch)
+                written += len(batch)
+            if _uses_postgres():
+                SearchDocument.objects.filter(kind=kind).update(search_vector=SEARCH_VECTOR)
+    return written
+
+
+# ──────────────────────────────────────
+# Querying
+# ──────────────────────────────────────
+
+def _postgres_hits(docs, q, words, limit):
+    query = None
+    short_words = Q()
+    for word in words:
+        terms = ngram_terms(word)
+        if len(terms) == 1 and len(terms[0]) == 1:
+            # A lone kana/kanji is not in the bigram index.
+            short_words &= Q(title__icontains=word) | Q(content__icontains=word)
+            continue
+        part = SearchQuery(' '.join(terms), search_type='phrase', config=SEARCH_CONFIG)
+        query = part if query is None else query & part
+
+    matched = short_words
+    rank = TrigramSimilarity('title', q)
+    if query is not None:
+        matched &= Q(search_vector=query)
+        rank = rank + SearchRank(F('search_vector'), query)
+    # Trigram similarity on titles also catches near-miss spellings.
+    matched |= Q(title__trigram_similar=q)
+
+    return list(
+        docs.filter(matched).annotate(rank=rank).order_by('-rank', '-updated_at')[:limit]
+    )
+
+
+def _fallback_hits(docs, words, limit):
+    """Substring match for non-PostgreSQL databases (development/tests)."""
+    for word in words:
+        docs = docs.filter(Q(title__icontains=word) | Q(content__icontains=word))
+    hits = list(docs.order_by('-updated_at')[:limit * 5])
+    for hit in hits:
+        title, content = normalize(hit.title), normalize(hit.content)
+        hit.rank = sum(2 * title.count(w) + content.count(w) for w in words)
+    hits.sort(key=lambda h: h.rank, reverse=True)
+    return hits[:limit]
+
+
+def highlight(text, words, width=SNIPPET_CHARS):
+    """Escaped excerpt of ``text`` around the first match, matches in <mark>."""
+    text = ' '.join((text or '').split())
+    if not words:
+        return escape(text[:width])
+    pattern = re.compile(
+        '|'.join(re.escape(w) for w in sorted(set(words), key=len, reverse=True)),
+        re.IGNORECASE,
+    )
+    first = pattern.search(text)
+    start = max(0, (first.start() if first else 0) - width // 4)
+    end = start + width
+    excerpt = text[start:end]
+
+    parts = []
+    pos = 0
+    for match in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[pos:match.start()]))
+        parts.append(f'<mark>{escape(match.group())}</mark>')
+        pos = match.end()
+    parts.append(escape(excerpt[pos:]))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return mark_safe(prefix + ''.join(parts) + suffix)
+
+
+def search(user, q, limit=SEARCH_LIMIT):
+    """Return ranked SearchDocuments visible to ``user`` with a ``snippet`` each."""
+    from .models import SearchDocument
+
+    words = query_words(q)
+    if not words:
+        return []
+
+    docs = SearchDocument.objects.filter(user=user)
+    if _uses_postgres(docs.db):
+        hits = _postgres_hits(docs, normalize(q), words, limit)
+    else:
+        hits = _fallback_hits(docs, words, limit)
+
+    for hit in hits:
+        hit.snippet = highlight(hit.content, words)
+    return hits
+
+
+def grouped_results(user, q, limit=SEARCH_LIMIT):
+    """Ranked hits loaded back into their models and grouped by kind.
+
+    Each object gets ``search_rank`` and ``search_snippet`` attributes. One
+    query per kind that actually has hits, on top of the search itself.
+    Theory topics come from the in-memory corpus index instead.
+    """
+    from django.apps import apps
+    from music_theory.corpus import search_topics
+
+    hits = search(user, q, limit)
+    grouped = {kind: [] for kind in KIND_SOURCES}
+    by_kind = {}
+    for hit in hits:
+        by_kind.setdefault(hit.kind, []).append(hit)
+
+    for kind, kind_hits in by_kind.items():
+        model = apps.get_model(KIND_SOURCES[kind])
+        objects = model.objects.in_bulk([h.object_id for h in kind_hits])
+        for hit in kind_hits:
+            obj = objects.get(hit.object_id)
+            if obj is None:
+                continue
+            obj.search_rank = hit.rank
+            obj.search_snippet = hit.snippet
+            grouped[kind].append(obj)
+
+    words = query_words(q)
+    grouped['topic'] = search_topics(q, limit=limit)
+    for topic in grouped['topic']:
+        topic.search_snippet = highlight(_join(topic.summary, topic.body), words)
+    return grouped
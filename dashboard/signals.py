@@ -1,6 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 
+from .activity import ROLLUP_SOURCES, activity_day, schedule_refresh
+from .feed import FEED_SOURCES
+from .search import SEARCH_SOURCES
+
 
 def _award_if_not_exists(user, slug):
     """Award an achievement if the user doesn't already have it."""
@@ -13,19 +17,27 @@ def _award_if_not_exists(user, slug):
         user=user, achievement=defn,
     )
     if created:
-        try:
-            from .push import send_push_to_user
-            send_push_to_user(
-                user,
-                f'実績解除: {defn.name}',
-                defn.description,
-                '/achievements/',
-            )
-        except Exception:
-            pass
+        from .push import queue_push_to_user
+        queue_push_to_user(
+            user,
+            f'実績解除: {defn.name}',
+            defn.description,
+            '/achievements/',
+        )
     return achievement if created else None
 
 
+@receiver(post_save, sender='dashboard.UserAchievement')
+def publish_new_achievement(sender, instance, created, raw=False, **kwargs):
+    """Bump the user's achievement version once the row is committed."""
+    if raw or not created or instance.notified:
+        return
+    from django.db import transaction
+    from .notifier import publish_achievement
+    user_id = instance.user_id
+    transaction.on_commit(lambda: publish_achievement(user_id))
+
+
 def _check_all_rounder(user):
     """Award 'all_rounder' if user has activity in all three areas."""
     from guitarlog.models import PracticeSession
@@ -40,6 +52,27 @@ def _check_all_rounder(user):
         _award_if_not_exists(user, 'all_rounder')
 
 
+@receiver(post_save, sender='guitarlog.PracticeSession')
+def update_practice_streak(sender, instance, created, raw=False, **kwargs):
+    """Keep PracticeStreak current. Connected before the achievement check below."""
+    if raw:
+        return
+    from guitarlog.streaks import record_practice_day, recompute_streak
+
+    day = activity_day(instance.started_at)
+    previous_day = getattr(instance, '_previous_activity_day', None)
+    if created:
+        record_practice_day(instance.user_id, day)
+    elif previous_day is not None and previous_day != day:
+        recompute_streak(instance.user_id)
+
+
+@receiver(post_delete, sender='guitarlog.PracticeSession')
+def shrink_practice_streak(sender, instance, **kwargs):
+    from guitarlog.streaks import remove_practice_day
+    remove_practice_day(instance.user_id, activity_day(instance.started_at))
+
+
 @receiver(post_save, sender='guitarlog.PracticeSession')
 def check_practice_achievements(sender, instance, created, **kwargs):
     if not created:
@@ -85,3 +118,149 @@ def check_compose_achievements(sender, instance, created, **kwargs):
     if instance.status == 'done':
         _award_if_not_exists(user, 'compose_done')
     _check_all_rounder(user)
+
+
+# ──────────────────────────────────────
+# Daily Activity Rollup
+# ──────────────────────────────────────
+
+def _remember_activity_day(sender, instance, raw=False, **kwargs):
+    """Remember which day an existing row counted for before it changes."""
+    if raw or instance.pk is None:
+        return
+    field = ROLLUP_SOURCES[sender._meta.label]
+    old_value = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list(field, flat=True).first()
+    )
+    instance._previous_activity_day = activity_day(old_value)
+
+
+def _refresh_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    field = ROLLUP_SOURCES[sender._meta.label]
+    schedule_refresh(
+        instance.user_id,
+        activity_day(getattr(instance, field)),
+        getattr(instance, '_previous_activity_day', None),
+    )
+
+
+def _refresh_rollup_on_delete(sender, instance, **kwargs):
+    field = ROLLUP_SOURCES[sender._meta.label]
+    schedule_refresh(instance.user_id, activity_day(getattr(instance, field)))
+
+
+for _label in ROLLUP_SOURCES:
+    pre_save.connect(_remember_activity_day, sender=_label, dispatch_uid=f'rollup_pre_save_{_label}')
+    post_save.connect(_refresh_rollup_on_save, sender=_label, dispatch_uid=f'rollup_post_save_{_label}')
+    post_delete.connect(_refresh_rollup_on_delete, sender=_label, dispatch_uid=f'rollup_post_delete_{_label}')
+
+
+# ──────────────────────────────────────
+# Activity Feed
+# ──────────────────────────────────────
+
+def _append_activity(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    from .feed import record_activity
+    record_activity(instance, created, update_fields)
+
+
+for _label in FEED_SOURCES:
+    post_save.connect(_append_activity, sender=_label, dispatch_uid=f'feed_post_save_{_label}')
+
+
+# ──────────────────────────────────────
+# Global Search Index
+# ──────────────────────────────────────
+
+def _index_for_search(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .search import index_instance
+    index_instance(instance)
+
+
+def _unindex_for_search(sender, instance, **kwargs):
+    from .search import remove_instance
+    remove_instance(instance)
+
+
+for _label in SEARCH_SOURCES:
+    post_save.connect(_index_for_search, sender=_label, dispatch_uid=f'search_post_save_{_label}')
+    post_delete.connect(_unindex_for_search, sender=_label, dispatch_uid=f'search_post_delete_{_label}')
+
+
+# ──────────────────────────────────────
+# Reminder Schedule
+# ──────────────────────────────────────
+
+@receiver(post_save, sender='guitarlog.PracticeSession')
+@receiver(post_delete, sender='guitarlog.PracticeSession')
+def reschedule_streak_reminder(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .reminders import on_commit, schedule_streak
+    on_commit(schedule_streak, instance.user_id)
+
+
+@receiver(post_save, sender='livelog.LiveEvent')
+def reschedule_live_reminder(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .reminders import on_commit, schedule_live
+    on_commit(schedule_live, instance.user_id, instance.pk, instance.date)
+
+
+@receiver(post_delete, sender='livelog.LiveEvent')
+def unschedule_live_reminder(sender, instance, **kwargs):
+    from .reminders import on_commit, unschedule_live
+    on_commit(unschedule_live, instance.user_id, instance.pk)
+
+
+@receiver(post_save, sender='dashboard.NotificationPreference')
+def reschedule_user_reminders(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .reminders import on_commit, schedule_user
+    on_commit(schedule_user, instance.user_id)
+
+
+
+# ──────────────────────────────────────
+# Artwork Mirror
+# ──────────────────────────────────────
+
+@receiver(post_save, sender='guitarlog.PracticeSong')
+@receiver(post_save, sender='livelog.LiveEvent')
+def warm_artwork(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    url = getattr(instance, 'album_art_url', None) or getattr(instance, 'artist_image_url', '')
+    if url:
+        from django.db import transaction
+        from .images import warm_later
+        transaction.on_commit(lambda: warm_later(url))
+
+
+# ──────────────────────────────────────
+# Uploaded Images
+# ──────────────────────────────────────
+
+@receiver(post_save, sender='livelog.LiveEvent')
+@receiver(post_save, sender='accounts.CustomUser')
+@receiver(post_save, sender='songdiary.Memo')
+def process_uploaded_images(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    from django.db import transaction
+    from .uploads import UPLOAD_FIELDS, process_later
+    for label, field_name in UPLOAD_FIELDS:
+        if label != sender._meta.label or (update_fields is not None and field_name not in update_fields):
+            continue
+        file = getattr(instance, field_name)
+        if file:
+            transaction.on_commit(lambda file=file: process_later(file))
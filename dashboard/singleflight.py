@@ -0,0 +1,214 @@
+"""Collapse concurrent identical work into one call, across workers.
+
+The first caller for a key becomes the leader: it claims the key in the
+shared cache and publishes its result when done. Callers arriving while
+the flight is in the air wait for that result instead of repeating the
+(slow, paid) LLM call. A leader that fails publishes the failure, so its
+followers give up with it rather than all retrying at once. Followers poll
+with backoff and never wait longer than the timeout they pass; only a
+leader that vanished without publishing lets them run the work themselves.
+For that to happen the claim must expire before the followers give up, so
+long-running leaders take a short ``ttl`` and refresh() it as they go.
+"""
+import asyncio
+import time
+import uuid
+
+from django.core.cache import cache
+
+KEY_PREFIX = 'singleflight'
+# Upper bound for a claim nobody refreshes; callers whose followers wait
+# pass a ttl shorter than that wait.
+CLAIM_TTL = 120
+# Followers only need the result for as long as they are waiting.
+RESULT_TTL = 60
+# Followers poll the shared cache starting at POLL_INTERVAL and doubling
+# up to MAX_POLL_INTERVAL.
+POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 1.0
+
+
+class Failed(Exception):
+    """The leader reported a failure, or its result did not arrive in time."""
+
+
+def _claim_key(key):
+    return f'{KEY_PREFIX}:{key}'
+
+
+def _result_key(flight_id):
+    return f'{KEY_PREFIX}:result:{flight_id}'
+
+
+def _delays(timeout):
+    """Sleep intervals for a follower: backoff capped by the deadline."""
+    deadline = time.monotonic() + timeout
+    interval = POLL_INTERVAL
+    while (remaining := deadline - time.monotonic()) > 0:
+        yield min(interval, remaining)
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+
+def _outcome(found):
+    if found.get('failed'):
+        raise Failed('leader failed')
+    return found['value']
+
+
+class Flight:
+    def __init__(self, key, flight_id, leader):
+        self.key = key
+        self.id = flight_id
+        self.leader = leader
+        self.done = False
+
+    def finish(self, value):
+        """Publish the leader's result and release the key."""
+        cache.set(_result_key(self.id), {'value': value}, RESULT_TTL)
+        self.done = True
+        self.release()
+
+    def fail(self):
+        """Publish a failure so followers stop waiting, and release the key.
+
+        Does nothing once the flight has finished or failed, so cleanup
+        paths can call it unconditionally.
+        """
+        if self.done:
+            return
+        cache.set(_result_key(self.id), {'failed': True}, RESULT_TTL)
+        self.done = True
+        self.release()
+
+    def refresh(self, ttl):
+        """Extend the claim while the leader is still working."""
+        if cache.get(_claim_key(self.key)) == self.id:
+            cache.touch(_claim_key(self.key), ttl)
+
+    def release(self):
+        if cache.get(_claim_key(self.key)) == self.id:
+            cache.delete(_claim_key(self.key))
+
+    async def afinish(self, value):
+        await cache.aset(_result_key(self.id), {'value': value}, RESULT_TTL)
+        self.done = True
+        await self.arelease()
+
+    async def afail(self):
+        if self.done:
+            return
+        await cache.aset(_result_key(self.id), {'failed': True}, RESULT_TTL)
+        self.done = True
+        await self.arelease()
+
+    async def arefresh(self, ttl):
+        if await cache.aget(_claim_key(self.key)) == self.id:
+            await cache.atouch(_claim_key(self.key), ttl)
+
+    async def arelease(self):
+        if await cache.aget(_claim_key(self.key)) == self.id:
+            await cache.adelete(_claim_key(self.key))
+
+    def wait(self, timeout):
+        """Block for at most ``timeout`` seconds until the leader publishes.
+
+        Raises Failed if the leader failed or the time ran out. Returns None
+        if the leader went away without publishing (the caller may then do
+        the work itself).
+        """
+        for delay in _delays(timeout):
+            found = cache.get(_result_key(self.id))
+            if found is not None:
+                return _outcome(found)
+            if cache.get(_claim_key(self.key)) != self.id:
+                found = cache.get(_result_key(self.id))
+                return _outcome(found) if found is not None else None
+            time.sleep(delay)
+        raise Failed(f'no result within {timeout}s')
+
+    async def await_result(self, timeout):
+        """Async counterpart of wait()."""
+        for delay in _delays(timeout):
+            found = await cache.aget(_result_key(self.id))
+            if found is not None:
+                return _outcome(found)
+            if await cache.aget(_claim_key(self.key)) != self.id:
+                found = await cache.aget(_result_key(self.id))
+                return _outcome(found) if found is not None else None
+            await asyncio.sleep(delay)
+        raise Failed(f'no result within {timeout}s')
+
+    def __repr__(self):
+        return f'<Flight {self.key} {"leader" if self.leader else "follower"}>'
+
+
+def begin(key, ttl=CLAIM_TTL):
+    """Claim ``key`` (leader) or join the flight already holding it (follower)."""
+    flight_id = uuid.uuid4().hex
+    for _ in range(2):
+        if cache.add(_claim_key(key), flight_id, ttl):
+            return Flight(key, flight_id, leader=True)
+        current = cache.get(_claim_key(key))
+        if current is not None:
+            return Flight(key, current, leader=False)
+        # Released between add() and get(); try to claim it again.
+    return Flight(key, flight_id, leader=True)
+
+
+async def abegin(key, ttl=CLAIM_TTL):
+    flight_id = uuid.uuid4().hex
+    for _ in range(2):
+        if await cache.aadd(_claim_key(key), flight_id, ttl):
+            return Flight(key, flight_id, leader=True)
+        current = await cache.aget(_claim_key(key))
+        if current is not None:
+            return Flight(key, current, leader=False)
+    return Flight(key, flight_id, leader=True)
+
+
+def run(key, fn, timeout):
+    """Return ``fn()``, or the result of an identical call already running.
+
+    ``fn()`` returning None or raising counts as a failure: followers get
+    None back instead of retrying. Followers wait at most ``timeout``; the
+    claim lasts as long, so it lapses before any of them gives up and a
+    leader that died is replaced.
+    """
+    flight = begin(key, timeout)
+    if not flight.leader:
+        try:
+            value = flight.wait(timeout)
+        except Failed:
+            return None
+        return value if value is not None else fn()
+    try:
+        value = fn()
+    except BaseException:
+        flight.fail()
+        raise
+    if value is None:
+        flight.fail()
+    else:
+        flight.finish(value)
+    return value
+
+
+async def arun(key, fn, timeout):
+    """Async counterpart of run(); ``fn`` is a coroutine function."""
+    flight = await abegin(key, timeout)
+    if not flight.leader:
+        try:
+            value = await flight.await_result(timeout)
+        except Failed:
+            return None
+        return value if value is not None else await fn()
+    try:
+        value = await fn()
+    except BaseException:
+        await flight.afail()
+        raise
+    if value is None:
+        await flight.afail()
+    else:
+        await flight.afinish(value)
+    return value
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+RECENT_ACHIEVEMENT_LIMIT = 6
+
+
+def _count_subquery(queryset):
+    """Correlated COUNT(*) over ``queryset`` (already filtered on OuterRef('pk'))."""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values('user').annotate(c=Count('*')).values('c'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def dashboard_counts(user):
+    """Stat cards, total minutes and streak state in a single query."""
+    from django.contrib.auth import get_user_model
+    from music_theory.models import Bookmark
+    from livelog.models import LiveEvent
+    from songdiary.models import Project
+    from .models import UserDailyActivity
+
+    User = get_user_model()
+    total_minutes = (
+        UserDailyActivity.objects.filter(user=OuterRef('pk')).order_by()
+        .values('user').annotate(t=Sum('practice_minutes')).values('t')
+    )
+    return (
+        User.objects.filter(pk=user.pk)
+        .annotate(
+            bookmark_count=_count_subquery(Bookmark.objects.filter(user=OuterRef('pk'))),
+            live_count=_count_subquery(LiveEvent.objects.filter(user=OuterRef('pk'))),
+            project_count=_count_subquery(Project.objects.filter(user=OuterRef('pk'))),
+            total_minutes=Coalesce(
+                Subquery(total_minutes, output_field=IntegerField()), Value(0),
+            ),
+        )
+        .values(
+            'bookmark_count', 'live_count', 'project_count', 'total_minutes',
+            'practice_streak__id', 'practice_streak__current_streak',
+            'practice_streak__last_practice_date',
+        )
+        .get()
+    )
+
+
+def _streak_from_counts(user, counts, today):
+    from guitarlog.models import PracticeStreak
+    from guitarlog.streaks import get_current_streak
+
+    if counts['practice_streak__id'] is None:
+        # No stored state yet: initialise it once.
+        return get_current_streak(user, today)
+    return PracticeStreak(
+        current_streak=counts['practice_streak__current_streak'],
+        last_practice_date=counts['practice_streak__last_practice_date'],
+    ).current_as_of(today)
+
+
+def practice_week(user, today):
+    """7-day practice chart rows with bar heights, from the daily rollup."""
+    from .activity import get_daily_activity
+
+    start_date = today - timedelta(days=6)
+    daily_map = get_daily_activity(user, start_date, today)
+
+    week = []
+    max_minutes = 1  # avoid division by zero
+    for i in range(7):
+        d = start_date + timedelta(days=i)
+        row = daily_map.get(d)
+        minutes = row.practice_minutes if row else 0
+        max_minutes = max(max_minutes, minutes)
+        week.append({'label': d.strftime('%a'), 'minutes': minutes})
+    for day in week:
+        day['pct'] = round(day['minutes'] / max_minutes * 100)
+    return week
+
+
+def get_dashboard_snapshot(user):
+    """Everything the logged-in dashboard needs, in a fixed number of queries."""
+    from .feed import activity_page
+    from .models import UserAchievement
+
+    today = timezone.localdate()
+    counts = dashboard_counts(user)
+    activities, next_cursor = activity_page(user)
+
+    return {
+        'bookmark_count': counts['bookmark_count'],
+        'streak_count': _streak_from_counts(user, counts, today),
+        'live_count': counts['live_count'],
+        'project_count': counts['project_count'],
+        'activities': activities,
+        'next_cursor': next_cursor,
+        'practice_week': practice_week(user, today),
+        'total_minutes': counts['total_minutes'],
+        'recent_achievements': list(
+            UserAchievement.objects.filter(user=user)
+            .select_related('achievement')[:RECENT_ACHIEVEMENT_LIMIT]
+        ),
+    }
@@ -1,19 +1,171 @@
+"""Spotify Web API client (Client Credentials flow).
+
+Searches are answered from a process-local LRU, then from the shared cache
+(so every worker benefits), and only then from Spotify; identical searches
+already in flight in any worker share one outbound request. Requests reuse
+one pooled ``requests.Session`` per process, and the access token is
+refreshed by one thread at a time.
+"""
+import asyncio
+import hashlib
 import logging
+import re
+import threading
 import time
+import unicodedata
+import weakref
 
 from django.conf import settings
+from django.core.cache import cache
+
+from . import singleflight
+from .lru import LRUCache
 
 logger = logging.getLogger(__name__)
 
+CACHE_KEY_PREFIX = 'spotify:search'
+LOCAL_CACHE_SIZE = 1024
+# Local copies are kept shorter than the shared entry (SPOTIFY_CACHE_TTL).
+LOCAL_CACHE_TTL = 5 * 60
+HTTP_POOL_SIZE = 32
+REQUEST_TIMEOUT = 5
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class SpotifyRateLimited(Exception):
+    """Spotify answered 429; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'rate limited, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+_local_cache = LRUCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _parse_tracks(payload):
+    return [
+        {
+            'spotify_id': t['id'],
+            'title': t['name'],
+            'artist': ', '.join(a['name'] for a in t['artists']),
+            'album_art_url': t['album']['images'][0]['url'] if t['album']['images'] else '',
+        }
+        for t in payload.get('tracks', {}).get('items', [])
+    ]
+
+
+def _parse_artists(payload):
+    return [
+        {
+            'spotify_artist_id': a['id'],
+            'name': a['name'],
+            'image_url': a['images'][0]['url'] if a['images'] else '',
+            'genres': a.get('genres', [])[:3],
+        }
+        for a in payload.get('artists', {}).get('items', [])
+    ]
+
+
+PARSERS = {'track': _parse_tracks, 'artist': _parse_artists}
+
+
+def normalize_query(query):
+    """Width, case and whitespace differences hit the same cache entry."""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', query)).strip().casefold()
+
+
+def search_cache_key(search_type, query, limit):
+    digest = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+    return f'{CACHE_KEY_PREFIX}:{search_type}:{limit}:{digest}'
+
+
+def _count(field):
+    with _stats_lock:
+        _stats[field] += 1
+
+
+def cache_stats():
+    """This process's search cache counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache():
+    _local_cache.clear()
+    with _stats_lock:
+        for field in _stats:
+            _stats[field] = 0
+
+
+# ──────────────────────────────────────
+# Pooled session and token
+# ──────────────────────────────────────
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """The process-wide requests session (keep-alive connections to Spotify)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+class _Token:
+    """Access token shared by the process; one refresh at a time."""
+
+    def __init__(self):
+        self.value = None
+        self.expires = 0
+        self.lock = threading.Lock()
+        self._async_locks = weakref.WeakKeyDictionary()
+
+    def current(self):
+        if self.value and time.time() < self.expires:
+            return self.value
+        return None
+
+    def store(self, data):
+        self.expires = time.time() + data.get('expires_in', 3600) - 60
+        self.value = data['access_token']
+        return self.value
+
+    def async_lock(self):
+        loop = asyncio.get_running_loop()
+        lock = self._async_locks.get(loop)
+        if lock is None:
+            lock = self._async_locks[loop] = asyncio.Lock()
+        return lock
+
+
+_token = _Token()
+
 
 class SpotifyClient:
     """Spotify Web API client using Client Credentials flow."""
 
-    _token = None
-    _token_expires = 0
+    @property
+    def token_url(self):
+        return settings.SPOTIFY_TOKEN_URL
 
-    TOKEN_URL = 'https://accounts.spotify.com/api/token'
-    API_BASE = 'https://api.spotify.com/v1'
+    @property
+    def api_base(self):
+        return settings.SPOTIFY_API_BASE
 
     def is_available(self):
         return bool(
@@ -22,81 +174,170 @@ class SpotifyClient:
         )
 
     def _get_token(self):
-        if SpotifyClient._token and time.time() < SpotifyClient._token_expires:
-            return SpotifyClient._token
+        token = _token.current()
+        if token:
+            return token
 
-        import requests
+        with _token.lock:
+            # Another thread may have refreshed it while we waited.
+            token = _token.current()
+            if token:
+                return token
+            try:
+                resp = http_session().post(
+                    self.token_url,
+                    data={'grant_type': 'client_credentials'},
+                    auth=(settings.SPOTIFY_CLIENT_ID, settings.SPOTIFY_CLIENT_SECRET),
+                    timeout=REQUEST_TIMEOUT,
+                )
+                resp.raise_for_status()
+                return _token.store(resp.json())
+            except Exception as e:
+                logger.error(f'Spotify token error: {e}')
+                return None
 
-        try:
-            resp = requests.post(
-                self.TOKEN_URL,
-                data={'grant_type': 'client_credentials'},
-                auth=(settings.SPOTIFY_CLIENT_ID, settings.SPOTIFY_CLIENT_SECRET),
-                timeout=5,
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            SpotifyClient._token = data['access_token']
-            SpotifyClient._token_expires = time.time() + data.get('expires_in', 3600) - 60
-            return SpotifyClient._token
-        except Exception as e:
-            logger.error(f'Spotify token error: {e}')
-            return None
+    def fetch(self, query, search_type, limit=5):
+        """Parsed results straight from Spotify, bypassing the cache.
 
-    def search_tracks(self, query, limit=5):
+        Returns None on failure; raises SpotifyRateLimited on 429 so batch
+        callers can back off.
+        """
         token = self._get_token()
         if not token:
-            return []
-
-        import requests
+            return None
 
         try:
-            resp = requests.get(
-                f'{self.API_BASE}/search',
-                params={'q': query, 'type': 'track', 'limit': limit, 'market': 'JP'},
+            resp = http_session().get(
+                f'{self.api_base}/search',
+                params={'q': query, 'type': search_type, 'limit': limit, 'market': 'JP'},
                 headers={'Authorization': f'Bearer {token}'},
-                timeout=5,
+                timeout=REQUEST_TIMEOUT,
             )
+            if resp.status_code == 429:
+                raise SpotifyRateLimited(int(resp.headers.get('Retry-After', 1)))
             resp.raise_for_status()
-            tracks = resp.json().get('tracks', {}).get('items', [])
-            return [
-                {
-                    'spotify_id': t['id'],
-                    'title': t['name'],
-                    'artist': ', '.join(a['name'] for a in t['artists']),
-                    'album_art_url': t['album']['images'][0]['url'] if t['album']['images'] else '',
-                }
-                for t in tracks
-            ]
+            return PARSERS[search_type](resp.json())
+        except SpotifyRateLimited:
+            raise
         except Exception as e:
-            logger.error(f'Spotify track search error: {e}')
-            return []
+            logger.error(f'Spotify {search_type} search error: {e}')
+            return None
+
+    def _fetch(self, query, search_type, limit):
+        """fetch() for interactive searches: a 429 is just a failed search."""
+        try:
+            return self.fetch(query, search_type, limit)
+        except SpotifyRateLimited as e:
+            logger.warning(f'Spotify {search_type} search error: {e}')
+            return None
+
+    def _search(self, query, search_type, limit):
+        ttl = settings.SPOTIFY_CACHE_TTL
+        if not ttl:
+            _count('misses')
+            return self._fetch(query, search_type, limit) or []
+
+        key = search_cache_key(search_type, query, limit)
+        results = _local_cache.get(key)
+        if results is not None:
+            _count('local_hits')
+            return results
+        results = cache.get(key)
+        if results is not None:
+            _count('shared_hits')
+        else:
+            _count('misses')
+            results = singleflight.run(key, lambda: self._fetch(query, search_type, limit), REQUEST_TIMEOUT * 2)
+            if results is None:
+                return []
+            cache.set(key, results, ttl)
+        _local_cache.set(key, results, min(ttl, LOCAL_CACHE_TTL))
+        return results
+
+    def search_tracks(self, query, limit=5):
+        return self._search(query, 'track', limit)
 
     def search_artists(self, query, limit=5):
-        token = self._get_token()
+        return self._search(query, 'artist', limit)
+
+    # ──────────────────────────────────────
+    # Async variants (ASGI views, pooled aiohttp session)
+    # ──────────────────────────────────────
+
+    async def _aget_token(self):
+        token = _token.current()
+        if token:
+            return token
+
+        import aiohttp
+        from .upstream import get_session
+
+        async with _token.async_lock():
+            token = _token.current()
+            if token:
+                return token
+            try:
+                async with get_session().post(
+                    self.token_url,
+                    data={'grant_type': 'client_credentials'},
+                    auth=aiohttp.BasicAuth(settings.SPOTIFY_CLIENT_ID, settings.SPOTIFY_CLIENT_SECRET),
+                    timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                ) as resp:
+                    resp.raise_for_status()
+                    return _token.store(await resp.json())
+            except Exception as e:
+                logger.error(f'Spotify token error: {e}')
+                return None
+
+    async def _afetch(self, query, search_type, limit):
+        token = await self._aget_token()
         if not token:
-            return []
+            return None
 
-        import requests
+        import aiohttp
+        from .upstream import get_session, limit as upstream_limit
 
         try:
-            resp = requests.get(
-                f'{self.API_BASE}/search',
-                params={'q': query, 'type': 'artist', 'limit': limit, 'market': 'JP'},
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=5,
-            )
-            resp.raise_for_status()
-            artists = resp.json().get('artists', {}).get('items', [])
-            return [
-                {
-                    'spotify_artist_id': a['id'],
-                    'name': a['name'],
-                    'image_url': a['images'][0]['url'] if a['images'] else '',
-                    'genres': a.get('genres', [])[:3],
-                }
-                for a in artists
-            ]
+            async with upstream_limit('spotify'):
+                async with get_session().get(
+                    f'{self.api_base}/search',
+                    params={'q': query, 'type': search_type, 'limit': limit, 'market': 'JP'},
+                    headers={'Authorization': f'Bearer {token}'},
+                    timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                ) as resp:
+                    resp.raise_for_status()
+                    return PARSERS[search_type](await resp.json())
         except Exception as e:
-            logger.error(f'Spotify artist search error: {e}')
-            return []
+            logger.error(f'Spotify {search_type} search error: {e}')
+            return None
+
+    async def _asearch(self, query, search_type, limit):
+        ttl = settings.SPOTIFY_CACHE_TTL
+        if not ttl:
+            _count('misses')
+            return await self._afetch(query, search_type, limit) or []
+
+        key = search_cache_key(search_type, query, limit)
+        results = _local_cache.get(key)
+        if results is not None:
+            _count('local_hits')
+            return results
+        results = await cache.aget(key)
+        if results is not None:
+            _count('shared_hits')
+        else:
+            _count('misses')
+            results = await singleflight.arun(
+                key, lambda: self._afetch(query, search_type, limit), REQUEST_TIMEOUT * 2,
+            )
+            if results is None:
+                return []
+            await cache.aset(key, results, ttl)
+        _local_cache.set(key, results, min(ttl, LOCAL_CACHE_TTL))
+        return results
+
+    async def asearch_tracks(self, query, limit=5):
+        return await self._asearch(query, 'track', limit)
+
+    async def asearch_artists(self, query, limit=5):
+        return await self._asearch(query, 'artist', limit)
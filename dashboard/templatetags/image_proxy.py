@@ -0,0 +1,11 @@
+from django import template
+
+from dashboard.images import proxy_url
+
+register = template.Library()
+
+
+@register.filter
+def proxy_image(url, variant='thumb'):
+    """``{{ song.album_art_url|proxy_image:'card' }}``: the locally mirrored variant."""
+    return proxy_url(url, variant)
@@ -0,0 +1,37 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from dashboard.uploads import FORMATS, kind_for, variant_name, variant_widths
+
+register = template.Library()
+
+
+def _srcset(name, widths, ext):
+    return ', '.join(f'{default_storage.url(variant_name(name, w, ext))} {w}w' for w in widths)
+
+
+@register.simple_tag
+def picture(file, sizes='100vw', **attrs):
+    """``{% picture event.thumbnail '80px' alt=event.artist class='...' %}``
+
+    A <picture> with WebP and JPEG ``srcset`` once the upload has been
+    processed, otherwise a plain <img> of the original.
+    """
+    if not file:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attributes = format_html_join(' ', '{}="{}"', attrs.items())
+    kind = kind_for(file)
+    widths = variant_widths(file.name, kind) if kind else []
+    if not widths:
+        return format_html('<img src="{}" {}>', file.url, attributes)
+
+    webp, jpg = (_srcset(file.name, widths, ext) for ext in FORMATS)
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" {}>'
+        '</picture>',
+        webp, sizes, default_storage.url(variant_name(file.name, widths[-1], 'jpg')), jpg, sizes, attributes,
+    )
@@ -1,3 +1,1106 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from datetime import datetime, time as dt_time, timedelta
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from guitarlog.models import PracticeSession, PracticeSong
+from livelog.models import Expense, LiveEvent
+from music_theory.models import Bookmark, Topic
+from songdiary.models import Memo, Project
+
+from .feed import activity_page
+from .models import (
+    AchievementDefinition, ActivityEvent, BackgroundJob, NotificationPreference, PracticeAdviceCache,
+    PushOutbox, PushSubscription, RateLimitCounter, ReminderSchedule, UserAchievement, UserDailyActivity,
+)
+
+User = get_user_model()
+
+# session + user lookups for the logged-in request, then the snapshot:
+# counts/streak aggregate, activity feed page, 7-day chart, achievements.
+HOME_QUERY_BUDGET = 2 + 1 + 1 + 1 + 1
+
+
+class DashboardHomeQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('budget', 'budget@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def _add_history(self, n):
+        now = timezone.now()
+        offset = Topic.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(n):
+                PracticeSession.objects.create(
+                    user=self.user, duration_minutes=30,
+                    started_at=now - timedelta(days=i),
+                )
+                LiveEvent.objects.create(
+                    user=self.user, artist=f'Artist {i}',
+                    date=now.date() - timedelta(days=i),
+                )
+                Project.objects.create(user=self.user, title=f'Song {i}')
+                topic = Topic.objects.create(
+                    title=f'Topic {i}', slug=f'topic-{offset + i}', category='chord',
+                    summary='s', body='b',
+                )
+                Bookmark.objects.create(user=self.user, topic=topic)
+
+    def _home_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dashboard:home'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_fixed(self):
+        self._add_history(3)
+        small = self._home_queries()
+        self._add_history(40)
+        large = self._home_queries()
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, HOME_QUERY_BUDGET)
+
+    def test_snapshot_values(self):
+        self._add_history(10)
+        response = self.client.get(reverse('dashboard:home'))
+
+        self.assertEqual(response.context['bookmark_count'], 10)
+        self.assertEqual(response.context['live_count'], 10)
+        self.assertEqual(response.context['project_count'], 10)
+        self.assertEqual(response.context['total_minutes'], 300)
+        self.assertEqual(response.context['streak_count'], 10)
+        self.assertEqual(len(response.context['activities']), 8)
+        dates = [a.occurred_at for a in response.context['activities']]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+
+class DailyActivityRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rollup', 'rollup@example.com', 'pw')
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+
+    def _at(self, day):
+        return timezone.make_aware(datetime.combine(day, dt_time(12)))
+
+    def _rows(self):
+        return {
+            row.date: (row.session_count, row.practice_minutes)
+            for row in UserDailyActivity.objects.filter(user=self.user)
+        }
+
+    def test_moving_and_deleting_a_session_updates_both_days(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = PracticeSession.objects.create(
+                user=self.user, started_at=self._at(self.today), duration_minutes=30,
+            )
+            PracticeSession.objects.create(user=self.user, started_at=self._at(self.today), duration_minutes=10)
+        self.assertEqual(self._rows(), {self.today: (2, 40)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.started_at = self._at(self.yesterday)
+            session.save()
+        self.assertEqual(self._rows(), {self.today: (1, 10), self.yesterday: (1, 30)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.delete()
+        self.assertEqual(self._rows(), {self.today: (1, 10)})
+
+    def test_rebuild_command_restores_rollup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PracticeSession.objects.create(user=self.user, started_at=self._at(self.yesterday), duration_minutes=25)
+            LiveEvent.objects.create(user=self.user, artist='Spitz', date=self.today)
+        expected = {
+            (row.date, row.session_count, row.practice_minutes, row.live_count)
+            for row in UserDailyActivity.objects.filter(user=self.user)
+        }
+        UserDailyActivity.objects.all().delete()
+        UserDailyActivity.objects.create(user=self.user, date=self.today - timedelta(days=5), session_count=9)
+
+        out = StringIO()
+        call_command('rebuild_daily_activity', '--user', str(self.user.pk), stdout=out)
+
+        self.assertIn('2件', out.getvalue())
+        self.assertEqual({
+            (row.date, row.session_count, row.practice_minutes, row.live_count)
+            for row in UserDailyActivity.objects.filter(user=self.user)
+        }, expected)
+        self.assertEqual(len(expected), 2)
+
+
+class ActivityFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('feed', 'feed@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def test_writes_on_create_and_update(self):
+        project = Project.objects.create(user=self.user, title='New Song')
+        project.status = 'sketch'
+        project.save()
+        Memo.objects.create(project=project, text_content='idea')
+        Expense.objects.create(user=self.user, amount=8000, category='ticket', date=timezone.localdate())
+
+        kinds = list(ActivityEvent.objects.filter(user=self.user).values_list('kind', 'verb'))
+        self.assertEqual(kinds, [
+            ('expense', 'created'), ('memo', 'created'),
+            ('project', 'updated'), ('project', 'created'),
+        ])
+
+    def test_keyset_pages_cover_every_event_once(self):
+        for i in range(20):
+            PracticeSession.objects.create(user=self.user, duration_minutes=i + 1)
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = activity_page(self.user, cursor, limit=8)
+            seen.extend(e.pk for e in page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 20)
+        self.assertEqual(len(set(seen)), 20)
+
+    def test_load_more_endpoint(self):
+        for i in range(10):
+            PracticeSession.objects.create(user=self.user, duration_minutes=i + 1)
+        _, cursor = activity_page(self.user)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('dashboard:activity_feed'), {'cursor': cursor})
+        self.assertEqual(len(response.context['activities']), 2)
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class AchievementPollTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('waiter', 'waiter@example.com', 'pw')
+        self.client.force_login(self.user)
+        self.url = reverse('dashboard:poll_achievements')
+        self.definition = AchievementDefinition.objects.create(
+            slug='first_practice', name='最初の一歩', description='d',
+            category='practice', icon_name='footsteps',
+        )
+
+    def test_idle_poll_does_not_touch_achievements(self):
+        version = self.client.get(self.url)['X-Achievement-Version']
+
+        # session + user only
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'v': version})
+        self.assertEqual(response.status_code, 204)
+
+    def test_new_achievement_is_returned(self):
+        version = self.client.get(self.url)['X-Achievement-Version']
+        with self.captureOnCommitCallbacks(execute=True):
+            UserAchievement.objects.create(user=self.user, achievement=self.definition)
+
+        response = self.client.get(self.url, {'v': version})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '最初の一歩')
+        self.assertFalse(UserAchievement.objects.filter(notified=False).exists())
+
+    def test_achievement_after_evicted_version_is_not_missed(self):
+        from .notifier import VERSION_KEY, publish_achievement
+
+        cache.clear()
+        publish_achievement(self.user.pk)
+        version = self.client.get(self.url)['X-Achievement-Version']
+        cache.delete(VERSION_KEY.format(user_id=self.user.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserAchievement.objects.create(user=self.user, achievement=self.definition)
+        response = self.client.get(self.url, {'v': version})
+        self.assertContains(response, '最初の一歩')
+
+
+class PushOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pusher', 'pusher@example.com', 'pw')
+        AchievementDefinition.objects.create(
+            slug='first_practice', name='最初の一歩', description='d',
+            category='practice', icon_name='footsteps',
+        )
+        self.subscriptions = [
+            PushSubscription.objects.create(
+                user=self.user, endpoint=f'https://push.example.com/{i}', p256dh='k', auth='a',
+            )
+            for i in range(3)
+        ]
+
+    def _practice(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            PracticeSession.objects.create(user=self.user, duration_minutes=30, started_at=timezone.now())
+        return callbacks
+
+    def test_achievement_is_queued_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            PracticeSession.objects.create(user=self.user, duration_minutes=30, started_at=timezone.now())
+        self.assertFalse(PushOutbox.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(PushOutbox.objects.filter(status='pending', title='実績解除: 最初の一歩').count(), 3)
+
+    def test_worker_records_outcomes_in_bulk(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from . import push
+
+        self._practice()
+        outcomes = {
+            self.subscriptions[0].pk: (push.SENT, ''),
+            self.subscriptions[1].pk: (push.RETRY, 'HTTP 503'),
+            self.subscriptions[2].pk: (push.GONE, 'HTTP 410'),
+        }
+        self.assertFalse(push.claim_batch(10))  # held back for the coalescing window
+        PushOutbox.objects.update(run_after=timezone.now())
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            items = push.claim_batch(10)
+            self.assertEqual(push.claim_batch(10), [])
+            counts = push.process_batch(items, pool, send=lambda item: outcomes[item.subscription_id])
+
+        self.assertEqual(counts, {push.SENT: 1, push.GONE: 1, push.RETRY: 1, push.FAILED: 0})
+        self.assertFalse(PushSubscription.objects.filter(pk=self.subscriptions[2].pk).exists())
+        sent = PushOutbox.objects.get(subscription=self.subscriptions[0])
+        self.assertEqual(sent.status, 'sent')
+        retry = PushOutbox.objects.get(subscription=self.subscriptions[1])
+        self.assertEqual((retry.status, retry.attempts, retry.last_error), ('pending', 1, 'HTTP 503'))
+        self.assertGreater(retry.run_after, timezone.now())
+
+    def test_notifications_for_one_subscription_are_coalesced(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from . import push
+
+        with self.captureOnCommitCallbacks(execute=True):
+            push.queue_push_to_user(self.user, '実績解除: A', 'a', '/achievements/')
+            push.queue_push_to_user(self.user, '実績解除: B', 'b', '/achievements/')
+        PushOutbox.objects.update(run_after=timezone.now())
+
+        sent = []
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            counts = push.process_batch(
+                push.claim_batch(10), pool, send=lambda message: sent.append(message) or (push.SENT, ''),
+            )
+        self.assertEqual(counts[push.SENT], 6)
+        self.assertEqual(len(sent), 3)
+        self.assertEqual({m.title for m in sent}, {'実績解除: A ほか1件'})
+        self.assertEqual(sent[0].url, '/achievements/')
+
+    def test_vapid_headers_are_reused_per_origin(self):
+        from py_vapid import Vapid, b64urlencode
+        from . import push
+
+        key = Vapid()
+        key.generate_keys()
+        private_key = b64urlencode(key.private_key.private_numbers().private_value.to_bytes(32, 'big'))
+        first = push.vapid_headers('https://push.example.com/a', private_key, 'admin@example.com')
+        self.assertIs(push.vapid_headers('https://push.example.com/b', private_key, 'admin@example.com'), first)
+        self.assertIsNot(push.vapid_headers('https://fcm.example.net/a', private_key, 'admin@example.com'), first)
+
+
+class ReminderTests(TestCase):
+    def _user(self, name, **prefs):
+        user = User.objects.create_user(name, f'{name}@example.com', 'pw')
+        PushSubscription.objects.create(user=user, endpoint=f'https://push.example.com/{name}', p256dh='k', auth='a')
+        if prefs:
+            NotificationPreference.objects.create(user=user, **prefs)
+        return user
+
+    def test_schedule_follows_sessions_events_and_preferences(self):
+        from zoneinfo import ZoneInfo
+
+        user = self._user('traveller', timezone='America/New_York')
+        new_york = ZoneInfo('America/New_York')
+        started = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            PracticeSession.objects.create(user=user, duration_minutes=30, started_at=started)
+            event = LiveEvent.objects.create(user=user, artist='Band', date=timezone.localdate() + timedelta(days=3))
+
+        streak = ReminderSchedule.objects.get(user=user, kind='streak')
+        self.assertEqual(streak.fire_at.astimezone(new_york).date(), started.astimezone(new_york).date() + timedelta(days=1))
+        self.assertEqual(streak.fire_at.astimezone(new_york).hour, 20)
+        live = ReminderSchedule.objects.get(user=user, kind='live', object_id=event.pk)
+        self.assertEqual(live.fire_at.astimezone(new_york).date(), event.date - timedelta(days=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            prefs = NotificationPreference.objects.get(user=user)
+            prefs.practice_reminder = False
+            prefs.save()
+        self.assertEqual(list(ReminderSchedule.objects.values_list('kind', flat=True)), ['live'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.delete()
+        self.assertFalse(ReminderSchedule.objects.exists())
+
+    def test_migration_backfill_matches_rebuild(self):
+        from importlib import import_module
+        from django.apps import apps
+        from . import reminders
+
+        migration = import_module('dashboard.migrations.0014_populate_reminder_schedule')
+        user = self._user('existing', timezone='Europe/Berlin')
+        self._user('quiet', live_reminder=False)
+        PracticeSession.objects.create(user=user, duration_minutes=30, started_at=timezone.now())
+        LiveEvent.objects.create(user=user, artist='Band', date=timezone.localdate() + timedelta(days=2))
+        LiveEvent.objects.create(
+            user=User.objects.get(username='quiet'), artist='Band', date=timezone.localdate() + timedelta(days=2),
+        )
+
+        def schedule():
+            return sorted(ReminderSchedule.objects.values_list('user_id', 'kind', 'object_id', 'fire_at'))
+
+        reminders.rebuild_schedule()
+        expected = schedule()
+        ReminderSchedule.objects.all().delete()
+        migration.populate_reminder_schedule(apps, None)
+        self.assertEqual(schedule(), expected)
+        self.assertEqual(len(expected), 2)
+
+    def test_tick_only_touches_due_rows(self):
+        now = timezone.now()
+        lapsed, later, stale, fan = (self._user(name) for name in ('lapsed', 'later', 'stale', 'fan'))
+        event = LiveEvent.objects.create(user=fan, artist='Band', date=timezone.localdate() + timedelta(days=1))
+        ReminderSchedule.objects.bulk_create([
+            ReminderSchedule(user=lapsed, kind='streak', fire_at=now - timedelta(minutes=1)),
+            ReminderSchedule(user=later, kind='streak', fire_at=now + timedelta(hours=1)),
+            ReminderSchedule(user=stale, kind='streak', fire_at=now - timedelta(hours=5)),
+            ReminderSchedule(user=fan, kind='live', object_id=event.pk, fire_at=now - timedelta(minutes=1)),
+        ])
+
+        out = StringIO()
+        call_command('send_reminders', '--dry-run', stdout=out)
+        self.assertIn('3 reminder(s) due', out.getvalue())
+        self.assertFalse(PushOutbox.objects.exists())
+
+        out = StringIO()
+        call_command('send_reminders', '--stats', stdout=out)
+        self.assertIn('Fired 2 reminder(s), queued 2 push(es), dropped 1 overdue', out.getvalue())
+        self.assertEqual(
+            sorted(PushOutbox.objects.values_list('subscription__user__username', 'title')),
+            [('fan', '明日はライブ！'), ('lapsed', 'ストリークを守ろう！')],
+        )
+        self.assertEqual(list(ReminderSchedule.objects.values_list('user__username', flat=True)), ['later'])
+
+
+class GlobalSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('search', 'search@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def test_index_follows_saves_and_deletes(self):
+        from .models import SearchDocument
+
+        project = Project.objects.create(user=self.user, title='夜明けのバラード', description='Aメロ')
+        doc = SearchDocument.objects.get(kind='project', object_id=project.pk)
+        self.assertIn('バラ', doc.title_terms.split())
+
+        project.title = '夕焼け'
+        project.save()
+        doc.refresh_from_db()
+        self.assertEqual(doc.title, '夕焼け')
+
+        project.delete()
+        self.assertFalse(SearchDocument.objects.filter(kind='project').exists())
+
+    def test_japanese_substring_ranked_and_scoped(self):
+        Project.objects.create(user=self.user, title='メモ', description='カノン進行で作る')
+        Project.objects.create(user=self.user, title='カノン進行の練習')
+        Project.objects.create(user=self.other, title='カノン進行（他人）')
+
+        response = self.client.get(reverse('dashboard:global_search'), {'q': 'ノン進'})
+        projects = response.context['results']['projects']
+        self.assertEqual([p.title for p in projects], ['カノン進行の練習', 'メモ'])
+        self.assertIn('<mark>ノン進</mark>', projects[1].search_snippet)
+
+    def test_snippet_is_escaped(self):
+        from .search import highlight
+
+        self.assertEqual(highlight('<b>bold</b> chord', ['chord']), '&lt;b&gt;bold&lt;/b&gt; <mark>chord</mark>')
+
+
+@override_settings(GEMINI_API_KEY='', SPOTIFY_CLIENT_ID='', SPOTIFY_CLIENT_SECRET='')
+class AsyncUpstreamViewTests(TestCase):
+    """ASGI variants of the LLM / Spotify views (DJANGO_ASYNC_VIEWS=1)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('async', 'async@example.com', 'pw')
+
+    def _request(self, path):
+        from django.test import AsyncRequestFactory
+
+        request = AsyncRequestFactory().get(path)
+        request.user = self.user
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        return request
+
+    async def test_practice_advice_queues_generation(self):
+        from .advice import PENDING_TEXT
+        from .views import apractice_advice
+
+        response = await apractice_advice(self._request('/advice/?refresh=1'))
+        self.assertContains(response, PENDING_TEXT)
+        self.assertTrue(await BackgroundJob.objects.filter(kind='advice.refresh').aexists())
+
+    async def test_spotify_search_without_credentials(self):
+        from .views import aspotify_search
+
+        response = await aspotify_search(self._request('/api/spotify/search/?q=spitz'))
+        self.assertEqual(json.loads(response.content), {'results': []})
+
+
+class SpotifyCacheTests(TestCase):
+    def setUp(self):
+        from . import spotify
+
+        cache.clear()
+        spotify.reset_cache()
+        self.calls = []
+
+        test = self
+
+        class CountingClient(spotify.SpotifyClient):
+            def _fetch(self, query, search_type, limit):
+                test.calls.append((query, search_type))
+                return [{'name': query}]
+
+        self.client = CountingClient()
+
+    def test_equivalent_queries_share_one_request(self):
+        from . import spotify
+
+        self.assertEqual(self.client.search_artists('Back Number'), [{'name': 'Back Number'}])
+        self.client.search_artists('  back　number ')
+        spotify.reset_cache()  # another worker: only the shared cache is warm
+        self.client.search_artists('BACK NUMBER')
+        self.client.search_tracks('back number')
+
+        self.assertEqual(self.calls, [('Back Number', 'artist'), ('back number', 'track')])
+        self.assertEqual(spotify.cache_stats(), {'local_hits': 0, 'shared_hits': 1, 'misses': 1})
+
+    @override_settings(SPOTIFY_CACHE_TTL=0)
+    def test_cache_can_be_disabled(self):
+        self.client.search_tracks('spitz')
+        self.client.search_tracks('spitz')
+        self.assertEqual(len(self.calls), 2)
+
+
+class StubSpotifyHandler(BaseHTTPRequestHandler):
+    """Token and search endpoints; the first search is answered with a 429."""
+
+    searches = []
+
+    def _json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._json(200, {'access_token': 'stub', 'expires_in': 3600})
+
+    def do_GET(self):
+        params = parse_qs(urlsplit(self.path).query)
+        query, search_type = params['q'][0], params['type'][0]
+        self.searches.append(query)
+        if len(self.searches) == 1:
+            return self._json(429, {}, [('Retry-After', '0')])
+        if 'unknown' in query:
+            return self._json(200, {f'{search_type}s': {'items': []}})
+        image = [{'url': 'https://i.scdn.co/image/stub'}]
+        if search_type == 'track':
+            item = {'id': 'track1', 'name': query, 'artists': [{'name': 'x'}], 'album': {'images': image}}
+        else:
+            item = {'id': 'artist1', 'name': query, 'images': image}
+        self._json(200, {f'{search_type}s': {'items': [item]}})
+
+    def log_message(self, *args):
+        pass
+
+
+class EnrichSpotifyTests(TestCase):
+    def setUp(self):
+        from . import spotify
+
+        cache.clear()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubSpotifyHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        StubSpotifyHandler.searches = []
+        spotify._token.value = None
+        self.addCleanup(setattr, spotify._token, 'value', None)
+
+        base = f'http://127.0.0.1:{server.server_port}'
+        settings = override_settings(
+            SPOTIFY_CLIENT_ID='id', SPOTIFY_CLIENT_SECRET='secret',
+            SPOTIFY_TOKEN_URL=f'{base}/api/token', SPOTIFY_API_BASE=f'{base}/v1',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('enrich', 'enrich@example.com', 'pw')
+
+    def test_distinct_songs_are_looked_up_once_and_misses_are_remembered(self):
+        songs = [
+            PracticeSong.objects.create(user=self.user, title='Cherry', artist='Spitz'),
+            PracticeSong.objects.create(user=self.user, title='CHERRY ', artist='spitz'),
+            PracticeSong.objects.create(user=self.user, title='unknown song', artist='Spitz'),
+        ]
+        event = LiveEvent.objects.create(user=self.user, artist='Spitz', date=timezone.localdate())
+
+        out = StringIO()
+        call_command('enrich_spotify', '--threads', '2', '--rps', '0', stdout=out)
+
+        # Two distinct songs and one artist, plus the retried 429.
+        self.assertEqual(len(StubSpotifyHandler.searches), 4)
+        for song in songs[:2]:
+            song.refresh_from_db()
+            self.assertEqual(song.spotify_id, 'track1')
+            self.assertEqual(song.album_art_url, 'https://i.scdn.co/image/stub')
+        event.refresh_from_db()
+        self.assertEqual(event.spotify_artist_id, 'artist1')
+        self.assertIn('一致 1件 / 更新 2行', out.getvalue())
+
+        # The song Spotify did not find is remembered and skipped ...
+        out = StringIO()
+        call_command('enrich_spotify', stdout=out)
+        self.assertEqual(StubSpotifyHandler.searches[4:], [])
+        self.assertIn('前回見つからなかった 1件を除外', out.getvalue())
+
+        # ... until it is asked for again or its title changes.
+        call_command('enrich_spotify', '--retry-misses', stdout=StringIO())
+        self.assertEqual(StubSpotifyHandler.searches[4:], ['track:unknown song artist:Spitz'])
+        PracticeSong.objects.filter(pk=songs[2].pk).update(title='unknown song (live)')
+        call_command('enrich_spotify', stdout=StringIO())
+        self.assertEqual(StubSpotifyHandler.searches[5:], ['track:unknown song (live) artist:Spitz'])
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        from PIL import Image
+
+        type(self).requests += 1
+        out = BytesIO()
+        Image.new('RGB', (640, 480), 'red').save(out, 'PNG')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(out.getvalue())))
+        self.end_headers()
+        self.wfile.write(out.getvalue())
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageProxyTests(TestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        StubImageHandler.requests = 0
+        cache.clear()
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, IMAGE_PROXY_HOSTS=['127.0.0.1'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.src = f'http://127.0.0.1:{server.server_port}/image/ab12'
+
+    def test_miss_queues_a_job_and_mirror_is_served_as_webp(self):
+        from PIL import Image
+        from . import jobs
+        from .images import proxy_url
+
+        url = proxy_url(self.src, 'thumb')
+        missed = self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(missed.status_code, 302)
+        self.assertEqual(missed['Location'], self.src)
+        self.assertEqual(StubImageHandler.requests, 0)
+
+        job = jobs.claim_next(['images.warm'])
+        self.assertEqual(jobs.run_job(job), 'done')
+        self.assertIsNone(jobs.claim_next(['images.warm']))
+
+        first = self.client.get(url)
+        card = self.client.get(proxy_url(self.src, 'card'))
+        self.assertEqual(StubImageHandler.requests, 1)
+        self.assertEqual(first['Content-Type'], 'image/webp')
+        self.assertIn('immutable', first['Cache-Control'])
+        thumb = Image.open(BytesIO(b''.join(first.streaming_content)))
+        self.assertEqual((thumb.format, thumb.size), ('WEBP', (128, 96)))
+        self.assertEqual(Image.open(BytesIO(b''.join(card.streaming_content))).size, (320, 240))
+
+    def test_other_hosts_are_not_proxied(self):
+        from .images import proxy_url
+
+        self.assertEqual(proxy_url('https://example.com/a.png', 'thumb'), 'https://example.com/a.png')
+        response = self.client.get(reverse('dashboard:image_proxy', args=['thumb']), {'src': 'https://example.com/a.png'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_unsigned_or_altered_src_is_rejected(self):
+        from .images import proxy_url
+
+        proxy = reverse('dashboard:image_proxy', args=['thumb'])
+        self.assertEqual(self.client.get(proxy, {'src': self.src}).status_code, 404)
+        tampered = proxy_url(self.src, 'thumb').replace('ab12', 'cd34')
+        self.assertEqual(self.client.get(tampered).status_code, 404)
+
+    def test_saved_song_is_warmed_by_a_job(self):
+        from . import images, jobs
+
+        user = User.objects.create_user('art', 'art@example.com', 'pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            PracticeSong.objects.create(user=user, title='Cherry', album_art_url=self.src)
+        job = jobs.claim_next(['images.warm'])
+        self.assertEqual(jobs.run_job(job), 'done')
+        self.assertTrue(images.is_mirrored(self.src))
+
+
+class UploadPipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('uploader', 'uploader@example.com', 'pw')
+
+    def _photo(self, size=(2000, 1000)):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90° clockwise
+        exif[0x010F] = 'TestCam'
+        out = BytesIO()
+        Image.new('RGB', size, 'blue').save(out, 'JPEG', exif=exif)
+        return out.getvalue()
+
+    def test_upload_is_cleaned_and_resized_by_a_job(self):
+        from django.core.files.storage import default_storage
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.template import Context, Template
+        from PIL import Image
+        from . import jobs
+        from .uploads import variant_name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event = LiveEvent.objects.create(
+                user=self.user, artist='Spitz', date=timezone.localdate(),
+                thumbnail=SimpleUploadedFile('live.jpg', self._photo(), content_type='image/jpeg'),
+            )
+        template = Template("{% load responsive_images %}{% picture event.thumbnail '80px' alt='x' %}")
+        self.assertNotIn('srcset', template.render(Context({'event': event})))
+
+        self.assertEqual(jobs.run_job(jobs.claim_next(['uploads.process'])), 'done')
+
+        with default_storage.open(event.thumbnail.name) as f:
+            original = Image.open(f)
+            self.assertEqual(original.size, (1000, 2000))
+            self.assertEqual(dict(original.getexif()), {})
+        for width in (320, 640):
+            with default_storage.open(variant_name(event.thumbnail.name, width, 'webp')) as f:
+                self.assertEqual(Image.open(f).size, (width, width * 2))
+        self.assertFalse(default_storage.exists(variant_name(event.thumbnail.name, 1280, 'webp')))
+
+        html = template.render(Context({'event': event}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('__640.jpg 640w', html)
+
+    def test_backfill_streams_storage_and_skips_processed_files(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from .uploads import variant_name
+
+        name = default_storage.save('avatars/old.jpg', ContentFile(self._photo((400, 400))))
+        out = StringIO()
+        call_command('process_uploads', '--kind', 'avatar', stdout=out)
+        self.assertIn('1件中 処理 1件', out.getvalue())
+        self.assertTrue(default_storage.exists(variant_name(name, 320, 'jpg')))
+
+        out = StringIO()
+        call_command('process_uploads', '--kind', 'avatar', stdout=out)
+        self.assertIn('1件中 処理 0件', out.getvalue())
+
+
+@override_settings(RATE_LIMITS={'advice': {'user': (2, 3600)}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sliding_window_weights_previous_window(self):
+        from . import ratelimit
+
+        self.assertTrue(ratelimit.hit('advice', 1, now=3599))
+        self.assertTrue(ratelimit.hit('advice', 1, now=3599))
+        self.assertFalse(ratelimit.hit('advice', 1, now=3599))
+        # Half of the previous window still overlaps: 2 * 0.5 + 1 <= 2.
+        self.assertTrue(ratelimit.hit('advice', 1, now=3600 + 1800))
+        self.assertFalse(ratelimit.hit('advice', 1, now=3600 + 1800))
+        # Other users have their own counter.
+        self.assertTrue(ratelimit.hit('advice', 2, now=3599))
+
+    def test_counters_are_rows_not_cache_entries(self):
+        from . import ratelimit
+
+        ratelimit.hit('advice', 1, now=3599)
+        ratelimit.hit('advice', 1, now=3599)
+        cache.clear()
+        self.assertFalse(ratelimit.hit('advice', 1, now=3599))
+        # The denied hit was given back.
+        self.assertEqual(RateLimitCounter.objects.get().count, 2)
+
+        RateLimitCounter.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(ratelimit.purge_expired(), 1)
+
+    def test_forced_refresh_is_limited(self):
+        user = User.objects.create_user('advice', 'advice@example.com', 'pw')
+        self.client.force_login(user)
+        url = reverse('dashboard:practice_advice') + '?refresh=1'
+        with override_settings(GEMINI_API_KEY=''):
+            self.assertEqual(self.client.get(url)['X-RateLimit-Remaining'], '1')
+            self.client.get(url)
+            denied = self.client.get(url)
+        self.assertEqual(denied.status_code, 200)
+        self.assertIn('Retry-After', denied)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_follower_receives_leader_result(self):
+        from . import singleflight
+
+        leader = singleflight.begin('job')
+        follower = singleflight.begin('job')
+        self.assertTrue(leader.leader)
+        self.assertFalse(follower.leader)
+        leader.finish({'answer': 42})
+        self.assertEqual(follower.wait(timeout=1), {'answer': 42})
+        self.assertTrue(singleflight.begin('job').leader)
+
+    def test_follower_gives_up_when_leader_releases_without_result(self):
+        from . import singleflight
+
+        leader = singleflight.begin('job')
+        follower = singleflight.begin('job')
+        leader.release()
+        self.assertIsNone(follower.wait(timeout=1))
+
+    def test_leader_failure_reaches_followers(self):
+        from . import singleflight
+
+        leader = singleflight.begin('job')
+        follower = singleflight.begin('job')
+        leader.fail()
+        with self.assertRaises(singleflight.Failed):
+            follower.wait(timeout=1)
+
+    def test_run_follower_does_not_repeat_failed_work(self):
+        import threading
+        from . import singleflight
+
+        leader = singleflight.begin('job')
+        timer = threading.Timer(0.2, leader.fail)
+        timer.start()
+        calls = []
+        self.assertIsNone(singleflight.run('job', lambda: calls.append(1) or 'again', timeout=5))
+        timer.join()
+        self.assertEqual(calls, [])
+
+    def test_follower_wait_is_capped_by_its_timeout(self):
+        import time
+        from . import singleflight
+
+        singleflight.begin('job')
+        follower = singleflight.begin('job')
+        started = time.monotonic()
+        with self.assertRaises(singleflight.Failed):
+            follower.wait(timeout=0.3)
+        self.assertLess(time.monotonic() - started, 1)
+
+
+@override_settings(GEMINI_API_KEY='')
+class AdviceJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('stale', 'stale@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def _cached_advice(self, age):
+        advice = PracticeAdviceCache.objects.create(
+            user=self.user, advice_text='前回のアドバイス',
+            period_start=timezone.localdate(), period_end=timezone.localdate(),
+        )
+        PracticeAdviceCache.objects.filter(pk=advice.pk).update(generated_at=timezone.now() - age)
+
+    def test_stale_advice_is_served_and_refresh_queued(self):
+        self._cached_advice(timedelta(days=2))
+        response = self.client.get(reverse('dashboard:practice_advice'))
+        self.assertContains(response, '前回のアドバイス')
+        self.assertContains(response, '更新中')
+        self.client.get(reverse('dashboard:practice_advice'))
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.kind, job.payload), ('advice.refresh', {'user_id': self.user.pk}))
+
+    def test_fresh_advice_queues_nothing(self):
+        self._cached_advice(timedelta(hours=1))
+        response = self.client.get(reverse('dashboard:practice_advice'))
+        self.assertNotContains(response, '更新中')
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_worker_runs_job_and_failure_backs_off(self):
+        self._cached_advice(timedelta(days=2))
+        self.client.get(reverse('dashboard:practice_advice'))
+        call_command('run_jobs', '--once', stdout=StringIO())
+        self.assertEqual(BackgroundJob.objects.get().status, 'done')
+
+        # No API key: nothing was stored, so the old text stays without re-queueing.
+        response = self.client.get(reverse('dashboard:practice_advice'))
+        self.assertContains(response, '前回のアドバイス')
+        self.assertNotContains(response, '更新中')
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+
+    def test_failing_handler_is_retried_then_failed(self):
+        from . import jobs
+
+        job = jobs.enqueue('advice.refresh', {'user_id': self.user.pk, 'unexpected': 1})
+        for _ in range(jobs.MAX_ATTEMPTS):
+            BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            with self.assertLogs('dashboard.jobs', 'ERROR'):
+                jobs.run_job(jobs.claim_next())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', jobs.MAX_ATTEMPTS))
+        self.assertIn('TypeError', job.last_error)
+
+    @override_settings(RATE_LIMITS={'advice': {'global': (1, 86400)}})
+    def test_nightly_batch_respects_global_quota(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        idle = User.objects.create_user('idle', 'idle@example.com', 'pw')
+        for user in (self.user, other):
+            UserDailyActivity.objects.create(user=user, date=timezone.localdate(), session_count=1)
+        UserDailyActivity.objects.create(user=idle, date=timezone.localdate() - timedelta(days=30), session_count=1)
+
+        out = StringIO()
+        call_command('pregenerate_advice', '--concurrency', '1', stdout=out)
+        self.assertIn('対象: 2人', out.getvalue())
+        self.assertIn('後回し（ジョブ化）: 1件', out.getvalue())
+        self.assertEqual(BackgroundJob.objects.get().payload, {'user_id': other.pk})
+
+
+@override_settings(GEMINI_API_KEY='')
+class AdviceFingerprintTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('print', 'print@example.com', 'pw')
+
+    def _advice(self, age, fingerprint):
+        advice = PracticeAdviceCache.objects.create(
+            user=self.user, advice_text='前回のアドバイス', context_hash=fingerprint,
+            period_start=timezone.localdate(), period_end=timezone.localdate(),
+        )
+        PracticeAdviceCache.objects.filter(pk=advice.pk).update(generated_at=timezone.now() - age)
+        return advice
+
+    def _fingerprint(self):
+        from .advice import context_fingerprint, gather_practice_context
+
+        return context_fingerprint(gather_practice_context(self.user, days=7))
+
+    def test_unchanged_data_skips_llm_and_counts(self):
+        from .advice import advice_stats, refresh_practice_advice
+
+        advice = self._advice(timedelta(days=2), self._fingerprint())
+        self.assertTrue(PracticeAdviceCache.objects.get(pk=advice.pk).is_stale())
+
+        self.assertEqual(refresh_practice_advice(self.user), 'unchanged')
+        advice.refresh_from_db()
+        self.assertFalse(advice.is_stale())
+        self.assertEqual(advice_stats()['unchanged'], 1)
+
+    def test_changed_or_expired_data_regenerates(self):
+        from .advice import refresh_practice_advice
+
+        self._advice(timedelta(days=2), 'other-data')
+        self.assertEqual(refresh_practice_advice(self.user), 'failed')  # no API key: Gemini was attempted
+
+        PracticeAdviceCache.objects.all().delete()
+        self._advice(timedelta(days=8), self._fingerprint())
+        self.assertEqual(refresh_practice_advice(self.user), 'failed')
+
+    def test_fingerprint_changes_with_practice(self):
+        before = self._fingerprint()
+        UserDailyActivity.objects.create(
+            user=self.user, date=timezone.localdate(), session_count=1, practice_minutes=30,
+        )
+        self.assertNotEqual(self._fingerprint(), before)
+
+
+class StubGeminiStreamHandler(BaseHTTPRequestHandler):
+    """streamGenerateContent over SSE, one chunk every 0.1s."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for text in ('一', '二', '三', '四'):
+            payload = {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+            self.wfile.write(f'data: {json.dumps(payload)}\n\n'.encode())
+            self.wfile.flush()
+            time.sleep(0.1)
+
+    def log_message(self, *args):
+        pass
+
+
+class FlakyModel:
+    """Stands in for a genai model: fails ``failures`` times, then answers."""
+
+    def __init__(self, failures, exc=TimeoutError):
+        self.failures = failures
+        self.exc = exc
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exc('upstream down')
+        chunks = [type('Chunk', (), {'text': t})() for t in ('回答', 'です')]
+        return iter(chunks) if stream else type('Response', (), {'text': '回答です'})()
+
+
+@override_settings(LLM_MAX_RETRIES=2)
+class LLMBackendTests(TestCase):
+    def _backend(self, model):
+        from .llm import GeminiBackend
+
+        backend = GeminiBackend()
+        backend.retry_base_delay = 0
+        backend._model = lambda name, system_prompt: model
+        return backend
+
+    def test_transient_errors_are_retried(self):
+        model = FlakyModel(failures=2)
+        backend = self._backend(model)
+        self.assertEqual(backend.generate('system', 'prompt'), '回答です')
+        self.assertEqual(''.join(backend.stream('system', 'prompt')), '回答です')
+        self.assertEqual(model.calls, 4)
+        self.assertEqual(backend.breaker.failures, 0)
+
+    def test_permanent_errors_fail_without_retry(self):
+        from .llm import LLMError
+
+        model = FlakyModel(failures=1, exc=ValueError)
+        with self.assertRaises(LLMError):
+            self._backend(model).generate('system', 'prompt')
+        self.assertEqual(model.calls, 1)
+
+    def test_permanent_errors_do_not_open_the_circuit(self):
+        from .llm import BREAKER_THRESHOLD, LLMError
+
+        model = FlakyModel(failures=BREAKER_THRESHOLD * 2, exc=ValueError)
+        backend = self._backend(model)
+        for _ in range(BREAKER_THRESHOLD * 2):
+            with self.assertRaises(LLMError):
+                backend.generate('system', 'prompt')
+        self.assertEqual(backend.generate('system', 'prompt'), '回答です')
+        self.assertIsNone(backend.breaker.opened_at)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        from .llm import BREAKER_THRESHOLD, LLMCircuitOpen, LLMError
+
+        model = FlakyModel(failures=1000)
+        backend = self._backend(model)
+        with self.assertLogs('dashboard.llm', 'WARNING'):
+            for _ in range(BREAKER_THRESHOLD):
+                with self.assertRaises(LLMError):
+                    backend.generate('system', 'prompt')
+        with self.assertRaises(LLMCircuitOpen):
+            backend.generate('system', 'prompt')
+        # Each call used up its retries before counting as one failure.
+        self.assertEqual(model.calls, BREAKER_THRESHOLD * 3)
+
+        backend.breaker.opened_at -= backend.breaker.cooldown
+        model.failures = 0
+        self.assertEqual(backend.generate('system', 'prompt'), '回答です')  # half-open trial
+        self.assertIsNone(backend.breaker.opened_at)
+
+    @override_settings(GEMINI_API_KEY='test-key', LLM_TIMEOUT=0.1, LLM_MAX_RETRIES=0)
+    async def test_async_stream_times_out_per_chunk(self):
+        from unittest import mock
+        from .llm import GeminiBackend, LLMError
+
+        async def gemini_stream(model, system_prompt, contents):
+            yield '回答'
+            yield 'です'
+            await asyncio.sleep(0.3)
+            yield '遅延'
+
+        backend = GeminiBackend()
+        received = []
+        with mock.patch('dashboard.upstream.gemini_stream', gemini_stream):
+            with self.assertRaises(LLMError):
+                async for chunk in backend.astream('system', 'prompt'):
+                    received.append(chunk)
+                    # A slow reader does not use up Gemini's time budget.
+                    await asyncio.sleep(0.15)
+        self.assertEqual(received, ['回答', 'です'])
+
+    async def test_gemini_stream_outlives_the_session_total_timeout(self):
+        from . import upstream
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubGeminiStreamHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        chunks = []
+        with override_settings(
+            GEMINI_API_BASE=f'http://127.0.0.1:{server.server_port}', GEMINI_API_KEY='test-key',
+            UPSTREAM_TIMEOUT=0.2, LLM_TIMEOUT=1,
+        ):
+            try:
+                async for chunk in upstream.gemini_stream('model', 'system', []):
+                    chunks.append(chunk)
+            finally:
+                await upstream.close_sessions()
+        self.assertEqual(chunks, ['一', '二', '三', '四'])
+
+    @override_settings(LLM_BACKEND='dashboard.llm.FakeBackend', LLM_FAKE_LATENCY=0.03)
+    def test_fake_backend_is_shared_and_deterministic(self):
+        from .llm import get_backend
+
+        backend = get_backend()
+        self.assertIs(get_backend(), backend)
+        started = time.monotonic()
+        self.assertEqual(backend.generate('system', 'prompt'), 'これはテスト用の回答です。')
+        self.assertGreaterEqual(time.monotonic() - started, 0.03)
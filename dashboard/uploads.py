@@ -0,0 +1,177 @@
+"""Processing of user-uploaded images (event thumbnails, avatars, photo memos).
+
+Saving a model with a new upload queues an ``uploads.process`` job; the
+job rewrites the original with EXIF orientation applied and metadata
+(GPS, camera info) stripped, capped at ``MAX_ORIGINAL`` pixels, and stores
+WebP and JPEG variants next to it as ``<name>__<width>.webp|jpg``. The
+``picture`` template tag renders them as ``srcset`` once they exist and
+falls back to the original until then. ``manage.py process_uploads``
+backfills files already in storage.
+"""
+import hashlib
+import logging
+import os
+import re
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# kind -> (upload directory, variant widths in pixels)
+SPECS = {
+    'thumbnail': ('livelog/thumbnails', (320, 640, 1280)),
+    'avatar': ('avatars', (80, 160, 320)),
+    'photo': ('songdiary/photos', (320, 640, 1280)),
+}
+# (model label, field name) -> kind
+UPLOAD_FIELDS = {
+    ('livelog.LiveEvent', 'thumbnail'): 'thumbnail',
+    ('accounts.CustomUser', 'avatar'): 'avatar',
+    ('songdiary.Memo', 'photo_file'): 'photo',
+}
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+QUALITY = 80
+ORIGINAL_QUALITY = 88
+# Longest side the stored original is reduced to.
+MAX_ORIGINAL = 2560
+CACHE_KEY_PREFIX = 'upload-variants'
+# Positive lookups are stable; a miss is re-checked once the job may have run.
+READY_TTL = 24 * 60 * 60
+PENDING_TTL = 60
+
+VARIANT_RE = re.compile(r'__\d+\.(webp|jpg)$')
+
+
+def kind_for(file):
+    """The SPECS kind of a FieldFile, or None for fields without variants."""
+    return UPLOAD_FIELDS.get((file.instance._meta.label, file.field.name))
+
+
+def variant_name(name, width, ext):
+    return f'{os.path.splitext(name)[0]}__{width}.{ext}'
+
+
+def is_variant(name):
+    return bool(VARIANT_RE.search(name))
+
+
+def _cache_key(name):
+    return f'{CACHE_KEY_PREFIX}:{hashlib.sha1(name.encode()).hexdigest()}'
+
+
+def variant_widths(name, kind):
+    """Widths whose variants are stored for ``name`` ([] until processed)."""
+    widths = cache.get(_cache_key(name))
+    if widths is None:
+        widths = [
+            width for width in SPECS[kind][1]
+            if default_storage.exists(variant_name(name, width, 'jpg'))
+        ]
+        cache.set(_cache_key(name), widths, READY_TTL if widths else PENDING_TTL)
+    return widths
+
+
+def is_processed(name, kind):
+    return bool(variant_widths(name, kind))
+
+
+# ──────────────────────────────────────
+# Processing
+# ──────────────────────────────────────
+
+def _encode(image, fmt, quality, icc_profile):
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        from PIL import Image
+
+        background = Image.new('RGB', image.size, 'white')
+        if 'A' in image.getbands():
+            background.paste(image, mask=image.getchannel('A'))
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+    out = BytesIO()
+    options = {'quality': quality, 'icc_profile': icc_profile}
+    if fmt == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    elif fmt == 'WEBP':
+        options['method'] = 4
+    elif fmt == 'PNG':
+        options = {'optimize': True, 'icc_profile': icc_profile}
+    image.save(out, fmt, **options)
+    return ContentFile(out.getvalue())
+
+
+def _replace(name, content):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, content)
+
+
+def process(name, kind):
+    """Clean the original and store its variants. Returns the widths stored."""
+    from PIL import Image, ImageOps
+
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        image.load()
+    # iPhone JPEGs are read as MPO.
+    source_format = 'JPEG' if image.format in ('JPEG', 'MPO') else image.format
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    # Everything but the colour profile (EXIF with GPS, XMP, comments) is dropped.
+    image.info = {}
+    image.thumbnail((MAX_ORIGINAL, MAX_ORIGINAL), Image.Resampling.LANCZOS)
+
+    # Other formats keep their original file; only the variants are written.
+    if source_format in ('JPEG', 'PNG', 'WEBP'):
+        _replace(name, _encode(image, source_format, ORIGINAL_QUALITY, icc_profile))
+
+    widths = SPECS[kind][1]
+    # Never upscale: keep the smallest width and those below the original.
+    stored = [w for w in widths if w < image.width or w == widths[0]]
+    # The smallest JPEG is written last and marks the set as complete.
+    for width in reversed(stored):
+        resized = image
+        if width < image.width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+        for ext, fmt in FORMATS.items():
+            _replace(variant_name(name, width, ext), _encode(resized, fmt, QUALITY, icc_profile))
+    cache.set(_cache_key(name), sorted(stored), READY_TTL)
+    return stored
+
+
+def process_later(file):
+    """Queue an 'uploads.process' job for a FieldFile that has no variants yet."""
+    from . import jobs
+
+    kind = kind_for(file)
+    if file and kind and not is_processed(file.name, kind):
+        jobs.enqueue('uploads.process', {'name': file.name, 'kind': kind}, key=f'upload:{file.name}')
+
+
+def run_process_job(name, kind):
+    """Job handler for 'uploads.process'."""
+    if default_storage.exists(name):
+        process(name, kind)
+
+
+def iter_uploads(kind):
+    """Stream the originals stored under a kind's upload directory."""
+    directory = SPECS[kind][0]
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            dirs, files = default_storage.listdir(current)
+        except FileNotFoundError:
+            continue
+        pending.extend(f'{current}/{d}' for d in dirs)
+        for filename in files:
+            name = f'{current}/{filename}'
+            if not is_variant(name):
+                yield name
@@ -0,0 +1,116 @@
+"""Async HTTP plumbing for outbound calls made by the ASGI views.
+
+One pooled aiohttp session per event loop, and a semaphore per upstream so
+a worker can keep hundreds of requests pending without opening an
+unbounded number of connections to Gemini or Spotify.
+"""
+import asyncio
+import json
+import weakref
+
+import aiohttp
+from django.conf import settings
+
+DEFAULT_CONCURRENCY = 32
+# Connecting is bounded separately from reading for streamed responses.
+CONNECT_TIMEOUT = 10
+
+_sessions = weakref.WeakKeyDictionary()
+_limits = weakref.WeakKeyDictionary()
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def get_session():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=settings.UPSTREAM_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300),
+        )
+        _sessions[loop] = session
+    return session
+
+
+def limit(name):
+    """Semaphore bounding concurrent requests to upstream ``name``."""
+    loop = asyncio.get_running_loop()
+    per_loop = _limits.setdefault(loop, {})
+    if name not in per_loop:
+        size = settings.UPSTREAM_CONCURRENCY.get(name, DEFAULT_CONCURRENCY)
+        per_loop[name] = asyncio.Semaphore(size)
+    return per_loop[name]
+
+
+async def close_sessions():
+    for session in list(_sessions.values()):
+        await session.close()
+    _sessions.clear()
+
+
+# ──────────────────────────────────────
+# Gemini (REST)
+# ──────────────────────────────────────
+
+def _gemini_url(model, method):
+    return f'{settings.GEMINI_API_BASE}/v1beta/models/{model}:{method}'
+
+
+def _gemini_body(system_prompt, contents):
+    return {
+        'systemInstruction': {'parts': [{'text': system_prompt}]},
+        'contents': contents,
+    }
+
+
+def _candidate_text(payload):
+    candidates = payload.get('candidates') or []
+    if not candidates:
+        return ''
+    parts = candidates[0].get('content', {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts)
+
+
+async def gemini_generate(model, system_prompt, contents):
+    """Return the full answer text for ``contents`` (Gemini chat format)."""
+    async with limit('llm'):
+        async with get_session().post(
+            _gemini_url(model, 'generateContent'),
+            headers={'x-goog-api-key': settings.GEMINI_API_KEY},
+            json=_gemini_body(system_prompt, contents),
+        ) as resp:
+            if resp.status != 200:
+                raise UpstreamError(f'Gemini HTTP {resp.status}', resp.status)
+            return _candidate_text(await resp.json())
+
+
+async def gemini_stream(model, system_prompt, contents):
+    """Yield answer chunks from Gemini's server-sent event stream.
+
+    The session's total timeout would also count the time the consumer
+    spends between chunks, cutting long answers off; a stream is only
+    bounded per read instead.
+    """
+    async with limit('llm'):
+        async with get_session().post(
+            _gemini_url(model, 'streamGenerateContent') + '?alt=sse',
+            headers={'x-goog-api-key': settings.GEMINI_API_KEY},
+            json=_gemini_body(system_prompt, contents),
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_connect=CONNECT_TIMEOUT, sock_read=settings.LLM_TIMEOUT,
+            ),
+        ) as resp:
+            if resp.status != 200:
+                raise UpstreamError(f'Gemini HTTP {resp.status}', resp.status)
+            async for line in resp.content:
+                line = line.strip()
+                if not line.startswith(b'data:'):
+                    continue
+                text = _candidate_text(json.loads(line[5:]))
+                if text:
+                    yield text
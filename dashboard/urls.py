@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -6,16 +7,20 @@ app_name = 'dashboard'
 urlpatterns = [
     path('', views.home, name='home'),
     path('search/', views.global_search, name='global_search'),
+    path('activity/', views.activity_feed, name='activity_feed'),
     # Calendar heatmap
     path('calendar/data/', views.calendar_data, name='calendar_data'),
     path('calendar/day/<str:date_str>/', views.calendar_day_detail, name='calendar_day_detail'),
     # Achievements
     path('achievements/', views.achievement_list, name='achievement_list'),
     path('achievements/check/', views.check_new_achievements, name='check_new_achievements'),
+    path('achievements/poll/', views.poll_achievements, name='poll_achievements'),
     # AI Advice
-    path('advice/', views.practice_advice, name='practice_advice'),
+    path('advice/', views.apractice_advice if settings.ASYNC_VIEWS else views.practice_advice, name='practice_advice'),
     # Spotify
-    path('api/spotify/search/', views.spotify_search, name='spotify_search'),
+    path('api/spotify/search/', views.aspotify_search if settings.ASYNC_VIEWS else views.spotify_search, name='spotify_search'),
+    # Mirrored artwork
+    path('img/<str:variant>/', views.image_proxy, name='image_proxy'),
     # Profile settings
     path('settings/profile/', views.profile_settings, name='profile_settings'),
     # Push notifications
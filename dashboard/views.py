@@ -1,142 +1,47 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
-from django.db.models import Q, Sum, Count
-from django.db.models.functions import TruncDate
+from django.db.models import Sum
 from datetime import timedelta, date
-from itertools import islice
-from heapq import merge
 
 
 def home(request):
     if request.user.is_authenticated:
-        from music_theory.models import Bookmark
-        from livelog.models import LiveEvent
-        from songdiary.models import Project
-        from guitarlog.models import PracticeSession
-        from django.db.models import Sum
-        from django.db.models.functions import TruncDate
-
-        user = request.user
-
-        # --- Stats counts ---
-        bookmark_count = Bookmark.objects.filter(user=user).count()
-        streak_count = PracticeSession.get_streak(user)
-        live_count = LiveEvent.objects.filter(user=user).count()
-        project_count = Project.objects.filter(user=user).count()
-
-        # --- Recent activity (latest 8 across all models) ---
-        recent_sessions = [
-            {'type': 'practice', 'date': s.started_at,
-             'text': f'{s.duration_minutes}分練習しました',
-             'url': '/practice/'}
-            for s in PracticeSession.objects.filter(user=user).order_by('-started_at')[:5]
-        ]
-        recent_events = [
-            {'type': 'live', 'date': e.created_at,
-             'text': f'{e.artist} のライブを追加',
-             'url': f'/live/{e.pk}/'}
-            for e in LiveEvent.objects.filter(user=user).order_by('-created_at')[:5]
-        ]
-        recent_projects = [
-            {'type': 'project', 'date': p.updated_at,
-             'text': f'「{p.title}」を更新',
-             'url': f'/songs/{p.pk}/'}
-            for p in Project.objects.filter(user=user).order_by('-updated_at')[:5]
-        ]
-        recent_bookmarks = [
-            {'type': 'bookmark', 'date': b.created_at,
-             'text': f'「{b.topic.title}」をブックマーク',
-             'url': f'/theory/{b.topic.slug}/'}
-            for b in Bookmark.objects.filter(user=user).select_related('topic').order_by('-created_at')[:5]
-        ]
-
-        # Merge and sort by date descending, take top 8
-        all_activities = sorted(
-            recent_sessions + recent_events + recent_projects + recent_bookmarks,
-            key=lambda x: x['date'],
-            reverse=True,
-        )[:8]
-
-        # --- 7-day practice chart data ---
-        today = timezone.now().date()
-        start_date = today - timedelta(days=6)
-        daily_practice = (
-            PracticeSession.objects.filter(user=user, started_at__date__gte=start_date)
-            .annotate(date=TruncDate('started_at'))
-            .values('date')
-            .annotate(total=Sum('duration_minutes'))
-        )
-        daily_map = {str(d['date']): d['total'] for d in daily_practice}
-        practice_week = []
-        max_minutes = 1  # avoid division by zero
-        for i in range(7):
-            d = start_date + timedelta(days=i)
-            minutes = daily_map.get(str(d), 0)
-            if minutes > max_minutes:
-                max_minutes = minutes
-            practice_week.append({
-                'label': d.strftime('%a'),
-                'minutes': minutes,
-            })
-        # Add percentage for bar height
-        for day in practice_week:
-            day['pct'] = round(day['minutes'] / max_minutes * 100) if max_minutes > 0 else 0
-
-        total_minutes = PracticeSession.objects.filter(user=user).aggregate(
-            total=Sum('duration_minutes'))['total'] or 0
-
-        # Recent achievements
-        from .models import UserAchievement
-        recent_achievements = (
-            UserAchievement.objects.filter(user=user)
-            .select_related('achievement')[:6]
-        )
+        from .snapshot import get_dashboard_snapshot
 
-        context = {
-            'bookmark_count': bookmark_count,
-            'streak_count': streak_count,
-            'live_count': live_count,
-            'project_count': project_count,
-            'activities': all_activities,
-            'practice_week': practice_week,
-            'total_minutes': total_minutes,
-            'recent_achievements': recent_achievements,
-        }
+        context = get_dashboard_snapshot(request.user)
         return render(request, 'dashboard/home.html', context)
     return render(request, 'dashboard/landing.html')
 
 
+@login_required
+def activity_feed(request):
+    """Return the next page of the activity feed (HTMX partial)."""
+    from .feed import activity_page
+
+    activities, next_cursor = activity_page(request.user, request.GET.get('cursor'))
+    return render(request, 'dashboard/_activity_items.html', {
+        'activities': activities,
+        'next_cursor': next_cursor,
+    })
+
+
 @login_required
 def global_search(request):
-    from music_theory.models import Topic
-    from livelog.models import LiveEvent
-    from songdiary.models import Project
-    from guitarlog.models import PracticeSong
+    from .search import grouped_results
 
     q = request.GET.get('q', '').strip()
     results = {'topics': [], 'songs': [], 'events': [], 'projects': []}
 
     if q:
-        results['topics'] = Topic.objects.filter(
-            Q(title__icontains=q) | Q(body__icontains=q)
-        )[:10]
-        results['songs'] = PracticeSong.objects.filter(
-            user=request.user
-        ).filter(
-            Q(title__icontains=q) | Q(artist__icontains=q)
-        )[:10]
-        results['events'] = LiveEvent.objects.filter(
-            user=request.user
-        ).filter(
-            Q(artist__icontains=q) | Q(title__icontains=q) | Q(venue__icontains=q)
-        )[:10]
-        results['projects'] = Project.objects.filter(
-            user=request.user
-        ).filter(
-            Q(title__icontains=q) | Q(description__icontains=q) | Q(tags__icontains=q)
-        )[:10]
+        grouped = grouped_results(request.user, q)
+        results = {
+            'topics': grouped['topic'],
+            'songs': grouped['song'],
+            'events': grouped['event'],
+            'projects': grouped['project'],
+        }
 
     total = sum(len(v) for v in results.values())
 
@@ -154,47 +59,22 @@ def global_search(request):
 @login_required
 def calendar_data(request):
     """Return 365-day activity heatmap data as JSON."""
-    from guitarlog.models import PracticeSession
-    from livelog.models import LiveEvent
-    from songdiary.models import Project
+    from .activity import get_daily_activity
 
     user = request.user
-    today = timezone.now().date()
+    today = timezone.localdate()
     start = today - timedelta(days=364)
 
-    # Practice: minutes per day
-    practice_days = dict(
-        PracticeSession.objects.filter(user=user, started_at__date__gte=start)
-        .annotate(d=TruncDate('started_at'))
-        .values('d')
-        .annotate(total=Sum('duration_minutes'))
-        .values_list('d', 'total')
-    )
-
-    # Live events per day
-    live_days = dict(
-        LiveEvent.objects.filter(user=user, date__gte=start)
-        .values('date')
-        .annotate(cnt=Count('id'))
-        .values_list('date', 'cnt')
-    )
-
-    # Composition updates per day
-    compose_days = dict(
-        Project.objects.filter(user=user, updated_at__date__gte=start)
-        .annotate(d=TruncDate('updated_at'))
-        .values('d')
-        .annotate(cnt=Count('id'))
-        .values_list('d', 'cnt')
-    )
+    daily_map = get_daily_activity(user, start, today)
 
     days = []
     active_count = 0
     for i in range(365):
         d = start + timedelta(days=i)
-        p = practice_days.get(d, 0)
-        l = live_days.get(d, 0)
-        c = compose_days.get(d, 0)
+        row = daily_map.get(d)
+        p = row.practice_minutes if row else 0
+        l = row.live_count if row else 0
+        c = row.compose_updates if row else 0
 
         # Activity score: practice minutes weighted + events
         score = min(p // 15, 3) + (l * 2) + c
@@ -291,24 +171,62 @@ def achievement_list(request):
     })
 
 
-@login_required
-def check_new_achievements(request):
-    """Return HTMX partial for unnotified achievements, mark as notified."""
+def _pop_new_achievements(user):
+    """Return unnotified achievements and mark them as notified."""
     from .models import UserAchievement
 
     new_achievements = (
-        UserAchievement.objects.filter(user=request.user, notified=False)
+        UserAchievement.objects.filter(user=user, notified=False)
         .select_related('achievement')
     )
     achievements_list = list(new_achievements)
     if achievements_list:
-        new_achievements.update(notified=True)
+        UserAchievement.objects.filter(
+            pk__in=[ua.pk for ua in achievements_list]
+        ).update(notified=True)
+    return achievements_list
+
 
+@login_required
+def check_new_achievements(request):
+    """Return HTMX partial for unnotified achievements, mark as notified."""
     return render(request, 'dashboard/_achievement_toast.html', {
-        'new_achievements': achievements_list,
+        'new_achievements': _pop_new_achievements(request.user),
     })
 
 
+@login_required
+def poll_achievements(request):
+    """Cheap poll for newly unlocked achievements (the client backs off).
+
+    The client sends the version it last saw as ``?v=``; while it is still
+    current the answer is an empty 204 after one cache read. Without ``v``
+    any pending achievements are returned.
+    """
+    from .notifier import achievement_version
+
+    try:
+        seen = int(request.GET['v'])
+    except (KeyError, ValueError):
+        seen = None
+
+    version = achievement_version(request.user.pk)
+    if version == seen:
+        response = HttpResponse(status=204)
+        response['X-Achievement-Version'] = version
+        return response
+
+    achievements_list = _pop_new_achievements(request.user)
+    if not achievements_list:
+        response = HttpResponse(status=204)
+    else:
+        response = render(request, 'dashboard/_achievement_toast.html', {
+            'new_achievements': achievements_list,
+        })
+    response['X-Achievement-Version'] = version
+    return response
+
+
 # ──────────────────────────────────────
 # Phase 3: AI Practice Advice
 # ──────────────────────────────────────
@@ -316,17 +234,45 @@ def check_new_achievements(request):
 @login_required
 def practice_advice(request):
     """Return AI-generated practice advice (HTMX partial)."""
-    from .advice import generate_practice_advice
+    from .advice import get_practice_advice
+    from . import ratelimit
 
+    # A forced refresh queues a Gemini call; the per-user quota bounds it.
+    # (Background generation itself is counted against the global quota.)
     force = request.GET.get('refresh') == '1'
+    quota = None
     if force:
-        from .models import PracticeAdviceCache
-        PracticeAdviceCache.objects.filter(user=request.user).delete()
+        quota = ratelimit.hit('advice', request.user.pk, rules=('user',))
+        force = bool(quota)
 
-    advice_text = generate_practice_advice(request.user)
-    return render(request, 'dashboard/_practice_advice.html', {
+    advice_text, refreshing = get_practice_advice(request.user, force=force)
+    response = render(request, 'dashboard/_practice_advice.html', {
         'advice_text': advice_text,
+        'refreshing': refreshing,
     })
+    return ratelimit.apply_headers(response, quota)
+
+
+@login_required
+async def apractice_advice(request):
+    """practice_advice for ASGI (DB reads only; generation runs in run_jobs)."""
+    from asgiref.sync import sync_to_async
+    from .advice import get_practice_advice
+    from . import ratelimit
+
+    user = await request.auser()
+    force = request.GET.get('refresh') == '1'
+    quota = None
+    if force:
+        quota = await sync_to_async(ratelimit.hit)('advice', user.pk, rules=('user',))
+        force = bool(quota)
+
+    advice_text, refreshing = await sync_to_async(get_practice_advice)(user, force=force)
+    response = render(request, 'dashboard/_practice_advice.html', {
+        'advice_text': advice_text,
+        'refreshing': refreshing,
+    })
+    return ratelimit.apply_headers(response, quota)
 
 
 # ──────────────────────────────────────
@@ -356,6 +302,52 @@ def spotify_search(request):
     return JsonResponse({'results': results})
 
 
+@login_required
+async def aspotify_search(request):
+    """spotify_search for ASGI, over the pooled aiohttp session."""
+    from .spotify import SpotifyClient
+
+    q = request.GET.get('q', '').strip()
+    search_type = request.GET.get('type', 'track')
+
+    if not q or len(q) < 2:
+        return JsonResponse({'results': []})
+
+    client = SpotifyClient()
+    if not client.is_available():
+        return JsonResponse({'results': []})
+
+    if search_type == 'artist':
+        results = await client.asearch_artists(q, limit=5)
+    else:
+        results = await client.asearch_tracks(q, limit=5)
+
+    return JsonResponse({'results': results})
+
+
+def image_proxy(request, variant):
+    """Serve a mirrored WebP variant of remote artwork (public pages use it too)."""
+    from django.core.files.storage import default_storage
+    from django.http import FileResponse, Http404, HttpResponseRedirect
+    from . import images
+
+    src = images.unsign(request.GET.get('src', ''))
+    if variant not in images.VARIANTS or not images.is_allowed(src):
+        raise Http404
+
+    if not images.is_mirrored(src):
+        # Fall back to the original image while a job mirrors it.
+        images.warm_on_miss(src)
+        response = HttpResponseRedirect(src)
+        response['Cache-Control'] = 'public, max-age=60'
+        return response
+
+    response = FileResponse(default_storage.open(images.variant_name(src, variant)), content_type='image/webp')
+    # The source URL never changes content, so neither does the variant.
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 # ──────────────────────────────────────
 # Phase 5: Public Profile
 # ──────────────────────────────────────
@@ -500,6 +492,7 @@ def vapid_public_key(request):
 def notification_settings(request):
     """Notification preferences form."""
     from .models import NotificationPreference
+    from .reminders import timezone_choices
 
     prefs, _ = NotificationPreference.objects.get_or_create(user=request.user)
 
@@ -507,10 +500,13 @@ def notification_settings(request):
         prefs.practice_reminder = request.POST.get('practice_reminder') == 'on'
         prefs.live_reminder = request.POST.get('live_reminder') == 'on'
         prefs.achievement_notify = request.POST.get('achievement_notify') == 'on'
+        if request.POST.get('timezone') in timezone_choices():
+            prefs.timezone = request.POST['timezone']
         prefs.save()
         from django.contrib import messages
         messages.success(request, '通知設定を更新しました。')
 
     return render(request, 'dashboard/notification_settings.html', {
         'prefs': prefs,
+        'timezones': timezone_choices(),
     })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PracticeSong, PracticeSession, SessionSong
+from .models import PracticeSong, PracticeSession, SessionSong, PracticeStreak
 
 
 @admin.register(PracticeSong)
@@ -18,3 +18,9 @@ class PracticeSessionAdmin(admin.ModelAdmin):
     list_display = ('user', 'started_at', 'duration_minutes', 'rating', 'is_quick_record')
     list_filter = ('is_quick_record',)
     inlines = [SessionSongInline]
+
+
+@admin.register(PracticeStreak)
+class PracticeStreakAdmin(admin.ModelAdmin):
+    list_display = ('user', 'current_streak', 'last_practice_date', 'longest_streak')
+    raw_id_fields = ('user',)
@@ -0,0 +1,71 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db.models.functions import TruncDate
+
+from guitarlog.models import PracticeSession, PracticeStreak
+from guitarlog.streaks import compute_streak
+
+
+class Command(BaseCommand):
+    help = '保存済みストリークを練習セッションの生データから再計算した値と照合'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='不一致のストリークを再計算結果で上書きする',
+        )
+
+    def handle(self, *args, **options):
+        stored = {
+            row[0]: row[1:]
+            for row in PracticeStreak.objects.values_list(
+                'user_id', 'current_streak', 'last_practice_date', 'longest_streak',
+            ).iterator()
+        }
+
+        days = (
+            PracticeSession.objects.annotate(d=TruncDate('started_at'))
+            .values_list('user_id', 'd')
+            .distinct()
+            .order_by('user_id', '-d')
+        )
+
+        checked = mismatched = 0
+        seen = set()
+        for user_id, rows in groupby(days.iterator(), key=lambda r: r[0]):
+            seen.add(user_id)
+            expected = compute_streak(d for _, d in rows)
+            checked += 1
+            if stored.get(user_id) != expected:
+                mismatched += 1
+                self._report(user_id, stored.get(user_id), expected, options['fix'])
+
+        # Users whose sessions were all removed should be back to zero.
+        empty = (0, None, 0)
+        for user_id, actual in stored.items():
+            if user_id in seen:
+                continue
+            checked += 1
+            if actual != empty:
+                mismatched += 1
+                self._report(user_id, actual, empty, options['fix'])
+
+        style = self.style.SUCCESS if not mismatched else self.style.WARNING
+        self.stdout.write(style(
+            f'ストリーク照合完了: {checked}件中 {mismatched}件不一致'
+            + ('（修正済み）' if options['fix'] and mismatched else '')
+        ))
+
+    def _report(self, user_id, actual, expected, fix):
+        self.stdout.write(f'  user={user_id} stored={actual} expected={expected}')
+        if fix:
+            current, last, longest = expected
+            PracticeStreak.objects.update_or_create(
+                user_id=user_id,
+                defaults={
+                    'current_streak': current,
+                    'last_practice_date': last,
+                    'longest_streak': longest,
+                },
+            )
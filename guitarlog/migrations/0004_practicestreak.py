@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 19:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guitarlog', '0003_practicesong_album_art_url_practicesong_spotify_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PracticeStreak',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('current_streak', models.PositiveIntegerField(default=0, verbose_name='現在のストリーク')),
+                ('last_practice_date', models.DateField(blank=True, null=True, verbose_name='最終練習日')),
+                ('longest_streak', models.PositiveIntegerField(default=0, verbose_name='最長ストリーク')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='practice_streak', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
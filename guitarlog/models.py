@@ -47,20 +47,27 @@ class PracticeSession(models.Model):
 
     @staticmethod
     def get_streak(user):
-        sessions = PracticeSession.objects.filter(user=user).values_list('started_at', flat=True)
-        if not sessions:
+        from .streaks import get_current_streak
+        return get_current_streak(user)
+
+
+class PracticeStreak(models.Model):
+    """ユーザーごとの連続練習日数（セッション保存・削除時に差分更新）"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='practice_streak')
+    current_streak = models.PositiveIntegerField('現在のストリーク', default=0)
+    last_practice_date = models.DateField('最終練習日', null=True, blank=True)
+    longest_streak = models.PositiveIntegerField('最長ストリーク', default=0)
+
+    def __str__(self):
+        return f'{self.user} - {self.current_streak}日'
+
+    def current_as_of(self, today):
+        """最終練習日が昨日以前に途切れていれば 0 を返す"""
+        if self.last_practice_date is None:
             return 0
-        dates = sorted(set(s.date() for s in sessions), reverse=True)
-        today = timezone.now().date()
-        if dates[0] < today - timedelta(days=1):
+        if self.last_practice_date < today - timedelta(days=1):
             return 0
-        streak = 1
-        for i in range(1, len(dates)):
-            if dates[i - 1] - dates[i] == timedelta(days=1):
-                streak += 1
-            else:
-                break
-        return streak
+        return self.current_streak
 
 
 class SessionSong(models.Model):
@@ -0,0 +1,164 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+ONE_DAY = timedelta(days=1)
+
+
+def practice_days(user_id):
+    """Distinct local practice dates for a user, newest first."""
+    from .models import PracticeSession
+
+    return (
+        PracticeSession.objects.filter(user_id=user_id)
+        .annotate(d=TruncDate('started_at'))
+        .values_list('d', flat=True)
+        .distinct()
+        .order_by('-d')
+    )
+
+
+def compute_streak(dates):
+    """Return (current, last_date, longest) from unique dates sorted newest first.
+
+    ``current`` is the length of the run ending at ``last_date``; whether
+    that run is still alive depends on today's date and is decided on read.
+    """
+    current = longest = run = 0
+    last = prev = None
+    in_first_run = True
+    for d in dates:
+        if prev is None:
+            run = 1
+            last = d
+        elif prev - d == ONE_DAY:
+            run += 1
+        else:
+            if in_first_run:
+                current = run
+                in_first_run = False
+            longest = max(longest, run)
+            run = 1
+        prev = d
+    if in_first_run:
+        current = run
+    longest = max(longest, run)
+    return current, last, longest
+
+
+def _locked_streak(user_id):
+    from .models import PracticeStreak
+    return PracticeStreak.objects.select_for_update().filter(user_id=user_id).first()
+
+
+def _store(streak, current, last, longest):
+    from .models import PracticeStreak
+
+    # queryset.update() never falls back to an INSERT, so a row removed by a
+    # cascading user delete is not resurrected.
+    PracticeStreak.objects.filter(pk=streak.pk).update(
+        current_streak=current, last_practice_date=last, longest_streak=longest,
+    )
+    streak.current_streak = current
+    streak.last_practice_date = last
+    streak.longest_streak = longest
+    return streak
+
+
+def recompute_streak(user_id, create=True):
+    """Rebuild a user's streak state from the raw sessions.
+
+    Used for back-dated or deleted sessions that the constant-time paths
+    cannot resolve, and to initialise users who have no row yet.
+    """
+    from .models import PracticeStreak
+
+    with transaction.atomic():
+        streak = _locked_streak(user_id)
+        current, last, longest = compute_streak(practice_days(user_id))
+        if streak is None:
+            if not create:
+                return None
+            streak, created = PracticeStreak.objects.get_or_create(
+                user_id=user_id,
+                defaults={
+                    'current_streak': current,
+                    'last_practice_date': last,
+                    'longest_streak': longest,
+                },
+            )
+            if created:
+                return streak
+        return _store(streak, current, last, longest)
+
+
+def record_practice_day(user_id, day):
+    """Apply a newly logged practice day in O(1) where possible."""
+    with transaction.atomic():
+        streak = _locked_streak(user_id)
+        if streak is None:
+            return recompute_streak(user_id)
+
+        current = streak.current_streak
+        last = streak.last_practice_date
+
+        if last is None or day > last + ONE_DAY:
+            current, last = 1, day
+        elif day == last + ONE_DAY:
+            current, last = current + 1, day
+        elif day >= last - timedelta(days=current - 1):
+            # Already inside the current run: nothing changes.
+            return streak
+        else:
+            # Back-dated session before the current run may bridge older runs.
+            return recompute_streak(user_id)
+
+        return _store(streak, current, last, max(streak.longest_streak, current))
+
+
+def remove_practice_day(user_id, day):
+    """Apply the removal of a session on ``day`` in O(1) where possible."""
+    from .models import PracticeSession
+
+    if PracticeSession.objects.filter(user_id=user_id, started_at__date=day).exists():
+        return None
+
+    with transaction.atomic():
+        streak = _locked_streak(user_id)
+        if streak is None or streak.last_practice_date is None:
+            return streak
+
+        current = streak.current_streak
+        last = streak.last_practice_date
+        longest = streak.longest_streak
+        run_start = last - timedelta(days=current - 1)
+
+        if day > last:
+            return streak
+        if day < run_start:
+            # An older run shrank; only matters if it was the longest one.
+            if longest == current:
+                return streak
+            return recompute_streak(user_id, create=False)
+
+        # The current run was cut. If it was (one of) the longest, or nothing
+        # is left of it, fall back to a full recompute.
+        if longest <= current or (day == last and current == 1):
+            return recompute_streak(user_id, create=False)
+        if day == last:
+            return _store(streak, current - 1, last - ONE_DAY, longest)
+        return _store(streak, (last - day).days, last, longest)
+
+
+def get_streak_state(user):
+    """Return the PracticeStreak row, initialising it on first use."""
+    from .models import PracticeStreak
+
+    return PracticeStreak.objects.filter(user=user).first() or recompute_streak(user.pk)
+
+
+def get_current_streak(user, today=None):
+    """Return the user's live streak (0 once the run has lapsed)."""
+    return get_streak_state(user).current_as_of(today or timezone.localdate())
@@ -1,3 +1,85 @@
+from datetime import datetime, time, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from .models import PracticeSession, PracticeStreak
+from .streaks import compute_streak, practice_days
+
+User = get_user_model()
+
+
+class PracticeStreakTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('streaker', 'streaker@example.com', 'pw')
+        self.today = timezone.localdate()
+
+    def _practice(self, days_ago):
+        day = self.today - timedelta(days=days_ago)
+        return PracticeSession.objects.create(
+            user=self.user, duration_minutes=20,
+            started_at=timezone.make_aware(datetime.combine(day, time(12))),
+        )
+
+    def _state(self):
+        streak = PracticeStreak.objects.get(user=self.user)
+        return streak.current_streak, streak.last_practice_date, streak.longest_streak
+
+    def _expected(self):
+        return compute_streak(practice_days(self.user.pk))
+
+    def test_back_dated_day_bridges_two_runs(self):
+        for days_ago in (4, 3, 1, 0):
+            self._practice(days_ago)
+        self.assertEqual(self._state(), (2, self.today, 2))
+
+        self._practice(2)
+
+        self.assertEqual(self._state(), (5, self.today, 5))
+        self.assertEqual(self._state(), self._expected())
+
+    def test_removed_day_splits_the_current_run(self):
+        sessions = {days_ago: self._practice(days_ago) for days_ago in range(5)}
+        self.assertEqual(self._state(), (5, self.today, 5))
+
+        sessions[2].delete()
+
+        self.assertEqual(self._state(), (2, self.today, 2))
+        self.assertEqual(self._state(), self._expected())
+
+    def test_removing_one_of_two_sessions_on_a_day_keeps_the_run(self):
+        self._practice(1)
+        extra = self._practice(0)
+        self._practice(0)
+
+        extra.delete()
+
+        self.assertEqual(self._state(), (2, self.today, 2))
+
+    def test_current_as_of_is_zero_after_a_gap(self):
+        for days_ago in (3, 2):
+            self._practice(days_ago)
+        streak = PracticeStreak.objects.get(user=self.user)
+
+        self.assertEqual(streak.current_as_of(self.today - timedelta(days=1)), 2)
+        self.assertEqual(streak.current_as_of(self.today), 0)
+        self.assertEqual(streak.longest_streak, 2)
+
+    def test_reconcile_fix_matches_compute_streak(self):
+        for days_ago in (5, 1, 0):
+            self._practice(days_ago)
+        PracticeStreak.objects.filter(user=self.user).update(current_streak=9, longest_streak=1)
+
+        out = StringIO()
+        call_command('reconcile_streaks', '--fix', stdout=out)
+
+        self.assertIn('1件不一致', out.getvalue())
+        self.assertEqual(self._state(), self._expected())
+        self.assertEqual(self._state(), (2, self.today, 2))
 
-# Create your tests here.
+        out = StringIO()
+        call_command('reconcile_streaks', stdout=out)
+        self.assertIn('0件不一致', out.getvalue())
@@ -3,7 +3,6 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.utils import timezone
 from django.db.models import Sum, Avg
-from django.db.models.functions import TruncDate
 from datetime import timedelta
 from .models import PracticeSong, PracticeSession, SessionSong, PracticeGoal
 from .forms import PracticeSongForm, QuickRecordForm, PracticeGoalForm
@@ -11,7 +10,10 @@ from .forms import PracticeSongForm, QuickRecordForm, PracticeGoalForm
 
 @login_required
 def home(request):
-    streak = PracticeSession.get_streak(request.user)
+    from .streaks import get_streak_state
+
+    streak_state = get_streak_state(request.user)
+    streak = streak_state.current_as_of(timezone.localdate())
     recent_sessions = PracticeSession.objects.filter(user=request.user)[:5]
     total_minutes = PracticeSession.objects.filter(user=request.user).aggregate(
         total=Sum('duration_minutes')
@@ -23,6 +25,7 @@ def home(request):
 
     return render(request, 'guitarlog/home.html', {
         'streak': streak,
+        'longest_streak': streak_state.longest_streak,
         'recent_sessions': recent_sessions,
         'total_minutes': total_minutes,
         'goal': goal,
@@ -173,6 +176,8 @@ def stats(request):
 
 @login_required
 def stats_data(request):
+    from dashboard.activity import get_daily_activity
+
     period = request.GET.get('period', '7')
     try:
         days = int(period)
@@ -180,19 +185,9 @@ def stats_data(request):
         days = 7
     days = min(max(days, 7), 365)
 
-    today = timezone.now().date()
+    today = timezone.localdate()
     start_date = today - timedelta(days=days - 1)
-    daily = (
-        PracticeSession.objects.filter(
-            user=request.user,
-            started_at__date__gte=start_date,
-        )
-        .annotate(date=TruncDate('started_at'))
-        .values('date')
-        .annotate(total=Sum('duration_minutes'))
-        .order_by('date')
-    )
-    daily_map = {str(d['date']): d['total'] for d in daily}
+    daily_map = get_daily_activity(request.user, start_date, today)
 
     labels = []
     data = []
@@ -200,7 +195,8 @@ def stats_data(request):
         d = start_date + timedelta(days=i)
         fmt = '%m/%d' if days <= 31 else '%m/%d'
         labels.append(d.strftime(fmt))
-        data.append(daily_map.get(str(d), 0))
+        row = daily_map.get(d)
+        data.append(row.practice_minutes if row else 0)
 
     total = sum(data)
     avg = round(total / days, 1) if days > 0 else 0
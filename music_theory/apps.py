@@ -5,3 +5,6 @@ class MusicTheoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'music_theory'
     verbose_name = '音楽理論'
+
+    def ready(self):
+        import music_theory.signals  # noqa
@@ -1,7 +1,16 @@
+import hashlib
 import logging
+import re
+
 from django.conf import settings
-from django.db.models import Q
-from .models import Topic, ChordProgression
+from django.core.cache import cache
+
+from dashboard import counters
+from dashboard.llm import LLMCircuitOpen, LLMNotConfigured, LLMUnavailable, get_backend
+from dashboard.lru import LRUCache
+
+from .corpus import normalize
+from .retrieval import rank
 
 logger = logging.getLogger(__name__)
 
@@ -22,44 +31,57 @@ SYSTEM_PROMPT = """あなたは「残音」の音楽理論アシスタントで
 """
 
 
-def _extract_keywords(query):
-    stop_words = {
-        'の', 'に', 'は', 'を', 'が', 'で', 'と', 'も', 'から', 'まで',
-        'より', 'な', 'だ', 'です', 'ます', 'た', 'て', 'して', 'する',
-        'ある', 'いる', 'ない', 'この', 'その', 'あの', 'どの',
-        'what', 'how', 'the', 'is', 'a', 'an', 'in', 'of', 'to',
-        '教えて', 'ください', 'について', 'とは', '知りたい', 'したい',
-    }
-    words = query.replace('　', ' ').split()
-    return [w for w in words if w not in stop_words and len(w) > 1]
+MAX_TOPICS = 3
+MAX_PROGRESSIONS = 3
+# Hits scoring below this fraction of the best one are treated as noise.
+MIN_RELATIVE_SCORE = 0.3
+# Upper bound for the reference block prepended to the prompt (characters).
+CONTEXT_CHAR_BUDGET = 1500
+
+
+def _topic_lines(topic):
+    lines = [f'・{topic.title}: {topic.summary}']
+    if topic.body:
+        lines.append(f'  詳細: {topic.body[:300]}')
+    return lines
+
+
+def _progression_lines(progression):
+    lines = [f'・{progression.name}: {progression.degrees} (Cキー: {progression.chords_in_c})']
+    if progression.description:
+        lines.append(f'  説明: {progression.description[:200]}')
+    return lines
+
+
+def _context_size(kind, obj):
+    lines = _topic_lines(obj) if kind == 'topic' else _progression_lines(obj)
+    return sum(len(line) + 1 for line in lines)
 
 
 def retrieve_relevant_context(query):
-    keywords = _extract_keywords(query)
-    if not keywords:
-        keywords = [query]
-
-    topic_q = Q()
-    for kw in keywords:
-        topic_q |= (
-            Q(title__icontains=kw) |
-            Q(tags__icontains=kw) |
-            Q(summary__icontains=kw) |
-            Q(body__icontains=kw)
-        )
-    topics = Topic.objects.filter(topic_q).distinct()[:3]
-
-    prog_q = Q()
-    for kw in keywords:
-        prog_q |= (
-            Q(name__icontains=kw) |
-            Q(degrees__icontains=kw) |
-            Q(tags__icontains=kw) |
-            Q(description__icontains=kw)
-        )
-    progressions = ChordProgression.objects.filter(prog_q).distinct()[:3]
-
-    return list(topics), list(progressions)
+    """Pick the best-scoring topics/progressions that fit the context budget."""
+    candidates = [
+        ('topic', obj, score) for obj, score in rank('topic', query, MAX_TOPICS)
+    ] + [
+        ('progression', obj, score) for obj, score in rank('progression', query, MAX_PROGRESSIONS)
+    ]
+    candidates.sort(key=lambda c: c[2], reverse=True)
+
+    chosen = {'topic': [], 'progression': []}
+    if not candidates:
+        return chosen['topic'], chosen['progression']
+
+    floor = candidates[0][2] * MIN_RELATIVE_SCORE
+    used = 0
+    for kind, obj, score in candidates:
+        if score < floor:
+            break
+        size = _context_size(kind, obj)
+        if used and used + size > CONTEXT_CHAR_BUDGET:
+            continue
+        chosen[kind].append(obj)
+        used += size
+    return chosen['topic'], chosen['progression']
 
 
 def format_context_for_prompt(topics, progressions):
@@ -71,54 +93,197 @@ def format_context_for_prompt(topics, progressions):
     if topics:
         parts.append('\n■ 関連トピック:')
         for t in topics:
-            parts.append(f'・{t.title}: {t.summary}')
-            if t.body:
-                body_preview = t.body[:300]
-                parts.append(f'  詳細: {body_preview}')
+            parts.extend(_topic_lines(t))
 
     if progressions:
         parts.append('\n■ 関連コード進行:')
         for p in progressions:
-            parts.append(f'・{p.name}: {p.degrees} (Cキー: {p.chords_in_c})')
-            if p.description:
-                parts.append(f'  説明: {p.description[:200]}')
+            parts.extend(_progression_lines(p))
 
     return '\n'.join(parts)
 
 
-def get_gemini_response(conversation_messages, user_query, context_text=''):
+ERROR_UNAVAILABLE = 'チャットボット機能は現在利用できません（ライブラリ未インストール）。'
+ERROR_CIRCUIT_OPEN = 'AI が一時的に応答できない状態です。少し時間をおいてから再度お試しください。'
+ERROR_NOT_CONFIGURED = 'チャットボット機能は現在設定中です。しばらくお待ちください。'
+ERROR_GENERATION = 'すみません、回答の生成中にエラーが発生しました。もう一度お試しください。'
+ERROR_INTERRUPTED = '（回答の生成が途中で中断されました）'
+
+
+def _error_message(exc):
+    """User-facing text for a backend failure before any answer was produced."""
+    if isinstance(exc, LLMNotConfigured):
+        return ERROR_NOT_CONFIGURED
+    if isinstance(exc, LLMCircuitOpen):
+        return ERROR_CIRCUIT_OPEN
+    if isinstance(exc, LLMUnavailable):
+        return ERROR_UNAVAILABLE
+    return ERROR_GENERATION
+
+
+def build_prompt(user_query, context_text='', summary=''):
+    parts = []
+    if summary:
+        parts.append(f'【これまでの会話の要約】\n{summary}')
+    if context_text:
+        parts.append(context_text)
+    if not parts:
+        return user_query
+    parts.append(f'【ユーザーの質問】\n{user_query}')
+    return '\n\n'.join(parts)
+
+
+# ──────────────────────────────────────
+# Response cache
+# ──────────────────────────────────────
+
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_TTL = 60 * 60 * 6
+# Hit/miss counters live in the shared cache so every worker adds to them.
+STATS_KEY = 'music_theory:response_cache:{}'
+STATS_FIELDS = ('hits', 'misses', 'skips', 'saved_chars')
+
+# Phrasings that ask the same thing: "カノン進行とは" / "カノン進行について教えて"
+_QUESTION_SUFFIX_RE = re.compile(
+    r'(について|を|が|は)?'
+    r'(教えて(ください|下さい)?|知りたい(です)?|とは(何|なに|なん)?(ですか)?|って(何|なに|なん)(ですか)?)$'
+)
+_PUNCTUATION_RE = re.compile(r'[\W_]+')
+
+
+def normalize_question(query):
+    """Collapse width, case, punctuation and stock question endings."""
+    text = _PUNCTUATION_RE.sub('', normalize(query))
+    stripped = _QUESTION_SUFFIX_RE.sub('', text)
+    return stripped or text
+
+
+class ResponseCache(LRUCache):
+    """Process-local LRU of answers with a per-entry TTL."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        super().__init__(max_entries, ttl)
+
+
+response_cache = ResponseCache()
+
+
+def response_cache_key(conversation_messages, user_query, context_text='', summary=''):
+    """Cache key for a question, or None when the answer depends on history.
+
+    The retrieved reference block is part of the key, so editing a topic or
+    progression the answer was based on also retires the cached answer.
+    """
+    if conversation_messages or summary:
+        return None
+    question = normalize_question(user_query)
+    if not question:
+        return None
+    digest = hashlib.sha1(
+        '\0'.join((settings.LLM_BACKEND, question, context_text)).encode()
+    ).hexdigest()
+    return f'chat:{digest}'
+
+
+def _count_updates(outcome, answer=''):
+    updates = {outcome: 1}
+    if outcome == 'hits':
+        updates['saved_chars'] = len(answer)
+    return updates
+
+
+def _record(outcome, answer=''):
+    # Stats are bookkeeping: a cache failure must not break the answer.
     try:
-        import google.generativeai as genai
-    except ImportError:
-        return 'チャットボット機能は現在利用できません（ライブラリ未インストール）。'
+        for field, amount in _count_updates(outcome, answer).items():
+            counters.incr(STATS_KEY.format(field), amount)
+    except Exception:
+        logger.warning('Could not record chat cache stats', exc_info=True)
 
-    api_key = settings.GEMINI_API_KEY
-    if not api_key:
-        return 'チャットボット機能は現在設定中です。しばらくお待ちください。'
 
+async def _arecord(outcome, answer=''):
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(
-            model_name='gemini-2.5-flash-lite',
-            system_instruction=SYSTEM_PROMPT,
-        )
+        for field, amount in _count_updates(outcome, answer).items():
+            await counters.aincr(STATS_KEY.format(field), amount)
+    except Exception:
+        logger.warning('Could not record chat cache stats', exc_info=True)
+
+
+def response_cache_stats():
+    return {field: cache.get(STATS_KEY.format(field), 0) for field in STATS_FIELDS}
+
 
-        history = []
-        for msg in conversation_messages:
-            history.append({
-                'role': 'user' if msg.role == 'user' else 'model',
-                'parts': [msg.content],
-            })
+def reset_response_cache_stats():
+    cache.delete_many([STATS_KEY.format(field) for field in STATS_FIELDS])
 
-        chat = model.start_chat(history=history)
 
-        prompt = user_query
-        if context_text:
-            prompt = f'{context_text}\n\n【ユーザーの質問】\n{user_query}'
+def stream_chat_response(conversation_messages, user_query, context_text='', summary=''):
+    """Yield answer chunks; failures become a single user-facing message.
 
-        response = chat.send_message(prompt)
-        return response.text
+    Standalone questions (no history) are answered from the response cache
+    when an equivalent question was answered recently.
+    """
+    key = response_cache_key(conversation_messages, user_query, context_text, summary)
+    if key is None:
+        _record('skips')
+    else:
+        cached = response_cache.get(key)
+        if cached is not None:
+            _record('hits', cached)
+            yield cached
+            return
+        _record('misses')
 
+    prompt = build_prompt(user_query, context_text, summary)
+    parts = []
+    try:
+        for chunk in get_backend().stream(SYSTEM_PROMPT, prompt, conversation_messages):
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        if not isinstance(e, (LLMNotConfigured, LLMUnavailable)):
+            logger.error(f'Chat backend error: {e}')
+        yield f'\n\n{ERROR_INTERRUPTED}' if parts else _error_message(e)
+        return
+
+    if key is not None and parts:
+        response_cache.set(key, ''.join(parts))
+
+
+async def astream_chat_response(conversation_messages, user_query, context_text='', summary=''):
+    """Async counterpart of stream_chat_response."""
+    key = response_cache_key(conversation_messages, user_query, context_text, summary)
+    if key is None:
+        await _arecord('skips')
+    else:
+        cached = response_cache.get(key)
+        if cached is not None:
+            await _arecord('hits', cached)
+            yield cached
+            return
+        await _arecord('misses')
+
+    prompt = build_prompt(user_query, context_text, summary)
+    parts = []
+    try:
+        async for chunk in get_backend().astream(SYSTEM_PROMPT, prompt, conversation_messages):
+            parts.append(chunk)
+            yield chunk
     except Exception as e:
-        logger.error(f'Gemini API error: {e}')
-        return 'すみません、回答の生成中にエラーが発生しました。もう一度お試しください。'
+        if not isinstance(e, (LLMNotConfigured, LLMUnavailable)):
+            logger.error(f'Chat backend error: {e}')
+        yield f'\n\n{ERROR_INTERRUPTED}' if parts else _error_message(e)
+        return
+
+    if key is not None and parts:
+        response_cache.set(key, ''.join(parts))
+
+
+def get_gemini_response(conversation_messages, user_query, context_text='', summary=''):
+    return ''.join(stream_chat_response(conversation_messages, user_query, context_text, summary))
+
+
+async def aget_chat_response(conversation_messages, user_query, context_text='', summary=''):
+    return ''.join([
+        chunk async for chunk in astream_chat_response(conversation_messages, user_query, context_text, summary)
+    ])
@@ -0,0 +1,194 @@
+"""Process-local inverted index over the (read-mostly) theory corpus.
+
+Topics and chord progressions are a few hundred seeded rows, so the whole
+corpus is kept in memory with character bigram/trigram postings (substring
+search) and BM25 postings (chatbot retrieval, see retrieval.py). Lookups
+never touch the database; the index is rebuilt lazily after a change.
+"""
+import copy
+import math
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from dashboard import counters
+
+# Shared across processes so every worker notices edits made elsewhere.
+VERSION_KEY = 'music_theory:corpus:version'
+VERSION_TTL = 60 * 60 * 24 * 30
+# How often a worker asks the shared cache whether the corpus changed.
+CHECK_INTERVAL = 30
+
+# Field weights: a hit in the title counts for more than one in the body.
+TOPIC_FIELDS = (('title', 4.0), ('tags', 3.0), ('summary', 2.0), ('body', 1.0))
+PROGRESSION_FIELDS = (('name', 4.0), ('tags', 3.0), ('degrees', 2.0), ('description', 1.0))
+# Repeated occurrences in one field stop adding to the score after this.
+MAX_FIELD_HITS = 3
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None, 'checked_at': 0.0}
+
+
+def normalize(text):
+    """NFKC + lowercase, so full-width ASCII and half-width kana compare equal."""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def query_words(q):
+    return normalize(q).split()
+
+
+def _grams(token, n):
+    return {token[i:i + n] for i in range(len(token) - n + 1)}
+
+
+class _Document:
+    __slots__ = ('key', 'obj', 'fields', 'position')
+
+    def __init__(self, key, obj, fields, position):
+        self.key = key
+        self.obj = obj
+        self.fields = fields  # ((normalized text, weight), ...)
+        self.position = position
+
+
+class TheoryIndex:
+    def __init__(self, topics, progressions):
+        self.docs = {'topic': [], 'progression': []}
+        self.by_key = {}
+        self.postings = defaultdict(set)
+        for position, topic in enumerate(topics):
+            self._add('topic', topic, TOPIC_FIELDS, position)
+        for position, progression in enumerate(progressions):
+            self._add('progression', progression, PROGRESSION_FIELDS, position)
+
+        from .retrieval import BM25Index
+        self.bm25 = {
+            kind: BM25Index([(doc.obj, doc.fields) for doc in docs])
+            for kind, docs in self.docs.items()
+        }
+
+    def _add(self, kind, obj, field_spec, position):
+        fields = tuple(
+            (normalize(getattr(obj, name)), weight) for name, weight in field_spec
+        )
+        doc = _Document((kind, obj.pk), obj, fields, position)
+        self.docs[kind].append(doc)
+        self.by_key[doc.key] = doc
+        for text, _ in fields:
+            for token in text.split():
+                for gram in _grams(token, 2) | _grams(token, 3):
+                    self.postings[gram].add(doc.key)
+
+    def _candidates(self, kind, word):
+        """Documents of ``kind`` that contain ``word`` as a substring."""
+        keys = None
+        if len(word) >= 2:
+            # Every bigram/trigram of the word must be posted for the doc;
+            # the substring check below then removes false positives.
+            for gram in _grams(word, min(len(word), 3)):
+                posting = self.postings.get(gram, set())
+                keys = posting if keys is None else keys & posting
+                if not keys:
+                    return []
+            docs = [self.by_key[key] for key in keys if key[0] == kind]
+        else:
+            docs = self.docs[kind]
+        return [doc for doc in docs if any(word in text for text, _ in doc.fields)]
+
+    def search(self, kind, words, match_all=True):
+        """Return [(obj, score)] ranked by field-weighted, idf-scaled hits.
+
+        The objects are shared by every request; copy before annotating.
+        """
+        words = list(dict.fromkeys(words))
+        total = len(self.docs[kind]) or 1
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for word in words:
+            candidates = self._candidates(kind, word)
+            if not candidates:
+                continue
+            idf = math.log(1 + total / len(candidates))
+            for doc in candidates:
+                hits = sum(
+                    weight * min(text.count(word), MAX_FIELD_HITS)
+                    for text, weight in doc.fields
+                )
+                scores[doc.key] += idf * hits
+                matched[doc.key] += 1
+
+        required = len(words) if match_all else 1
+        ranked = sorted(
+            (self.by_key[key] for key, count in matched.items() if count >= required),
+            key=lambda doc: (-scores[doc.key], doc.position),
+        )
+        return [(doc.obj, scores[doc.key]) for doc in ranked]
+
+    def all(self, kind):
+        return [doc.obj for doc in self.docs[kind]]
+
+
+def build_index():
+    from .models import Topic, ChordProgression
+
+    return TheoryIndex(list(Topic.objects.all()), list(ChordProgression.objects.all()))
+
+
+def _shared_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def get_index():
+    """Return the current index, rebuilding it if the corpus changed."""
+    now = time.monotonic()
+    index = _state['index']
+    if index is not None and now - _state['checked_at'] < CHECK_INTERVAL:
+        return index
+
+    version = _shared_version()
+    with _lock:
+        if _state['index'] is None or _state['version'] != version:
+            _state['index'] = build_index()
+            _state['version'] = version
+        _state['checked_at'] = now
+        return _state['index']
+
+
+def invalidate():
+    """Drop this process's index and tell other workers to rebuild theirs."""
+    with _lock:
+        _state['index'] = None
+    counters.incr(VERSION_KEY, timeout=VERSION_TTL)
+
+
+def search_topics(q, category='', limit=None, match_all=True):
+    """Topics matching ``q`` (all words by default), best first.
+
+    With an empty query every topic is returned in the model's ordering.
+    """
+    index = get_index()
+    words = query_words(q)
+    if words:
+        topics = [t for t, _ in index.search('topic', words, match_all=match_all)]
+    else:
+        topics = index.all('topic')
+    if category:
+        topics = [t for t in topics if t.category == category]
+    if limit is not None:
+        topics = topics[:limit]
+    # Copies, so callers can annotate results without touching shared state.
+    return [copy.copy(t) for t in topics]
+
+
+def search_progressions(q, limit=None, match_all=True):
+    words = query_words(q)
+    if not words:
+        return []
+    ranked = get_index().search('progression', words, match_all=match_all)
+    if limit is not None:
+        ranked = ranked[:limit]
+    return [copy.copy(p) for p, _ in ranked]
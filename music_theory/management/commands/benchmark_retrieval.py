@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from music_theory.chatbot import retrieve_relevant_context
+from music_theory.corpus import get_index
+from music_theory.models import ChordProgression, Topic
+from music_theory.retrieval_eval import EVAL_CASES, evaluate
+
+
+def legacy_retrieve(query):
+    """The previous whitespace-keyword / icontains retrieval, for comparison."""
+    stop_words = {
+        'の', 'に', 'は', 'を', 'が', 'で', 'と', 'も', 'から', 'まで',
+        'より', 'な', 'だ', 'です', 'ます', 'た', 'て', 'して', 'する',
+        'ある', 'いる', 'ない', 'この', 'その', 'あの', 'どの',
+        'what', 'how', 'the', 'is', 'a', 'an', 'in', 'of', 'to',
+        '教えて', 'ください', 'について', 'とは', '知りたい', 'したい',
+    }
+    words = query.replace('　', ' ').split()
+    keywords = [w for w in words if w not in stop_words and len(w) > 1] or [query]
+
+    topic_q = Q()
+    prog_q = Q()
+    for kw in keywords:
+        topic_q |= (
+            Q(title__icontains=kw) | Q(tags__icontains=kw)
+            | Q(summary__icontains=kw) | Q(body__icontains=kw)
+        )
+        prog_q |= (
+            Q(name__icontains=kw) | Q(degrees__icontains=kw)
+            | Q(tags__icontains=kw) | Q(description__icontains=kw)
+        )
+    topics = list(Topic.objects.filter(topic_q).distinct()[:3])
+    progressions = list(ChordProgression.objects.filter(prog_q).distinct()[:3])
+    return topics, progressions
+
+
+class Command(BaseCommand):
+    help = 'チャットボット検索（RAG）の精度と速度を旧実装と比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='1問あたりの計測回数')
+        parser.add_argument('--show-misses', action='store_true', help='外れた質問を表示')
+
+    def handle(self, *args, **options):
+        if not Topic.objects.exists():
+            raise CommandError('トピックがありません。先に seed_music_theory / seed_progressions を実行してください')
+
+        get_index()  # build outside the timed section
+        rows = [
+            ('legacy', evaluate(legacy_retrieve, repeat=options['repeat'])),
+            ('bm25', evaluate(retrieve_relevant_context, repeat=options['repeat'])),
+        ]
+
+        self.stdout.write(f'評価セット: {len(EVAL_CASES)}問 / 計測 {options["repeat"]}回ずつ')
+        self.stdout.write(f'{"engine":<8} {"hit@k":>7} {"mean ms":>9} {"p95 ms":>9}')
+        for name, result in rows:
+            self.stdout.write(
+                f'{name:<8} {result["hit_rate"]:>7.0%} '
+                f'{result["mean_ms"]:>9.3f} {result["p95_ms"]:>9.3f}'
+            )
+            if options['show_misses']:
+                for question in result['misses']:
+                    self.stdout.write(f'    miss: {question}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from music_theory.chatbot import reset_response_cache_stats, response_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'チャット回答キャッシュのヒット率と節約できた生成量を表示'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='表示後にカウンターをリセット')
+
+    def handle(self, *args, **options):
+        stats = response_cache_stats()
+        cacheable = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / cacheable if cacheable else 0.0
+
+        self.stdout.write(f'ヒット: {stats["hits"]}  ミス: {stats["misses"]}  対象外（会話履歴あり）: {stats["skips"]}')
+        self.stdout.write(f'ヒット率: {hit_rate:.1%}（キャッシュ対象の質問のうち）')
+        self.stdout.write(f'節約した Gemini 呼び出し: {stats["hits"]}回 / 回答 {stats["saved_chars"]}文字')
+
+        if options['reset']:
+            reset_response_cache_stats()
+            self.stdout.write(self.style.SUCCESS('カウンターをリセットしました'))
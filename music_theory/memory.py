@@ -0,0 +1,120 @@
+"""Conversation memory for the chatbot: a budgeted history plus a rolling summary.
+
+Instead of replaying the last N messages verbatim, the history sent to the
+model is packed into ``settings.CHAT_HISTORY_CHAR_BUDGET`` characters
+(Japanese text runs close to one token per character). Exchanges that no
+longer fit are folded, oldest first, into ``Conversation.summary``. The
+summary is extractive, so folding needs no extra model call.
+
+The packed state is cached per conversation, so a new turn only reads the
+messages written since the previous one.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+CACHE_TTL = 60 * 60 * 24
+# A single long answer is clipped to this many characters in the history.
+TURN_CHAR_LIMIT = 1200
+# Per-exchange excerpt lengths, and the cap on the summary as a whole.
+SUMMARY_QUESTION_CHARS = 60
+SUMMARY_ANSWER_CHARS = 100
+SUMMARY_CHAR_LIMIT = 800
+
+
+class HistoryTurn:
+    """A message as the chat backends see it (``role`` / ``content``)."""
+
+    __slots__ = ('id', 'role', 'content')
+
+    def __init__(self, id, role, content):
+        self.id = id
+        self.role = role
+        self.content = content
+
+
+def _cache_key(conversation_id):
+    return f'music_theory:memory:{conversation_id}'
+
+
+def _truncate(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def _clip(text, limit):
+    return _truncate(' '.join(text.split()), limit)
+
+
+def _summary_line(question, answer):
+    line = f'- Q: {_clip(question, SUMMARY_QUESTION_CHARS)}'
+    if answer:
+        line += f' → A: {_clip(answer, SUMMARY_ANSWER_CHARS)}'
+    return line
+
+
+def _append_summary(summary, lines):
+    """Add ``lines`` to ``summary``, dropping the oldest lines over the cap."""
+    kept = [line for line in summary.split('\n') if line] + lines
+    while len(kept) > 1 and len('\n'.join(kept)) > SUMMARY_CHAR_LIMIT:
+        kept.pop(0)
+    return '\n'.join(kept)
+
+
+def _size(turns):
+    return sum(len(turn.content) for turn in turns)
+
+
+def _fold(turns, budget):
+    """Fold the oldest exchanges of ``turns`` until the rest fits ``budget``.
+
+    Returns (summary lines, kept turns, id of the last folded message).
+    Whole exchanges (a question and its answer) are folded together so the
+    kept history still starts with a user turn.
+    """
+    lines = []
+    folded_until = None
+    while len(turns) > 1 and _size(turns) > budget:
+        question = turns.pop(0)
+        answer = turns.pop(0) if turns and turns[0].role == 'assistant' else None
+        lines.append(_summary_line(question.content, answer.content if answer else ''))
+        folded_until = (answer or question).id
+    return lines, turns, folded_until
+
+
+def load_history(conversation, exclude_id=None):
+    """Return (history turns, summary) for the next prompt of ``conversation``.
+
+    Reads only messages newer than the cached state. When turns are folded,
+    the summary is saved on ``conversation`` (and the instance updated, so a
+    later ``save()`` keeps it).
+    """
+    from .models import Conversation
+
+    key = _cache_key(conversation.pk)
+    state = cache.get(key)
+    if state is None or state['summarized_until'] != conversation.summarized_until:
+        state = {
+            'summarized_until': conversation.summarized_until,
+            'last_id': conversation.summarized_until,
+            'turns': [],
+        }
+
+    turns = [HistoryTurn(*row) for row in state['turns']]
+    new_rows = conversation.messages.filter(id__gt=state['last_id']).order_by('id')
+    if exclude_id is not None:
+        new_rows = new_rows.exclude(id=exclude_id)
+    for id, role, content in new_rows.values_list('id', 'role', 'content'):
+        turns.append(HistoryTurn(id, role, _truncate(content, TURN_CHAR_LIMIT)))
+        state['last_id'] = id
+
+    lines, turns, folded_until = _fold(turns, settings.CHAT_HISTORY_CHAR_BUDGET)
+    if lines:
+        conversation.summary = _append_summary(conversation.summary, lines)
+        conversation.summarized_until = folded_until
+        Conversation.objects.filter(pk=conversation.pk).update(
+            summary=conversation.summary, summarized_until=conversation.summarized_until,
+        )
+        state['summarized_until'] = conversation.summarized_until
+
+    state['turns'] = [(turn.id, turn.role, turn.content) for turn in turns]
+    cache.set(key, state, CACHE_TTL)
+    return turns, conversation.summary
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_theory', '0006_delete_topicprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summarized_until',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='要約済みメッセージID'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, verbose_name='要約'),
+        ),
+    ]
@@ -98,6 +98,9 @@ class Conversation(models.Model):
         related_name='chat_conversations'
     )
     title = models.CharField('タイトル', max_length=200, default='新しい会話')
+    # Rolling summary of turns that no longer fit the history budget (memory.py)
+    summary = models.TextField('要約', blank=True)
+    summarized_until = models.PositiveBigIntegerField('要約済みメッセージID', default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
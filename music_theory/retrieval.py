@@ -0,0 +1,94 @@
+"""BM25 ranking over the theory corpus for the chatbot's retrieval step.
+
+Japanese questions have no spaces, so text is split where the script
+changes (kanji / katakana / hiragana / Latin). Kanji and katakana runs
+become character bigrams; hiragana runs are mostly particles and okurigana
+and are dropped; Latin words and degree names (IIm7, VIm...) stay whole.
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from .corpus import normalize
+
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(
+    r'(?P<kanji>[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3005\u3006]+)'
+    r'|(?P<katakana>[\u30a1-\u30fa\u30fc-\u30ff\u31f0-\u31ff]+)'
+    r'|(?P<hiragana>[\u3041-\u309f]+)'
+    r'|(?P<word>[^\W_\u3000-\u9fff\uf900-\ufaff]+)'
+)
+
+
+def tokenize(text):
+    """Return BM25 terms for ``text`` (order kept, duplicates included)."""
+    terms = []
+    for match in _TOKEN_RE.finditer(normalize(text)):
+        script = match.lastgroup
+        run = match.group()
+        if script == 'hiragana':
+            continue
+        if script == 'word' or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class BM25Index:
+    """Precomputed BM25 postings: term -> [(doc position, term weight)].
+
+    Field weights scale term frequency and document length (BM25F-style),
+    so a title hit counts for more than a body hit. Query time is a sum of
+    precomputed weights over the query's postings.
+    """
+
+    def __init__(self, docs, k1=K1, b=B):
+        # docs: [(obj, ((text, weight), ...)), ...]
+        self.objects = [obj for obj, _ in docs]
+        frequencies = []
+        lengths = []
+        for _, fields in docs:
+            tf = Counter()
+            length = 0.0
+            for text, weight in fields:
+                terms = tokenize(text)
+                length += weight * len(terms)
+                for term in terms:
+                    tf[term] += weight
+            frequencies.append(tf)
+            lengths.append(length)
+
+        total = len(docs)
+        avg_length = (sum(lengths) / total) if total else 1.0
+        df = Counter(term for tf in frequencies for term in tf)
+
+        self.postings = defaultdict(list)
+        for position, (tf, length) in enumerate(zip(frequencies, lengths)):
+            norm = k1 * (1 - b + b * length / (avg_length or 1.0))
+            for term, freq in tf.items():
+                idf = math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5))
+                self.postings[term].append((position, idf * freq * (k1 + 1) / (freq + norm)))
+
+    def top_k(self, terms, k):
+        """Return the best ``k`` [(obj, score)] for the query terms."""
+        scores = defaultdict(float)
+        for term in set(terms):
+            for position, weight in self.postings.get(term, ()):
+                scores[position] += weight
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.objects[position], score) for position, score in best]
+
+
+def rank(kind, query, k):
+    """Top ``k`` (obj, score) of ``kind`` ('topic' / 'progression') for a question."""
+    import copy
+    from .corpus import get_index
+
+    terms = tokenize(query)
+    if not terms:
+        return []
+    return [(copy.copy(obj), score) for obj, score in get_index().bm25[kind].top_k(terms, k)]
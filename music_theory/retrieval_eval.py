@@ -0,0 +1,77 @@
+"""Question -> expected-slug pairs for the chatbot retrieval step.
+
+Slugs refer to the seed data (seed_music_theory / seed_progressions). A case
+counts as a hit when any expected slug is among the retrieved rows; cases
+may name topics, progressions or both.
+"""
+import time
+
+EVAL_CASES = [
+    {'q': 'ドミナントモーションってどういう意味ですか？', 'topics': ['two-five-one', 'secondary-dominant']},
+    {'q': 'サビでよく使われる王道進行を教えて', 'topics': ['oudou-progression'], 'progressions': ['oudou', 'reverse-oudou']},
+    {'q': 'マイナーペンタトニックでギターソロを弾きたい', 'topics': ['pentatonic-scale']},
+    {'q': '小室哲哉っぽい切ないコード進行は？', 'topics': ['komuro-progression'], 'progressions': ['komuro']},
+    {'q': 'パワーコードの押さえ方がわからない', 'topics': ['power-chord']},
+    {'q': 'オンコードってなに？', 'topics': ['slash-chord']},
+    {'q': 'テンションノートの9thや13thの使い方', 'topics': ['tension-chords']},
+    {'q': '教会旋法のドリアンについて知りたい', 'topics': ['church-modes']},
+    {'q': '転調するときのピボットコードの使い方', 'topics': ['key-modulation']},
+    {'q': '裏拍を強調するリズムの名前は？', 'topics': ['syncopation']},
+    {'q': 'ハネるリズムのシャッフルとは', 'topics': ['shuffle-swing']},
+    {'q': '12小節ブルースの構成を教えてください', 'topics': ['blues-form']},
+    {'q': 'AメロとBメロとサビの構成について', 'topics': ['jpop-structure']},
+    {'q': '五度圏と調号の関係は？', 'topics': ['key-signature']},
+    {'q': 'メジャーセブンスとマイナーセブンスの違い', 'topics': ['seventh-chords']},
+    {'q': 'トライトーンってどんな音程？', 'topics': ['perfect-intervals']},
+    {'q': '借用和音でおしゃれにしたい', 'topics': ['modal-interchange']},
+    {'q': 'ハーモニックマイナースケールの構成音', 'topics': ['minor-scale']},
+    {'q': 'パッヘルベルのカノンのコード進行', 'topics': ['canon-progression'], 'progressions': ['canon', 'canon-extended']},
+    {'q': '丸の内サディスティックの進行が知りたい', 'progressions': ['marusa']},
+    {'q': 'ジャズのツーファイブワンを練習したい', 'topics': ['two-five-one'], 'progressions': ['two-five-one']},
+    {'q': 'ディグリーネームでダイアトニックコードを覚えるには', 'topics': ['diatonic-chords']},
+    {'q': '4分の4拍子と6/8拍子の違い', 'topics': ['time-signature']},
+    {'q': 'ソナタ形式の展開部とは', 'topics': ['sonata-form']},
+    {'q': '三和音のディミニッシュとオーギュメント', 'topics': ['triad']},
+    {'q': '裏コードの使い方', 'progressions': ['tritone-sub']},
+    {'q': 'サブドミナントマイナーの切ない響きを出したい', 'topics': ['modal-interchange'], 'progressions': ['iv-ivm-i', 'i-ivm-i', 'i-i7-iv-ivm']},
+    {'q': 'Just The Two Of Us進行みたいなシティポップ', 'progressions': ['just-the-two-of-us']},
+    {'q': 'セカンダリードミナントのV7/Vとは', 'topics': ['secondary-dominant']},
+    {'q': '度数の数え方がわからない', 'topics': ['interval-basics']},
+]
+
+
+def _case_hit(case, topics, progressions):
+    expected_topics = set(case.get('topics', ()))
+    expected_progressions = set(case.get('progressions', ()))
+    return bool(
+        expected_topics & {t.slug for t in topics}
+        or expected_progressions & {p.slug for p in progressions}
+    )
+
+
+def evaluate(retrieve, cases=EVAL_CASES, repeat=1):
+    """Run ``retrieve(question) -> (topics, progressions)`` over the cases.
+
+    Returns hit rate, the missed questions and per-call latency in ms.
+    """
+    hits = 0
+    misses = []
+    timings = []
+    for case in cases:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            topics, progressions = retrieve(case['q'])
+            timings.append((time.perf_counter() - started) * 1000)
+        if _case_hit(case, topics, progressions):
+            hits += 1
+        else:
+            misses.append(case['q'])
+
+    timings.sort()
+    return {
+        'cases': len(cases),
+        'hit_rate': hits / len(cases) if cases else 0.0,
+        'misses': misses,
+        'mean_ms': sum(timings) / len(timings) if timings else 0.0,
+        'p95_ms': timings[int(len(timings) * 0.95) - 1] if timings else 0.0,
+    }
@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .corpus import invalidate
+
+CORPUS_MODELS = ('music_theory.Topic', 'music_theory.ChordProgression')
+
+
+def _corpus_changed(sender, **kwargs):
+    # After commit, so no worker rebuilds from rows that may still roll back.
+    transaction.on_commit(invalidate)
+
+
+for _label in CORPUS_MODELS:
+    post_save.connect(_corpus_changed, sender=_label, dispatch_uid=f'corpus_post_save_{_label}')
+    post_delete.connect(_corpus_changed, sender=_label, dispatch_uid=f'corpus_post_delete_{_label}')
@@ -1,3 +1,412 @@
-from django.test import TestCase
+import json
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+
+from . import corpus
+from .chatbot import (
+    CONTEXT_CHAR_BUDGET, format_context_for_prompt, normalize_question, response_cache,
+    response_cache_stats, retrieve_relevant_context,
+)
+from .models import ChordProgression, Conversation, Message, Topic
+from .retrieval import tokenize
+from .retrieval_eval import evaluate
+
+User = get_user_model()
+
+
+class TheoryCorpusIndexTests(TestCase):
+    def setUp(self):
+        self._topic('ドミナントモーション', 'dominant-motion', body='V7からIへの解決')
+        self._topic('カノン進行', 'canon', tags='王道,パッヘルベル', body='ドミナントを含む定番')
+        self._topic('ペンタトニック', 'pentatonic', summary='5音の音階')
+        ChordProgression.objects.create(
+            name='王道進行', slug='royal-road', starting_chord='IV',
+            degrees='IV-V-IIIm-VIm', chords_in_c='F→G→Em→Am',
+        )
+        corpus.invalidate()
+
+    def _topic(self, title, slug, summary='概要', body='本文', tags=''):
+        return Topic.objects.create(
+            title=title, slug=slug, category='chord', summary=summary, body=body, tags=tags,
+        )
+
+    def test_title_hits_outrank_body_hits(self):
+        titles = [t.title for t in corpus.search_topics('ドミナント')]
+        self.assertEqual(titles, ['ドミナントモーション', 'カノン進行'])
+
+    def test_lookup_does_not_query_database(self):
+        corpus.get_index()
+        with CaptureQueriesContext(connection) as ctx:
+            corpus.search_topics('ペンタ')
+            corpus.search_progressions('iiim')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_match_all_and_match_any(self):
+        self.assertEqual(corpus.search_topics('ドミナント 王道'), [t for t in corpus.search_topics('カノン')])
+        self.assertEqual(len(corpus.search_topics('ドミナント 王道', match_all=False)), 2)
+
+    def test_rebuilt_after_topic_change(self):
+        self.assertEqual(corpus.search_topics('ブルース'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self._topic('ブルース進行', 'blues')
+        self.assertEqual([t.slug for t in corpus.search_topics('ブルース')], ['blues'])
+
+    def test_views_and_chatbot_use_index(self):
+        response = self.client.get(reverse('music_theory:topic_list'), {'q': 'パッヘルベル'})
+        self.assertEqual([t.slug for t in response.context['topics']], ['canon'])
+
+        topics, progressions = retrieve_relevant_context('王道 進行')
+        self.assertEqual([t.slug for t in topics], ['canon'])
+        self.assertEqual([p.slug for p in progressions], ['royal-road'])
+
+
+class ChatbotRetrievalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_music_theory', stdout=StringIO())
+        call_command('seed_progressions', stdout=StringIO())
+
+    def setUp(self):
+        corpus.invalidate()
+
+    def test_tokenizer_splits_unspaced_japanese(self):
+        self.assertEqual(
+            tokenize('サビでよく使われる王道進行を教えて'),
+            ['サビ', '使', '王道', '道進', '進行', '教'],
+        )
+        self.assertEqual(tokenize('IIm7 → V7'), ['iim7', 'v7'])
+
+    def test_evaluation_set_hit_rate(self):
+        result = evaluate(retrieve_relevant_context)
+        self.assertGreaterEqual(result['hit_rate'], 0.9, result['misses'])
+
+    def test_context_stays_within_budget(self):
+        topics, progressions = retrieve_relevant_context('カノン進行と王道進行と小室進行の違い')
+        self.assertTrue(topics or progressions)
+        context = format_context_for_prompt(topics, progressions)
+        self.assertLessEqual(len(context), CONTEXT_CHAR_BUDGET + 40)
+
+
+@override_settings(LLM_BACKEND='dashboard.llm.FakeBackend')
+class ChatStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.user = User.objects.create_user('chat', 'chat@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def _events(self, chunks):
+        events = []
+        for raw in b''.join(chunks).decode().split('\n\n'):
+            if not raw:
+                continue
+            name, data = raw.split('\n', 1)
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_stream_sends_tokens_then_persists_answer(self):
+        response = self.client.post(reverse('music_theory:chat_send'), {'message': 'カノン進行とは', 'stream': '1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = self._events(response.streaming_content)
+        self.assertEqual([name for name, _ in events], ['start', 'token', 'token', 'token', 'done'])
+        self.assertEqual(''.join(data['text'] for name, data in events if name == 'token'), 'これはテスト用の回答です。')
+        done = events[-1][1]
+        self.assertIsInstance(done['ttft_ms'], int)
+
+        answer = Message.objects.get(pk=done['message_id'])
+        self.assertEqual(answer.role, 'assistant')
+        self.assertEqual(answer.content, 'これはテスト用の回答です。')
+        self.assertEqual(answer.conversation_id, events[0][1]['conversation_id'])
+
+    def test_disconnect_keeps_partial_answer(self):
+        response = self.client.post(reverse('music_theory:chat_send'), {'message': '質問', 'stream': '1'})
+        stream = iter(response.streaming_content)
+        next(stream)  # start
+        next(stream)  # first token
+        response.close()
+        self.assertEqual(Message.objects.get(role='assistant').content, 'これは')
+
+    def test_validation_error_is_an_sse_event(self):
+        response = self.client.post(reverse('music_theory:chat_send'), {'message': '', 'stream': '1'})
+        events = self._events(response.streaming_content)
+        self.assertEqual(events[0][0], 'error')
+        self.assertFalse(Message.objects.exists())
+
+    def test_non_streaming_request_still_returns_html(self):
+        response = self.client.post(reverse('music_theory:chat_send'), {'message': '質問'})
+        self.assertContains(response, 'これはテスト用の回答です。')
+        self.assertIn('chatConversationId', response['HX-Trigger'])
+
+    def test_open_circuit_has_its_own_message(self):
+        from dashboard.llm import LLMCircuitOpen, LLMUnavailable
+        from .chatbot import ERROR_CIRCUIT_OPEN, ERROR_UNAVAILABLE, _error_message
+
+        self.assertEqual(_error_message(LLMCircuitOpen('circuit open')), ERROR_CIRCUIT_OPEN)
+        self.assertEqual(_error_message(LLMUnavailable('no library')), ERROR_UNAVAILABLE)
+
+
+@override_settings(LLM_BACKEND='dashboard.llm.FakeBackend')
+class AsyncChatSendTests(TestCase):
+    """achat_send is the ASGI variant of chat_send (DJANGO_ASYNC_VIEWS=1)."""
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.user = User.objects.create_user('achat', 'achat@example.com', 'pw')
+
+    def _request(self, data):
+        from django.test import AsyncRequestFactory
+
+        request = AsyncRequestFactory().post(reverse('music_theory:chat_send'), data)
+        request.user = self.user
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        return request
+
+    async def test_stream_persists_answer(self):
+        from .views import achat_send
+
+        response = await achat_send(self._request({'message': 'カノン進行とは', 'stream': '1'}))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: done', body)
+
+        answer = await Message.objects.filter(role='assistant').aget()
+        self.assertEqual(answer.content, 'これはテスト用の回答です。')
+
+    async def test_non_streaming_returns_html(self):
+        from .views import achat_send
+
+        response = await achat_send(self._request({'message': '質問'}))
+        self.assertContains(response, 'これはテスト用の回答です。')
+
+    def _flight_key(self, message):
+        import hashlib
+
+        return f'chat:{self.user.pk}:new:{hashlib.sha1(message.encode()).hexdigest()[:16]}'
+
+    async def test_duplicate_send_waits_for_the_in_flight_answer(self):
+        import asyncio
+        from dashboard import singleflight
+        from .views import achat_send
+
+        conversation = await Conversation.objects.acreate(user=self.user, title='質問')
+        user_msg = await conversation.messages.acreate(role='user', content='質問')
+        answer = await conversation.messages.acreate(role='assistant', content='先の回答')
+        leader = await singleflight.abegin(self._flight_key('質問'))
+        self.assertTrue(leader.leader)
+
+        async def finish_later():
+            await asyncio.sleep(0.3)
+            await leader.afinish({'user_msg': user_msg.id, 'assistant_msg': answer.id})
+
+        finishing = asyncio.ensure_future(finish_later())
+        response = await achat_send(self._request({'message': '質問'}))
+        await finishing
+        self.assertContains(response, '先の回答')
+        self.assertEqual(await Message.objects.acount(), 2)
+
+    async def test_duplicate_send_takes_over_from_a_dead_request(self):
+        from dashboard import singleflight
+        from .views import achat_send
+
+        # The original request died holding its claim; the claim lapses.
+        await singleflight.abegin(self._flight_key('質問'), 0.3)
+        response = await achat_send(self._request({'message': '質問'}))
+        self.assertContains(response, 'これはテスト用の回答です。')
+
+
+@override_settings(
+    LLM_BACKEND='dashboard.llm.FakeBackend',
+    RATE_LIMITS={'chat': {'user': (2, 60), 'global': (3, 86400)}},
+)
+class ChatRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.user = User.objects.create_user('limited', 'limited@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def _send(self, client=None):
+        return (client or self.client).post(reverse('music_theory:chat_send'), {'message': '質問'})
+
+    def test_per_user_quota_and_headers(self):
+        first = self._send()
+        self.assertEqual(first['X-RateLimit-Remaining'], '1')
+        self._send()
+        denied = self._send()
+        self.assertContains(denied, '送信が速すぎます')
+        self.assertEqual(denied['X-RateLimit-Remaining'], '0')
+        self.assertIn('Retry-After', denied)
+        self.assertEqual(Message.objects.filter(role='user').count(), 2)
+
+    def test_global_quota_spans_users(self):
+        self._send()
+        self._send()
+        other = self.client_class()
+        other.force_login(User.objects.create_user('other', 'other@example.com', 'pw'))
+        self.assertNotContains(self._send(other), '利用上限')
+        self.assertContains(self._send(other), '本日のチャット利用上限')
+
+    def test_send_does_not_count_message_table(self):
+        self._send()
+        with CaptureQueriesContext(connection) as ctx:
+            self._send()
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()])
+
+
+@override_settings(CHAT_HISTORY_CHAR_BUDGET=300)
+class ConversationMemoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('memory', 'memory@example.com', 'pw')
+        self.conversation = Conversation.objects.create(user=user)
+
+    def _exchange(self, n):
+        self.conversation.messages.create(role='user', content=f'質問{n}')
+        self.conversation.messages.create(role='assistant', content=f'回答{n}' + 'あ' * 100)
+
+    def test_history_fits_budget_and_older_turns_are_summarized(self):
+        from .memory import load_history
+
+        for n in range(6):
+            self._exchange(n)
+        history, summary = load_history(self.conversation)
+
+        self.assertLessEqual(sum(len(turn.content) for turn in history), 300)
+        self.assertEqual(history[0].role, 'user')
+        self.assertEqual(history[-1].content[:3], '回答5')
+        self.assertIn('質問0', summary)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, summary)
+
+    def test_next_turn_reads_only_new_messages(self):
+        from .memory import load_history
+
+        self._exchange(0)
+        load_history(self.conversation)
+        self._exchange(1)
+        with CaptureQueriesContext(connection) as ctx:
+            history, _ = load_history(self.conversation)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual([turn.content[:3] for turn in history], ['質問0', '回答0', '質問1', '回答1'])
+
+
+@override_settings(LLM_BACKEND='dashboard.llm.FakeBackend')
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def _send(self, message, conversation_id=''):
+        return self.client.post(reverse('music_theory:chat_send'), {
+            'message': message, 'conversation_id': conversation_id,
+        })
+
+    def test_question_normalization(self):
+        self.assertEqual(normalize_question('カノン進行とは？'), normalize_question('カノン進行について教えてください'))
+        self.assertEqual(normalize_question('ＣＭａｊ７って何ですか'), 'cmaj7')
+        self.assertNotEqual(normalize_question('王道進行とは'), normalize_question('小室進行とは'))
+
+    def test_near_duplicate_question_is_served_from_cache(self):
+        self._send('カノン進行とは')
+        response = self._send('カノン進行について教えて')
+        self.assertContains(response, 'これはテスト用の回答です。')
+        self.assertEqual(response_cache_stats()['hits'], 1)
+        self.assertEqual(response_cache_stats()['misses'], 1)
+
+    def test_follow_up_in_a_conversation_skips_cache(self):
+        first = self._send('カノン進行とは')
+        conversation_id = Message.objects.get(role='user').conversation_id
+        self._send('カノン進行とは', conversation_id=conversation_id)
+        self.assertEqual(response_cache_stats()['skips'], 1)
+        self.assertEqual(response_cache_stats()['hits'], 0)
+        self.assertEqual(first.status_code, 200)
+
+    def test_stats_failures_do_not_break_the_chat(self):
+        from unittest import mock
+
+        self._send('カノン進行とは')
+        # The counter key vanishes between add() and incr() ...
+        with mock.patch.object(cache, 'incr', side_effect=ValueError):
+            self._send('カノン進行について教えて')
+        self.assertEqual(response_cache_stats()['hits'], 1)
+
+        # ... or the counter write fails outright.
+        with mock.patch('dashboard.counters.incr', side_effect=ConnectionError), \
+                mock.patch('dashboard.counters.aincr', side_effect=ConnectionError):
+            response = self._send('カノン進行について教えて')
+        self.assertContains(response, 'これはテスト用の回答です。')
+
+    def test_lru_and_ttl_eviction(self):
+        from .chatbot import ResponseCache
+
+        lru = ResponseCache(max_entries=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+
+        expired = ResponseCache(ttl=-1)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
+
+
+@override_settings(LLM_BACKEND='dashboard.llm.FakeBackend')
+class DuplicateChatSendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.user = User.objects.create_user('double', 'double@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def _flight_key(self, message):
+        import hashlib
+
+        return f'chat:{self.user.pk}:new:{hashlib.sha1(message.encode()).hexdigest()[:16]}'
+
+    def test_duplicate_send_returns_at_once_while_answering(self):
+        from dashboard import singleflight
+        from .views import ERROR_IN_FLIGHT
+
+        self.assertTrue(singleflight.begin(self._flight_key('質問')).leader)
+        response = self.client.post(reverse('music_theory:chat_send'), {'message': '質問'})
+        self.assertContains(response, ERROR_IN_FLIGHT)
+        self.assertEqual(Message.objects.count(), 0)
+
+    def test_failure_while_recording_releases_the_claim(self):
+        from unittest import mock
+        from dashboard import singleflight
+
+        with mock.patch('music_theory.views.load_history', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('music_theory:chat_send'), {'message': '質問'})
+        self.assertTrue(singleflight.begin(self._flight_key('質問')).leader)
+
+    def test_stream_closed_before_iteration_releases_the_claim(self):
+        from dashboard import singleflight
+
+        response = self.client.post(reverse('music_theory:chat_send'), {'message': '質問', 'stream': '1'})
+        response.close()
+        self.assertTrue(singleflight.begin(self._flight_key('質問')).leader)
+        self.assertFalse(Message.objects.filter(role='assistant').exists())
+
+    def test_flight_is_released_after_answer(self):
+        self.client.post(reverse('music_theory:chat_send'), {'message': '質問'})
+        self.client.post(reverse('music_theory:chat_send'), {'message': '質問'})
+        self.assertEqual(Message.objects.filter(role='assistant').count(), 2)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -8,7 +9,7 @@ urlpatterns = [
     path('bookmarks/', views.bookmark_list, name='bookmark_list'),
     path('progressions/', views.progression_list, name='progression_list'),
     path('diatonic/', views.diatonic_reference, name='diatonic_reference'),
-    path('chat/send/', views.chat_send, name='chat_send'),
+    path('chat/send/', views.achat_send if settings.ASYNC_VIEWS else views.chat_send, name='chat_send'),
     path('chat/history/', views.chat_history, name='chat_history'),
     path('chat/<int:conversation_id>/', views.chat_load, name='chat_load'),
     path('<slug:slug>/', views.topic_detail, name='topic_detail'),
@@ -1,28 +1,32 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
-from django.db.models import Q
-from django.utils import timezone
-from datetime import timedelta
 from .models import Topic, Bookmark, ChordProgression, Conversation, Message
-from .chatbot import retrieve_relevant_context, format_context_for_prompt, get_gemini_response
+from .chatbot import (
+    retrieve_relevant_context, format_context_for_prompt, get_gemini_response,
+    stream_chat_response, aget_chat_response, astream_chat_response, ERROR_GENERATION,
+)
+from .corpus import search_topics
+from .memory import load_history
+from dashboard import ratelimit, singleflight
+
+logger = logging.getLogger(__name__)
 
 
 def topic_list(request):
-    topics = Topic.objects.all()
     query = request.GET.get('q', '')
     category = request.GET.get('category', '')
-
-    if query:
-        topics = topics.filter(
-            Q(title__icontains=query) |
-            Q(summary__icontains=query) |
-            Q(tags__icontains=query) |
-            Q(body__icontains=query)
-        )
-    if category:
-        topics = topics.filter(category=category)
+    topics = search_topics(query, category=category)
 
     context = {
         'topics': topics,
@@ -92,39 +96,63 @@ def diatonic_reference(request):
     return render(request, 'music_theory/diatonic_reference.html')
 
 
-@login_required
-@require_POST
-def chat_send(request):
+RATE_LIMIT_ERRORS = {
+    'user': 'メッセージの送信が速すぎます。少し待ってから再度お試しください。',
+    'global': '本日のチャット利用上限に達しました。明日またお試しください。',
+}
+
+
+ERROR_IN_FLIGHT = 'この質問には回答中です。表示されるまでお待ちください。'
+
+# A turn's claim is refreshed while its answer streams in. It is shorter than
+# FOLLOW_TIMEOUT, so a duplicate send waiting on a request that died takes
+# over once the claim lapses instead of timing out.
+CHAT_CLAIM_TTL = settings.LLM_TIMEOUT
+FOLLOW_TIMEOUT = settings.LLM_TIMEOUT * 2
+
+
+def _chat_error(request, error):
+    return render(request, 'music_theory/_chat_error.html', {'error': error})
+
+
+def _chat_flight_key(request, conversation_id, user_message):
+    digest = hashlib.sha1(user_message.encode()).hexdigest()[:16]
+    return f'chat:{request.user.pk}:{conversation_id or "new"}:{digest}'
+
+
+def _start_chat_turn(request, join=True):
+    """Validate, rate-limit and record the user's message.
+
+    Returns (error_message, None, quota) or (None, turn, quota) where
+    ``turn`` holds what the answer generation needs. When the same message
+    is already being answered (a double-clicked send), ``turn`` is
+    ``{'follow': flight}`` instead; see _follow_chat_turn.
+    """
     user_message = request.POST.get('message', '').strip()
     conversation_id = request.POST.get('conversation_id', '').strip()
 
     if not user_message:
-        return render(request, 'music_theory/_chat_error.html', {
-            'error': 'メッセージを入力してください。'
-        })
-
-    # Rate limit: 10 messages per minute per user
-    one_minute_ago = timezone.now() - timedelta(minutes=1)
-    recent_count = Message.objects.filter(
-        conversation__user=request.user,
-        role='user',
-        created_at__gte=one_minute_ago,
-    ).count()
-    if recent_count >= 10:
-        return render(request, 'music_theory/_chat_error.html', {
-            'error': 'メッセージの送信が速すぎます。少し待ってから再度お試しください。'
-        })
-
-    # Rate limit: 1400 messages per day globally
-    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    daily_count = Message.objects.filter(
-        role='user',
-        created_at__gte=today_start,
-    ).count()
-    if daily_count >= 1400:
-        return render(request, 'music_theory/_chat_error.html', {
-            'error': '本日のチャット利用上限に達しました。明日またお試しください。'
-        })
+        return 'メッセージを入力してください。', None, None
+
+    flight = None
+    if join:
+        flight = singleflight.begin(_chat_flight_key(request, conversation_id, user_message), CHAT_CLAIM_TTL)
+        if not flight.leader:
+            return None, {'follow': flight}, None
+    try:
+        return _record_chat_turn(request, user_message, conversation_id, flight)
+    except BaseException:
+        if flight:
+            flight.fail()
+        raise
+
+
+def _record_chat_turn(request, user_message, conversation_id, flight):
+    quota = ratelimit.hit('chat', request.user.pk)
+    if not quota:
+        if flight:
+            flight.release()
+        return RATE_LIMIT_ERRORS[quota.rule], None, quota
 
     # Get or create conversation
     conversation = None
@@ -151,33 +179,300 @@ def chat_send(request):
     topics, progressions = retrieve_relevant_context(user_message)
     context_text = format_context_for_prompt(topics, progressions)
 
-    # Get conversation history (last 20 messages for context window)
-    history = list(
-        conversation.messages.exclude(id=user_msg.id).order_by('created_at')[:20]
-    )
-
-    # Call Gemini
-    response_text = get_gemini_response(history, user_message, context_text)
+    # Conversation history packed into the budget; older turns are summarized
+    history, summary = load_history(conversation, exclude_id=user_msg.id)
 
-    # Save assistant message
+    return None, {
+        'conversation': conversation,
+        'user_msg': user_msg,
+        'topics': topics,
+        'context_text': context_text,
+        'history': history,
+        'summary': summary,
+        'flight': flight,
+        'claimed_at': time.monotonic(),
+    }, quota
+
+
+def _replay_chat_turn(request, result):
+    """Turn for a duplicate send, answered by the in-flight original."""
+    if result is None:
+        # The original request died without answering; answer this one.
+        return _start_chat_turn(request, join=False)
+    user_msg = Message.objects.select_related('conversation').get(pk=result['user_msg'])
+    assistant_msg = Message.objects.get(pk=result['assistant_msg'])
+    return None, {
+        'conversation': user_msg.conversation,
+        'user_msg': user_msg,
+        'topics': list(assistant_msg.context_topics.all()),
+        'replay': assistant_msg,
+    }, None
+
+
+def _finish_chat_turn(turn, response_text):
     assistant_msg = Message.objects.create(
-        conversation=conversation, role='assistant', content=response_text
+        conversation=turn['conversation'], role='assistant', content=response_text
     )
-    if topics:
-        assistant_msg.context_topics.set(topics)
+    if turn['topics']:
+        assistant_msg.context_topics.set(turn['topics'])
 
     # Update conversation timestamp
-    conversation.save()
+    turn['conversation'].save()
+    if turn['flight']:
+        turn['flight'].finish({'user_msg': turn['user_msg'].id, 'assistant_msg': assistant_msg.id})
+    return assistant_msg
+
+
+def _abandon_chat_turn(turn):
+    # A duplicate send waiting on this turn gets the error too. Harmless
+    # once the turn has finished.
+    if turn['flight']:
+        turn['flight'].fail()
+
+
+def _claim_due(turn):
+    """Whether the turn's claim should be refreshed (every third of its TTL)."""
+    if not turn['flight'] or time.monotonic() - turn['claimed_at'] < CHAT_CLAIM_TTL / 3:
+        return False
+    turn['claimed_at'] = time.monotonic()
+    return True
+
+
+async def _await_keeping_claim(turn, awaitable):
+    """Await a non-streamed answer, refreshing the turn's claim meanwhile."""
+    task = asyncio.ensure_future(awaitable)
+    while not task.done():
+        await asyncio.wait([task], timeout=CHAT_CLAIM_TTL / 3)
+        if not task.done() and _claim_due(turn):
+            await turn['flight'].arefresh(CHAT_CLAIM_TTL)
+    return task.result()
+
+
+def _wants_stream(request):
+    return (
+        request.POST.get('stream') == '1'
+        or 'text/event-stream' in request.headers.get('Accept', '')
+    )
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
 
+
+def _start_event(turn):
+    return _sse('start', {
+        'conversation_id': turn['conversation'].id,
+        'html': render_to_string('music_theory/_chat_user_message.html', {
+            'user_message': turn['user_msg'],
+        }),
+    })
+
+
+def _done_event(turn, assistant_msg, started, first_token_at):
+    ttft_ms = round((first_token_at - started) * 1000) if first_token_at else None
+    total_ms = round((time.monotonic() - started) * 1000)
+    logger.info(
+        'chat stream conversation=%s ttft_ms=%s total_ms=%s',
+        turn['conversation'].id, ttft_ms, total_ms,
+    )
+    return _sse('done', {
+        'message_id': assistant_msg.id,
+        'ttft_ms': ttft_ms,
+        'total_ms': total_ms,
+        'html': render_to_string('music_theory/_chat_assistant_message.html', {
+            'assistant_message': assistant_msg,
+            'context_topics': turn['topics'],
+        }),
+    })
+
+
+def _error_event(error):
+    return _sse('error', {
+        'error': error,
+        'html': render_to_string('music_theory/_chat_error.html', {'error': error}),
+    })
+
+
+class _TurnEvents:
+    """SSE body of a chat turn.
+
+    Closing the response abandons the turn unless it finished, even when
+    the body was never iterated (the generator's own cleanup only runs
+    once it has started).
+    """
+
+    def __init__(self, turn, events):
+        self.turn = turn
+        self.events = events
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.events.close()
+        _abandon_chat_turn(self.turn)
+
+
+class _ATurnEvents(_TurnEvents):
+    def __aiter__(self):
+        return self.events
+
+    def close(self):
+        # Runs once the ASGI handler is done with the body.
+        _abandon_chat_turn(self.turn)
+
+
+def _event_stream_response(body):
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _chat_messages_response(request, turn, assistant_msg):
     response = render(request, 'music_theory/_chat_messages.html', {
-        'user_message': user_msg,
+        'user_message': turn['user_msg'],
         'assistant_message': assistant_msg,
-        'context_topics': topics,
+        'context_topics': turn['topics'],
     })
-    response['HX-Trigger'] = f'{{"chatConversationId": "{conversation.id}"}}'
+    response['HX-Trigger'] = f'{{"chatConversationId": "{turn["conversation"].id}"}}'
     return response
 
 
+def _chat_event_stream(turn, started):
+    """SSE body: start → token* → done. The answer is saved when it ends."""
+    parts = []
+    first_token_at = None
+    completed = False
+    try:
+        yield _start_event(turn)
+        for chunk in stream_chat_response(turn['history'], turn['user_msg'].content, turn['context_text'], turn['summary']):
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            parts.append(chunk)
+            yield _sse('token', {'text': chunk})
+            if _claim_due(turn):
+                turn['flight'].refresh(CHAT_CLAIM_TTL)
+        completed = True
+    finally:
+        if not completed and parts:
+            # Client went away mid-answer: keep what was generated so far.
+            _finish_chat_turn(turn, ''.join(parts))
+        elif not completed:
+            _abandon_chat_turn(turn)
+
+    assistant_msg = _finish_chat_turn(turn, ''.join(parts))
+    yield _done_event(turn, assistant_msg, started, first_token_at)
+
+
+async def _achat_event_stream(turn, started):
+    """Async variant of _chat_event_stream for the ASGI view."""
+    parts = []
+    first_token_at = None
+    completed = False
+    try:
+        yield _start_event(turn)
+        async for chunk in astream_chat_response(turn['history'], turn['user_msg'].content, turn['context_text'], turn['summary']):
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            parts.append(chunk)
+            yield _sse('token', {'text': chunk})
+            if _claim_due(turn):
+                await turn['flight'].arefresh(CHAT_CLAIM_TTL)
+        completed = True
+    finally:
+        if not completed and parts:
+            await sync_to_async(_finish_chat_turn)(turn, ''.join(parts))
+        elif not completed:
+            await sync_to_async(_abandon_chat_turn)(turn)
+
+    assistant_msg = await sync_to_async(_finish_chat_turn)(turn, ''.join(parts))
+    yield _done_event(turn, assistant_msg, started, first_token_at)
+
+
+def _replay_events(turn, started):
+    return [_start_event(turn), _done_event(turn, turn['replay'], started, None)]
+
+
+async def _aiter_list(items):
+    for item in items:
+        yield item
+
+
+@login_required
+@require_POST
+def chat_send(request):
+    started = time.monotonic()
+    error, turn, quota = _start_chat_turn(request)
+    if turn and 'follow' in turn:
+        # Waiting here would hold a worker thread; the original request
+        # delivers the answer.
+        error, turn = ERROR_IN_FLIGHT, None
+
+    if _wants_stream(request):
+        if error:
+            response = _event_stream_response(iter([_error_event(error)]))
+        elif 'replay' in turn:
+            response = _event_stream_response(iter(_replay_events(turn, started)))
+        else:
+            response = _event_stream_response(_TurnEvents(turn, _chat_event_stream(turn, started)))
+        return ratelimit.apply_headers(response, quota)
+
+    if error:
+        return ratelimit.apply_headers(_chat_error(request, error), quota)
+    if 'replay' in turn:
+        return _chat_messages_response(request, turn, turn['replay'])
+
+    # Call Gemini
+    try:
+        response_text = get_gemini_response(turn['history'], turn['user_msg'].content, turn['context_text'], turn['summary'])
+        assistant_msg = _finish_chat_turn(turn, response_text)
+    finally:
+        _abandon_chat_turn(turn)
+    return ratelimit.apply_headers(_chat_messages_response(request, turn, assistant_msg), quota)
+
+
+@login_required
+@require_POST
+async def achat_send(request):
+    """chat_send for ASGI: waits on Gemini without holding a thread."""
+    started = time.monotonic()
+    error, turn, quota = await sync_to_async(_start_chat_turn)(request)
+    if turn and 'follow' in turn:
+        try:
+            result = await turn['follow'].await_result(FOLLOW_TIMEOUT)
+        except singleflight.Failed:
+            error, turn, quota = ERROR_GENERATION, None, None
+        else:
+            error, turn, quota = await sync_to_async(_replay_chat_turn)(request, result)
+
+    if _wants_stream(request):
+        if error:
+            response = _event_stream_response(_aiter_list([_error_event(error)]))
+        elif 'replay' in turn:
+            events = await sync_to_async(_replay_events)(turn, started)
+            response = _event_stream_response(_aiter_list(events))
+        else:
+            response = _event_stream_response(_ATurnEvents(turn, _achat_event_stream(turn, started)))
+        return ratelimit.apply_headers(response, quota)
+
+    if error:
+        response = await sync_to_async(_chat_error)(request, error)
+        return ratelimit.apply_headers(response, quota)
+    if 'replay' in turn:
+        return await sync_to_async(_chat_messages_response)(request, turn, turn['replay'])
+
+    try:
+        response_text = await _await_keeping_claim(turn, aget_chat_response(
+            turn['history'], turn['user_msg'].content, turn['context_text'], turn['summary'],
+        ))
+        assistant_msg = await sync_to_async(_finish_chat_turn)(turn, response_text)
+    finally:
+        await sync_to_async(_abandon_chat_turn)(turn)
+    response = await sync_to_async(_chat_messages_response)(request, turn, assistant_msg)
+    return ratelimit.apply_headers(response, quota)
+
+
 @login_required
 def chat_history(request):
     conversations = Conversation.objects.filter(
@@ -1,3 +1,30 @@
 #!/usr/bin/env bash
 
-gunicorn config.wsgi --bind 0.0.0.0:${PORT:-10000} --timeout 120
+# Background loops run as their own Procfile processes (worker / push / reminders).
+# Only a single-service deployment without them sets JOB_WORKER=1 / PUSH_WORKER=1
+# to run them here; they are then restarted whenever they exit.
+supervise() {
+    while true; do
+        "$@"
+        echo "start.sh: '$*' exited with status $?; restarting in 5s" >&2
+        sleep 5
+    done
+}
+
+# Background job worker (AI advice generation, image processing)
+if [ "${JOB_WORKER:-0}" = "1" ]; then
+    supervise python manage.py run_jobs &
+fi
+
+# Push notification sender (PushOutbox) and reminder scheduler
+if [ "${PUSH_WORKER:-0}" = "1" ]; then
+    supervise python manage.py push_worker &
+    supervise python manage.py send_reminders --loop &
+fi
+
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    # uvicorn workers: LLM / Spotify calls are awaited on the event loop instead of holding a thread each
+    exec gunicorn config.asgi --bind 0.0.0.0:${PORT:-10000} --timeout 120 --worker-class uvicorn_worker.UvicornWorker
+fi
+
+exec gunicorn config.wsgi --bind 0.0.0.0:${PORT:-10000} --timeout 120 --worker-class gthread --threads ${GUNICORN_THREADS:-8}